@@ -0,0 +1,207 @@
+"""
+In process load test of every router, requests are sent straight to the ASGI app without sockets,
+so results show the cost of the app itself
+
+Places endpoints use the local redis when it is reachable, otherwise search is stubbed with fixtures.
+DNS is always stubbed, so email results do not depend on network
+
+    python -m benchmarks.load --requests 2000 --concurrency 50
+"""
+import asyncio
+import json
+import time
+import typer
+from contextlib import ExitStack
+from typing import Optional
+from unittest.mock import patch
+from urllib.parse import urlencode
+from benchmarks.report import percentiles, save
+from cache.countries import country_directory
+from cache.domains import DomainResolver
+from cache.responses import ResponseCache
+from db.indexes import RedisIndex, connection
+from main import fastapi_application
+from routers import export
+
+typer_app = typer.Typer()
+
+city: dict = {
+    "id": "city:57933:state:4026:country:101",
+    "name": "Bengaluru",
+    "state_id": "4026",
+    "state_code": "KA",
+    "state_name": "Karnataka",
+    "country_id": "101",
+    "country_code": "IN",
+    "country_name": "India",
+    "latitude": "12.97194000",
+    "longitude": "77.59369000",
+}
+india: dict = {"id": "country:101", "name": "India", "iso2": "IN", "iso3": "IND", "phone_code": "91", "currency": "INR"}
+
+phone_batch: dict = {"numbers": [{"phone_number": f"+1 234 567 {i:04d}"} for i in range(100)]}
+email_batch: dict = {"emails": [f"user{i}@example{i % 10}.com" for i in range(100)]}
+
+# name, method, path, query, json body
+SCENARIOS: list = [
+    ("phone", "GET", "/validate-phone-numbers", {"phone_number": "2345678999", "country_code": "US"}, None),
+    ("phone_enrich", "GET", "/validate-phone-numbers", {"phone_number": "+91 98765 43210", "enrich": "true"}, None),
+    ("phone_batch_100", "POST", "/validate-phone-numbers/batch", {}, phone_batch),
+    ("email", "GET", "/validate-email", {"email": "anjum@sahl.solutions"}, None),
+    ("email_batch_100", "POST", "/validate-email/batch", {}, email_batch),
+    ("country_lookup", "GET", "/country-lookup", {"query": "india", "query_type": "exact"}, None),
+    ("timezone_lookup", "GET", "/timezone-lookup", {"query": "kolkata", "query_type": "exact"}, None),
+    ("place_lookup", "GET", "/place-lookup", {"query": "bengaluru", "query_type": "exact"}, None),
+    ("place_suggest", "GET", "/place-suggest", {"query": "beng"}, None),
+    ("place_nearby", "GET", "/place-nearby", {"latitude": "12.97", "longitude": "77.59"}, None),
+    ("country_by_iso2", "GET", "/countries/IN", {}, None),
+    ("country_by_phone_code", "GET", "/countries/by-phone-code/91", {}, None),
+    ("country_by_currency", "GET", "/countries/by-currency/INR", {}, None),
+    ("places_export", "GET", "/places/export", {"country_code": "IN"}, None),
+    ("places_export_csv", "GET", "/places/export", {"country_code": "IN", "format": "csv"}, None),
+    ("phone_cache_info", "GET", "/validate-phone-numbers/cache-info", {}, None),
+    ("metrics", "GET", "/metrics", {}, None),
+    ("redis_pool_info", "GET", "/redis-pool-info", {}, None),
+    ("redis_db_info", "GET", "/redis-db-info", {}, None),
+]
+
+
+async def export_batches(
+    self, filters: dict, return_fields: Optional[list] = None, batch_size: int = 1000, max_idle: int = 300000
+):
+    """
+    Stands in for RedisIndex.export, 5000 cities in batches of batch_size
+    """
+    for start in range(0, 5000, batch_size):
+        yield [city] * min(batch_size, 5000 - start)
+
+
+async def asgi_request(app, method: str, path: str, query: dict, body: Optional[dict]) -> int:
+    payload: bytes = json.dumps(body).encode() if body is not None else b""
+    headers: list = [(b"host", b"benchmark")]
+    if body is not None:
+        headers += [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())]
+    scope: dict = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": urlencode(query).encode(),
+        "headers": headers,
+        "client": ("127.0.0.1", 50000),
+        "server": ("benchmark", 80),
+    }
+    messages: list = [{"type": "http.request", "body": payload, "more_body": False}]
+    status: list = []
+
+    async def receive() -> dict:
+        if messages:
+            return messages.pop()
+        # Client stays connected until response is complete
+        await asyncio.Event().wait()
+
+    async def send(message: dict) -> None:
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    await app(scope, receive, send)
+    return status[0] if status else 0
+
+
+async def run_scenario(app, scenario: tuple, requests: int, concurrency: int) -> dict:
+    _, method, path, query, body = scenario
+    timings: list = []
+    statuses: dict = {}
+    remaining: list = [requests]
+
+    async def worker() -> None:
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            start: float = time.perf_counter()
+            try:
+                status: int = await asgi_request(app, method, path, query, body)
+            except Exception:
+                status = 0
+            timings.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start: float = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed: float = time.perf_counter() - start
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "rps": int(requests / elapsed),
+        **percentiles(timings),
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+    }
+
+
+async def redis_reachable() -> bool:
+    try:
+        return await asyncio.wait_for(connection.ping(), 1)
+    except Exception:
+        return False
+
+
+def stubs(use_redis: bool) -> ExitStack:
+    """
+    DNS answers are always stubbed, redis search only when there is no local redis
+    """
+    stack: ExitStack = ExitStack()
+    stack.enter_context(
+        patch.object(DomainResolver, "resolve", return_value=(DomainResolver.deliverable(), 300))
+    )
+    if not use_redis:
+        stack.enter_context(patch.object(RedisIndex, "search", return_value={"total": 1, "duration": 1, "records": [city]}))
+        stack.enter_context(patch.object(RedisIndex, "suggest", return_value={"total": 1, "records": [{"id": city["id"], "name": "Bengaluru", "score": 1.0}]}))
+        stack.enter_context(patch.object(RedisIndex, "nearby", return_value={"total": 1, "records": [city | {"distance_km": 0.4}]}))
+        stack.enter_context(patch.object(RedisIndex, "export", export_batches))
+        stack.enter_context(patch.object(ResponseCache, "revision", return_value="benchmark"))
+        stack.enter_context(patch.object(country_directory, "refresh", return_value=False))
+        country_directory.load([india], "benchmark")
+    return stack
+
+
+@typer_app.command()
+def main(
+    requests: int = typer.Option(2000, help="Requests per scenario"),
+    concurrency: int = typer.Option(50, help="Requests in flight at the same time"),
+    only: Optional[str] = typer.Option(None, help="Run one scenario, e.g. place_lookup"),
+    output: Optional[str] = typer.Option(None, help="Json file, benchmarks/results/load-<commit>.json by default"),
+):
+    async def run() -> dict:
+        use_redis: bool = await redis_reachable()
+        results: dict = {"redis": "local" if use_redis else "stubbed", "scenarios": {}}
+        # Exports over the per worker cap would only measure 429 responses
+        with stubs(use_redis), patch.object(export, "export_max_concurrent", concurrency):
+            await fastapi_application.router.startup()
+            try:
+                for scenario in SCENARIOS:
+                    name: str = scenario[0]
+                    # Everything except dbinfo can run on stubs
+                    if (only and name != only) or (name == "redis_db_info" and not use_redis):
+                        continue
+                    # Warm caches and lazy imports before measuring
+                    await run_scenario(fastapi_application, scenario, min(requests, 50), 1)
+                    r: dict = await run_scenario(fastapi_application, scenario, requests, concurrency)
+                    results["scenarios"][name] = r
+                    typer.echo(
+                        f"{name:<20} {r['rps']:>8} rps  p50 {r['p50_ms']:>8} ms  p95 {r['p95_ms']:>8} ms  "
+                        f"p99 {r['p99_ms']:>8} ms  {r['statuses']}"
+                    )
+            finally:
+                await fastapi_application.router.shutdown()
+        return results
+
+    results: dict = asyncio.run(run())
+    typer.echo(f"\nRedis: {results['redis']}. Saved to {save('load', results, output)}")
+
+
+if __name__ == "__main__":
+    typer_app()
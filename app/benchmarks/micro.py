@@ -0,0 +1,131 @@
+"""
+Microbenchmarks of hot code paths that do not need redis or network
+
+    python -m benchmarks.micro
+    python -m benchmarks.micro --only phone
+"""
+import io
+import os
+import timeit
+import typer
+from typing import Callable, Optional
+from benchmarks.report import save
+from db.async_db import ManageCountries, ManageTimezones
+from db.indexes import CityIndex
+from db.memory import MemoryIndex
+from models import CitySearch, CountrySearch, EmailDomainCheck, FastSerializer
+from routers.phonenumber import cached_format_phone_number, format_phone_number, phone_cache
+
+downloads_dir: str = os.path.join(os.path.dirname(__file__), "..", "downloads", "")
+
+typer_app = typer.Typer()
+
+
+def measure(fn: Callable, repeat: int = 5) -> dict:
+    """
+    Runs fn in batches of about 0.2 seconds, best batch is reported to reduce noise
+    """
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    best: float = min(timer.repeat(repeat=repeat, number=number)) / number
+    return {"us_per_op": round(best * 1e6, 3), "ops_per_second": int(1 / best), "loops": number}
+
+
+def run_sync(coroutine):
+    """
+    Runs a coroutine that never suspends without the overhead of an event loop
+    """
+    try:
+        coroutine.send(None)
+    except StopIteration as e:
+        return e.value
+    coroutine.close()
+    raise RuntimeError("Coroutine suspended, it needs an event loop")
+
+
+def countries_csv() -> str:
+    with open(f"{downloads_dir}countries.csv", encoding="utf-8") as f:
+        return f.read()
+
+
+def read_rows(manager, text: str) -> list:
+    return list(manager.read_rows(io.StringIO(text, newline="")))
+
+
+def cases() -> dict:
+    text: str = countries_csv()
+    countries: ManageCountries = ManageCountries()
+    timezones: ManageTimezones = ManageTimezones()
+    country_rows: list = read_rows(countries, text)
+    memory: MemoryIndex = MemoryIndex(countries.index).load(country_rows)
+
+    city: dict = {
+        "id": "city:57933:state:4026:country:101",
+        "name": "Bengaluru",
+        "state_id": "4026",
+        "state_code": "KA",
+        "state_name": "Karnataka",
+        "country_id": "101",
+        "country_code": "IN",
+        "country_name": "India",
+        "latitude": "12.97194000",
+        "longitude": "77.59369000",
+    }
+    city_result: dict = {"total": 10, "duration": 1.2, "records": [city] * 10}
+    country_result: dict = {
+        "total": 10,
+        "duration": 1.2,
+        "records": [mapping | {"id": key} for key, mapping in country_rows[:10]],
+    }
+
+    phone_cache.set(("+91 98765 43210", None), format_phone_number("+91 98765 43210"))
+
+    return {
+        "phone": {
+            "format_phone_number": lambda: format_phone_number("+91 98765 43210"),
+            "format_phone_number_national": lambda: format_phone_number("020 7946 0018", "GB"),
+            "cached_format_phone_number": lambda: cached_format_phone_number("+91 98765 43210", None),
+        },
+        "email": {
+            "email_syntax_check": lambda: EmailDomainCheck.validate("Some.One@Example.com"),
+        },
+        "models": {
+            "city_search_10_records": lambda: CitySearch(**city_result),
+            "country_search_10_records": lambda: CountrySearch(**country_result),
+            "city_search_json_pydantic": lambda: CitySearch(**city_result).json(exclude_unset=True, ensure_ascii=False),
+            "city_search_json_fast": lambda: FastSerializer.for_model(CitySearch).dumps(city_result),
+            "country_search_json_pydantic": lambda: CountrySearch(**country_result).json(exclude_unset=True, ensure_ascii=False),
+            "country_search_json_fast": lambda: FastSerializer.for_model(CountrySearch).dumps(country_result),
+        },
+        "csv": {
+            "timezones_regex_parsing": lambda: read_rows(timezones, text),
+            "countries_csv_to_hashes": lambda: read_rows(countries, text),
+            "countries_fingerprints": lambda: [countries.fingerprint(m) for _, m in country_rows],
+        },
+        "search": {
+            "query_string": lambda: CityIndex().query_string("new delhi", "wildcard"),
+            "memory_exact_code": lambda: run_sync(memory.search("IN", "exact")),
+            "memory_wildcard_name": lambda: run_sync(memory.search("germ", "wildcard", ["name"])),
+        },
+    }
+
+
+@typer_app.command()
+def main(
+    only: Optional[str] = typer.Option(None, help="Run one group, e.g. phone, email, models, csv or search"),
+    output: Optional[str] = typer.Option(None, help="Json file, benchmarks/results/micro-<commit>.json by default"),
+):
+    results: dict = {}
+    for group, group_cases in cases().items():
+        if only and group != only:
+            continue
+        for name, fn in group_cases.items():
+            results[f"{group}.{name}"] = measure(fn)
+            r = results[f"{group}.{name}"]
+            typer.echo(f"{group + '.' + name:<45} {r['us_per_op']:>12} us {r['ops_per_second']:>10} ops/s")
+
+    typer.echo(f"\nSaved to {save('micro', results, output)}")
+
+
+if __name__ == "__main__":
+    typer_app()
@@ -0,0 +1,72 @@
+"""
+First request latency of phone number validation with cold and with warmed metadata
+
+Every run happens in a fresh interpreter, like a newly started worker
+
+    python -m benchmarks.phone_warmup --regions all --hot-regions IN,DE,GB,BR,JP
+"""
+import json
+import multiprocessing
+import time
+import typer
+from typing import Optional
+
+# One number per region, each is the first request of its region
+SAMPLES: tuple = (
+    ("+91 98765 43210", None),
+    ("+49 30 123456", None),
+    ("020 7946 0018", "GB"),
+    ("+55 11 91234-5678", None),
+    ("+81 3-1234-5678", None),
+)
+
+typer_app = typer.Typer()
+
+
+def first_requests(regions: Optional[str], hot_regions: str) -> dict:
+    start: float = time.perf_counter()
+    from routers.phonenumber import format_phone_number, warm_up
+
+    result: dict = {"import_seconds": round(time.perf_counter() - start, 4)}
+    if regions:
+        result["warm_up"] = warm_up(regions, hot_regions)
+
+    timings: dict = {}
+    for phone_number, country_code in SAMPLES:
+        start = time.perf_counter()
+        format_phone_number(phone_number, country_code)
+        timings[phone_number] = round((time.perf_counter() - start) * 1000, 3)
+    result["first_request_ms"] = timings
+    return result
+
+
+@typer_app.command()
+def main(
+    regions: str = typer.Option("all", help='Regions with metadata loaded, "all" or e.g. "US,IN"'),
+    hot_regions: str = typer.Option("IN,DE,GB,BR,JP", help="Regions with patterns compiled too"),
+    runs: int = typer.Option(5, help="Fresh interpreters per mode"),
+    output: Optional[str] = typer.Option(None, help="Write results as json to this file"),
+):
+    context = multiprocessing.get_context("spawn")
+    results: dict = {"cold": [], "warm": []}
+    for _ in range(runs):
+        for mode, warm in (("cold", None), ("warm", regions)):
+            with context.Pool(1) as pool:
+                results[mode].append(pool.apply(first_requests, (warm, hot_regions)))
+
+    for mode, runs_ in results.items():
+        typer.echo(f"\n{mode}")
+        if mode == "warm":
+            seconds: list = [r["warm_up"]["seconds"] for r in runs_]
+            typer.echo(f"  warm up {min(seconds)}s - {max(seconds)}s at startup")
+        for phone_number, _ in SAMPLES:
+            ms: list = sorted(r["first_request_ms"][phone_number] for r in runs_)
+            typer.echo(f"  {phone_number:<20} median {ms[len(ms) // 2]} ms")
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    typer_app()
@@ -0,0 +1,57 @@
+"""
+Shared helpers of benchmark scripts, results are saved as json named after the benchmark and commit,
+so runs on different commits can be compared, e.g. benchmarks/results/load-1a2b3c4.json
+"""
+import datetime
+import json
+import os
+import platform
+import subprocess
+from typing import Optional
+
+results_dir: str = os.path.join(os.path.dirname(__file__), "results")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def percentiles(timings: list) -> dict:
+    """
+    timings in seconds, percentiles in milliseconds
+    """
+    if not timings:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None}
+    ordered: list = sorted(timings)
+
+    def at(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000, 3)
+
+    return {"p50_ms": at(0.50), "p95_ms": at(0.95), "p99_ms": at(0.99)}
+
+
+def save(name: str, results: dict, output: Optional[str] = None) -> str:
+    commit: str = git_commit()
+    if output is None:
+        os.makedirs(results_dir, exist_ok=True)
+        output = os.path.join(results_dir, f"{name}-{commit}.json")
+
+    with open(output, "w") as f:
+        json.dump(
+            {
+                "benchmark": name,
+                "commit": commit,
+                "created": datetime.datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+    return output
@@ -0,0 +1,217 @@
+"""
+Compares index memory and query latency of the schema that indexes used to have, TEXT fields
+and a NUMERIC city id without sortable fields or index options, with the current TAG, NUMERIC and GEO schema
+
+Rows are read from downloaded csv files and written once under a separate prefix,
+both schemas index the same hashes, and everything is dropped at the end
+
+    python -m benchmarks.schema_migration --runs 200
+"""
+import asyncio
+import json
+import statistics
+import time
+import typer
+from typing import Optional
+from redis.commands.search.field import NumericField, TextField
+from redis.commands.search.indexDefinition import IndexDefinition, IndexType
+from redis.commands.search.query import Query
+from db.async_db import ManageCities, ManageCountries, ManageTimezones, RedisDBBase
+from db.indexes import connection
+
+# FT.INFO values that make up memory used by an index
+MEMORY_FIELDS: tuple = (
+    "inverted_sz_mb",
+    "offset_vectors_sz_mb",
+    "doc_table_size_mb",
+    "sortable_values_size_mb",
+    "key_table_size_mb",
+    "tag_overhead_sz_mb",
+)
+
+# label, query on legacy schema, query on current schema, None when schema cannot answer it
+QUERIES: dict = {
+    "countries": [
+        ("iso2 code", "@iso2:DE", "@iso2:{DE}"),
+        ("name prefix", "@name:ger*", "@name:ger*"),
+        ("latitude range", None, "@latitude:[40 60]"),
+    ],
+    "timezones": [
+        ("gmt offset", "@gmt_offset:19800", "@gmt_offset:[19800 19800]"),
+        ("offset range", None, "@gmt_offset:[0 7200]"),
+    ],
+    "cities": [
+        ("country code", "@country_code:DE", "@country_code:{DE}"),
+        ("state code", "@state_code:KA", "@state_code:{KA}"),
+        ("name prefix", "@name:beng*", "@name:beng*"),
+        ("geo radius", None, "@location:[77.59 12.97 50 km]"),
+    ],
+}
+
+typer_app = typer.Typer()
+
+
+# Schemas as indexes declared them before the migration, copied from CountryIndex, TimeZoneIndex and CityIndex
+LEGACY_SCHEMAS: dict = {
+    "countries": (
+        TextField("id"),
+        TextField("name"),
+        TextField("iso3"),
+        TextField("iso2"),
+        TextField("phone_code"),
+        TextField("numeric_code"),
+        TextField("capital"),
+        TextField("currency"),
+        TextField("currency_name"),
+        TextField("currency_symbol"),
+        TextField("tld"),
+        TextField("native"),
+        TextField("region"),
+        TextField("subregion"),
+        TextField("emoji"),
+        TextField("emojiU"),
+        TextField("latitude"),
+        TextField("longitude"),
+    ),
+    "timezones": (
+        TextField("id"),
+        TextField("zone_name"),
+        TextField("gmt_offset"),
+        TextField("gmt_offset_name"),
+        TextField("abbreviation"),
+        TextField("tz_name"),
+        TextField("country_id"),
+        TextField("country_name"),
+        TextField("emoji"),
+    ),
+    "cities": (
+        NumericField("id"),
+        TextField("name"),
+        TextField("state_id"),
+        TextField("state_code"),
+        TextField("state_name"),
+        TextField("country_id"),
+        TextField("country_code"),
+        TextField("country_name"),
+        TextField("latitude"),
+        TextField("longitude"),
+    ),
+}
+
+
+async def write_rows(manager: RedisDBBase, prefix: str) -> int:
+    rows: int = 0
+    for chunk in manager.read_chunks():
+        pipe = connection.pipeline(transaction=False)
+        for key, mapping in chunk:
+            pipe.hset(f"{prefix}{key}", mapping=mapping)
+        await pipe.execute()
+        rows += len(chunk)
+    return rows
+
+
+async def create_index(name: str, schema: tuple, prefix: str, options: dict) -> None:
+    await connection.ft(name).create_index(
+        schema,
+        definition=IndexDefinition(prefix=[prefix], index_type=IndexType.HASH),
+        **options,
+    )
+    while True:
+        info: dict = await connection.ft(name).info()
+        if str(info.get("indexing")) == "0":
+            return
+        await asyncio.sleep(0.1)
+
+
+async def index_memory(name: str) -> dict:
+    info: dict = await connection.ft(name).info()
+    memory: dict = {f: float(info[f]) for f in MEMORY_FIELDS if f in info}
+    memory["total_mb"] = round(sum(memory.values()), 3)
+    memory["hash_indexing_failures"] = int(info.get("hash_indexing_failures", 0))
+    return memory
+
+
+async def query_latency(name: str, query: str, runs: int) -> dict:
+    timings: list = []
+    total: int = 0
+    for _ in range(runs):
+        start: float = time.perf_counter()
+        r = await connection.ft(name).search(Query(query).paging(0, 10).no_content())
+        timings.append((time.perf_counter() - start) * 1000)
+        total = r.total
+    timings.sort()
+    return {
+        "total": total,
+        "median_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(timings[int(len(timings) * 0.95) - 1], 3),
+    }
+
+
+async def benchmark(manager: RedisDBBase, runs: int) -> dict:
+    name: str = manager.index.name
+    prefix: str = f"bench:{name}:"
+    indexes: dict = {
+        f"bench_{name}_legacy": (LEGACY_SCHEMAS[name], {}),
+        f"bench_{name}_current": (manager.index.schema, manager.index.index_options),
+    }
+
+    result: dict = {"rows": 0, "memory": {}, "queries": {}}
+    try:
+        result["rows"] = await write_rows(manager, prefix)
+        for index_name, (schema, options) in indexes.items():
+            await create_index(index_name, schema, f"{prefix}{manager.index.prefix}", options)
+
+        for (index_name, _), version in zip(indexes.items(), ("legacy", "current")):
+            result["memory"][version] = await index_memory(index_name)
+
+        for label, legacy, current in QUERIES[name]:
+            result["queries"][label] = {}
+            for (index_name, _), query in zip(indexes.items(), (legacy, current)):
+                version: str = index_name.rsplit("_", 1)[1]
+                result["queries"][label][version] = (
+                    await query_latency(index_name, query, runs) if query else None
+                )
+    finally:
+        for index_name in indexes:
+            try:
+                await connection.ft(index_name).dropindex(delete_documents=False)
+            except Exception:
+                pass
+        await manager.index.drop_keys(prefix)
+
+    return result
+
+
+@typer_app.command()
+def main(
+    runs: int = typer.Option(100, help="Times every query is run"),
+    output: Optional[str] = typer.Option(None, help="Write results as json to this file"),
+):
+    async def run_all() -> dict:
+        return {
+            manager.index.name: await benchmark(manager, runs)
+            for manager in (ManageCountries(), ManageTimezones(), ManageCities())
+        }
+
+    results: dict = asyncio.run(run_all())
+
+    for name, result in results.items():
+        typer.echo(f"\n{name}: {result['rows']} rows")
+        for version, memory in result["memory"].items():
+            typer.echo(
+                f"  {version:<8} {memory['total_mb']:>10} MB, {memory['hash_indexing_failures']} indexing failures"
+            )
+        for label, versions in result["queries"].items():
+            cells: list = [
+                f"{version} {r['median_ms']} ms (p95 {r['p95_ms']}, {r['total']} hits)" if r else f"{version} n/a"
+                for version, r in versions.items()
+            ]
+            typer.echo(f"  {label:<15} " + " | ".join(cells))
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    typer_app()
@@ -0,0 +1,134 @@
+"""
+Cost per row of turning a FT.SEARCH reply of CityIndex into records, with decoded and with raw replies
+
+Replies are parsed from RESP bytes by hiredis, like the redis client does, so no redis is needed
+"decoded" is the default path: whole reply decoded, redis-py Result and Document objects, then records
+"raw" is SEARCH_RAW_REPLIES: reply kept as bytes, only returned fields decoded straight into records
+
+    python -m benchmarks.search_replies --rows 100 --rows 1000
+"""
+import timeit
+import tracemalloc
+import hiredis
+import typer
+from typing import List, Optional
+from redis.commands.search.result import Result
+from benchmarks.report import save
+from db.async_db import ManageCities
+from db.indexes import parse_search_reply
+
+typer_app = typer.Typer()
+
+index = ManageCities.index
+
+
+def encode(value) -> bytes:
+    """
+    RESP2 encoding of a FT.SEARCH reply
+    """
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(encode(v) for v in value)
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    data: bytes = value.encode()
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+def search_reply(rows: int) -> bytes:
+    """
+    Page of cities as stored in redis, every hash also has the location field
+    Cities are spread over a few states of one country, like results of a search scoped to a country
+    """
+    states: list = [("4026", "KA", "Karnataka"), ("4035", "TN", "Tamil Nadu"), ("4008", "MH", "Maharashtra")]
+    reply: list = [rows * 10]
+    for i in range(rows):
+        state_id, state_code, state_name = states[i % len(states)]
+        latitude: str = f"{12 + i / 1000:.8f}"
+        longitude: str = f"{77 + i / 2000:.8f}"
+        mapping: dict = {
+            "id": str(57000 + i),
+            "name": f"Bengaluru {i}",
+            "state_id": state_id,
+            "state_code": state_code,
+            "state_name": state_name,
+            "country_id": "101",
+            "country_code": "IN",
+            "country_name": "India",
+            "latitude": latitude,
+            "longitude": longitude,
+            "location": f"{longitude},{latitude}",
+        }
+        reply.append(f"{index.name}:v3:city:{57000 + i}:state:{state_id}:country:101")
+        reply.append([item for pair in mapping.items() for item in pair])
+    return encode(reply)
+
+
+def decoded(buffer: bytes, fields: list) -> list:
+    reader = hiredis.Reader(encoding="utf-8")
+    reader.feed(buffer)
+    r = Result(reader.gets(), True)
+    return [
+        {field: getattr(doc, field, None) for field in fields} | {"id": index.document_id(doc.id)}
+        for doc in r.docs
+    ]
+
+
+def raw(buffer: bytes, fields: list) -> list:
+    reader = hiredis.Reader()
+    reader.feed(buffer)
+    return parse_search_reply(reader.gets(), fields, index.document_id)
+
+
+def allocations(fn, buffer: bytes, fields: list) -> dict:
+    """
+    Peak is everything alive at once while parsing, retained is what the records keep
+    """
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    start_size, _ = tracemalloc.get_traced_memory()
+    records = fn(buffer, fields)
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    del records
+    return {
+        "peak_bytes": peak - start_size,
+        "retained_bytes": sum(s.size_diff for s in stats),
+        "retained_blocks": sum(s.count_diff for s in stats),
+    }
+
+
+@typer_app.command()
+def main(
+    rows: List[int] = typer.Option([100, 1000], help="Rows per result page"),
+    output: Optional[str] = typer.Option(None, help="Json file, benchmarks/results/search_replies-<commit>.json by default"),
+):
+    fields: list = [f for f in index.get_field_names() if f != "id"]
+    results: dict = {}
+    for n in rows:
+        buffer: bytes = search_reply(n)
+        assert decoded(buffer, fields) == raw(buffer, fields), "Both paths should return the same records"
+        for name, fn in (("decoded", decoded), ("raw", raw)):
+            timer = timeit.Timer(lambda: fn(buffer, fields))
+            number, _ = timer.autorange()
+            seconds: float = min(timer.repeat(repeat=5, number=number)) / number
+            memory: dict = allocations(fn, buffer, fields)
+            r: dict = {
+                "us_per_row": round(seconds * 1e6 / n, 3),
+                "peak_bytes_per_row": memory["peak_bytes"] // n,
+                "retained_bytes_per_row": memory["retained_bytes"] // n,
+                "retained_blocks_per_row": round(memory["retained_blocks"] / n, 1),
+            }
+            results[f"{name}.{n}_rows"] = r
+            typer.echo(
+                f"{name:<8} {n:>6} rows {r['us_per_row']:>8} us/row  peak {r['peak_bytes_per_row']:>6} B/row  "
+                f"retained {r['retained_bytes_per_row']:>6} B/row {r['retained_blocks_per_row']:>6} blocks/row"
+            )
+
+    typer.echo(f"\nSaved to {save('search_replies', results, output)}")
+
+
+if __name__ == "__main__":
+    typer_app()
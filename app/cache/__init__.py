@@ -0,0 +1,2 @@
+from .lru import LRUCache
+from .ttl import TTLCache
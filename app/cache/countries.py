@@ -0,0 +1,127 @@
+import asyncio
+import os
+import re
+from typing import Optional
+from redis.commands.search.query import Query
+from redis.exceptions import RedisError
+from db.indexes import CountryIndex, RedisIndex, TimeZoneIndex, connection
+
+
+def phone_codes(value: str) -> list:
+    """
+    "+1-787 and 1-939" is stored for Puerto Rico, keys are digits only, e.g. ["1787", "1939"]
+    """
+    return [code for code in (re.sub(r"\D", "", part) for part in value.split(" and ")) if code]
+
+
+class CountryDirectory:
+    """
+    Countries by iso2, dial code and currency, and their timezones, kept in process memory
+    Rebuilt from the countries and timezones indexes whenever their revision in dbinfo changes,
+    so lookups are plain dictionary reads without a query to redis
+    """
+
+    def __init__(
+        self,
+        refresh_interval: float = float(os.getenv("COUNTRY_DIRECTORY_REFRESH", "30")),
+    ) -> None:
+        self.index: CountryIndex = CountryIndex()
+        self.timezone_index: TimeZoneIndex = TimeZoneIndex()
+        self.refresh_interval = refresh_interval
+        self.revision: Optional[str] = None
+        self.by_iso2: dict = {}
+        self.by_phone_code: dict = {}
+        self.by_currency: dict = {}
+        self.timezones: dict = {}
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.revision is not None
+
+    def load(self, records: list, revision: str, timezones: Optional[list] = None) -> None:
+        """
+        Dictionaries are built aside and swapped in, readers never see a half built directory
+        Timezones are joined by country_id and kept by iso2 of their country
+        """
+        by_iso2: dict = {}
+        by_phone_code: dict = {}
+        by_currency: dict = {}
+        by_country_id: dict = {}
+        for record in sorted(records, key=lambda r: r.get("name") or ""):
+            if record.get("iso2"):
+                by_iso2[record["iso2"].upper()] = record
+                by_country_id[(record.get("id") or "").rsplit(":", 1)[-1]] = record["iso2"].upper()
+            for code in phone_codes(record.get("phone_code") or ""):
+                by_phone_code.setdefault(code, []).append(record)
+            if record.get("currency"):
+                by_currency.setdefault(record["currency"].upper(), []).append(record)
+
+        by_timezone_country: dict = {}
+        for timezone in timezones or []:
+            iso2: Optional[str] = by_country_id.get(str(timezone.get("country_id")))
+            if iso2:
+                by_timezone_country.setdefault(iso2, []).append(timezone)
+
+        self.by_iso2, self.by_phone_code, self.by_currency = by_iso2, by_phone_code, by_currency
+        self.timezones = by_timezone_country
+        self.revision = revision
+
+    @staticmethod
+    async def fetch(index: RedisIndex) -> list:
+        fields: list = [f for f in index.get_field_names() if f != "id"]
+        r = await connection.ft(index.name).search(Query("*").paging(0, 10000))
+        return [
+            {field: getattr(doc, field, None) for field in fields} | {"id": index.document_id(doc.id)}
+            for doc in r.docs
+        ]
+
+    async def refresh(self) -> bool:
+        """
+        Returns True if directory was rebuilt
+        """
+        revisions: list = [
+            await connection.hget(f"dbinfo:{index.name}", "revision") or "0"
+            for index in (self.index, self.timezone_index)
+        ]
+        revision: str = ":".join(revisions)
+        if revision == self.revision:
+            return False
+        self.load(await self.fetch(self.index), revision, await self.fetch(self.timezone_index))
+        return True
+
+    async def refresh_forever(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except RedisError:
+                pass
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self) -> None:
+        if self.task is None:
+            self.task = asyncio.create_task(self.refresh_forever())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    def get_iso2(self, iso2: str) -> Optional[dict]:
+        return self.by_iso2.get(iso2.upper())
+
+    def get_phone_code(self, code: str) -> list:
+        return self.by_phone_code.get(re.sub(r"\D", "", code), [])
+
+    def get_currency(self, currency: str) -> list:
+        return self.by_currency.get(currency.upper(), [])
+
+    def get_timezones(self, iso2: str) -> list:
+        return self.timezones.get(iso2.upper(), [])
+
+
+country_directory: CountryDirectory = CountryDirectory()
@@ -0,0 +1,161 @@
+import json
+import os
+from typing import Optional, Tuple
+import dns.asyncresolver
+import dns.exception
+import dns.resolver
+from redis.exceptions import RedisError
+from db.indexes import connection
+from metrics import stage
+from .singleflight import SingleFlight
+from .ttl import TTLCache
+
+# Answers that mean there is no such record, as handled by email_validator
+NO_RECORD = (dns.resolver.NoNameservers, dns.resolver.NXDOMAIN, dns.resolver.NoAnswer)
+
+
+class DomainResolver:
+    """
+    Checks if a domain accepts email, without blocking the event loop
+    Follows deliverability checks of email_validator: MX, then A and AAAA fallback, then SPF reject-all
+    Answers, including non existent domains, are cached for their DNS TTL
+    in process and, if enabled, in redis so that all workers share them
+    Concurrent checks of a domain share one lookup, across workers too with SINGLEFLIGHT_REDIS_LOCK
+    """
+
+    redis_prefix: str = "dnscache:"
+
+    def __init__(
+        self,
+        maxsize: int = int(os.getenv("EMAIL_DNS_CACHE_SIZE", "10000")),
+        timeout: float = float(os.getenv("EMAIL_DNS_TIMEOUT", "15")),
+        min_ttl: int = int(os.getenv("EMAIL_DNS_MIN_TTL", "60")),
+        max_ttl: int = int(os.getenv("EMAIL_DNS_MAX_TTL", "86400")),
+        negative_ttl: int = int(os.getenv("EMAIL_DNS_NEGATIVE_TTL", "300")),
+        use_redis: bool = os.getenv("EMAIL_DNS_REDIS_CACHE", "false").lower() == "true",
+    ) -> None:
+        self.cache: TTLCache = TTLCache(maxsize, name="email_dns")
+        self.timeout = timeout
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.negative_ttl = negative_ttl
+        self.use_redis = use_redis
+        self.resolver: Optional[dns.asyncresolver.Resolver] = None
+        self.flights: SingleFlight = SingleFlight("email_dns")
+
+    def get_resolver(self) -> dns.asyncresolver.Resolver:
+        if self.resolver is None:
+            self.resolver = dns.asyncresolver.Resolver()
+            self.resolver.lifetime = self.timeout
+        return self.resolver
+
+    def clamp_ttl(self, ttl: int) -> int:
+        return max(self.min_ttl, min(ttl, self.max_ttl))
+
+    async def check(self, domain: str) -> dict:
+        """
+        Returns {"deliverable": bool, "detail": reason or None}
+        """
+        domain = domain.lower()
+        result = self.cache.get(domain)
+        if result is not None:
+            return result
+
+        published = (lambda: self.published(domain)) if self.use_redis else None
+        result, ttl = await self.flights.do(domain, lambda: self.lookup(domain), published)
+        self.cache.set(domain, result, ttl)
+        return result
+
+    async def lookup(self, domain: str) -> Tuple[dict, int]:
+        """
+        Runs once for concurrent checks of the same domain, see SingleFlight
+        """
+        result: Optional[dict] = None
+        ttl: int = 0
+        if self.use_redis:
+            result, ttl = await self.redis_get(domain)
+
+        if result is None:
+            with stage("dns.resolve"):
+                result, ttl = await self.resolve(domain)
+            if self.use_redis:
+                await self.redis_set(domain, result, ttl)
+        return result, ttl
+
+    async def published(self, domain: str) -> Optional[Tuple[dict, int]]:
+        result, ttl = await self.redis_get(domain)
+        return (result, ttl) if result is not None else None
+
+    async def redis_get(self, domain: str) -> Tuple[Optional[dict], int]:
+        key: str = f"{self.redis_prefix}{domain}"
+        try:
+            pipe = connection.pipeline(transaction=False)
+            pipe.get(key)
+            pipe.ttl(key)
+            value, ttl = await pipe.execute()
+        except RedisError:
+            return None, 0
+        if value is None or ttl <= 0:
+            return None, 0
+        return json.loads(value), ttl
+
+    async def redis_set(self, domain: str, result: dict, ttl: int) -> None:
+        if ttl <= 0:
+            return
+        try:
+            await connection.set(f"{self.redis_prefix}{domain}", json.dumps(result), ex=ttl)
+        except RedisError:
+            pass
+
+    async def query(self, domain: str, record: str) -> dns.resolver.Answer:
+        return await self.get_resolver().resolve(domain, record)
+
+    async def resolve(self, domain: str) -> Tuple[dict, int]:
+        """
+        Returns result along with seconds it can be cached for
+        Timeouts are not treated as failure and are not cached
+        """
+        try:
+            try:
+                answer = await self.query(domain, "MX")
+                if not [r for r in answer if str(r.exchange).rstrip(".") != ""]:
+                    return self.undeliverable(f"The domain name {domain} does not accept email."), self.clamp_ttl(answer.rrset.ttl)
+                return self.deliverable(), self.clamp_ttl(answer.rrset.ttl)
+            except NO_RECORD:
+                pass
+
+            answer = None
+            for record in ("A", "AAAA"):
+                try:
+                    answer = await self.query(domain, record)
+                    break
+                except NO_RECORD:
+                    continue
+
+            if answer is None:
+                return self.undeliverable(f"The domain name {domain} does not exist."), self.negative_ttl
+
+            try:
+                txt = await self.query(domain, "TXT")
+                if any(b"".join(r.strings) == b"v=spf1 -all" for r in txt):
+                    return self.undeliverable(f"The domain name {domain} does not send email."), self.clamp_ttl(txt.rrset.ttl)
+            except NO_RECORD:
+                pass
+
+            return self.deliverable(), self.clamp_ttl(answer.rrset.ttl)
+
+        except dns.exception.Timeout:
+            return self.deliverable(), 0
+
+        except Exception as e:
+            return self.undeliverable(
+                f"There was an error while checking if the domain name in the email address is deliverable: {e}"
+            ), 0
+
+    @staticmethod
+    def deliverable() -> dict:
+        return {"deliverable": True, "detail": None}
+
+    @staticmethod
+    def undeliverable(detail: str) -> dict:
+        return {"deliverable": False, "detail": detail}
@@ -0,0 +1,63 @@
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+from metrics import cache_counters
+
+
+class LRUCache:
+    """
+    Bounded least recently used cache with hit, miss and eviction counters
+    Lives in process memory, so every worker keeps its own copy
+    maxsize of 0 disables caching, caches with a name also count lookups in metrics
+    """
+
+    def __init__(self, maxsize: int = 1024, name: Optional[str] = None) -> None:
+        self.maxsize: int = maxsize
+        self.data: OrderedDict = OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self.hit_counter, self.miss_counter = cache_counters(name)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        try:
+            value = self.data[key]
+        except KeyError:
+            self.count(False)
+            return default
+        self.data.move_to_end(key)
+        self.count(True)
+        return value
+
+    def count(self, hit: bool) -> None:
+        if hit:
+            self.hits += 1
+            self.hit_counter.inc()
+        else:
+            self.misses += 1
+            self.miss_counter.inc()
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        self.data[key] = value
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self.data.clear()
+
+    def info(self) -> dict:
+        lookups: int = self.hits + self.misses
+        return {
+            "size": len(self.data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
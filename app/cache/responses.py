@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+from typing import Optional
+from redis.exceptions import RedisError
+from db.indexes import connection
+from .lru import LRUCache
+from .ttl import TTLCache
+
+
+class ResponseCache:
+    """
+    Caches serialized lookup responses in process and, if enabled, in redis so that all workers share them
+    Keys include the revision of the index, which index managers bump on every update,
+    so entries of old data are never read again and simply age out
+    """
+
+    redis_prefix: str = "respcache:"
+
+    def __init__(
+        self,
+        maxsize: int = int(os.getenv("PLACES_CACHE_SIZE", "10000")),
+        redis_ttl: int = int(os.getenv("PLACES_CACHE_TTL", "86400")),
+        max_age: int = int(os.getenv("PLACES_CACHE_MAX_AGE", "3600")),
+        revision_ttl: float = float(os.getenv("PLACES_REVISION_TTL", "5")),
+        use_redis: bool = os.getenv("PLACES_REDIS_CACHE", "false").lower() == "true",
+    ) -> None:
+        self.cache: LRUCache = LRUCache(maxsize, name="places_responses")
+        self.revisions: TTLCache = TTLCache(64)
+        self.redis_ttl = redis_ttl
+        self.max_age = max_age
+        self.revision_ttl = revision_ttl
+        self.use_redis = use_redis
+
+    async def revision(self, index_name: str) -> Optional[str]:
+        """
+        Revision is read from redis at most once per revision_ttl seconds
+        None when redis is not reachable, responses are not cached then
+        """
+        revision = self.revisions.get(index_name)
+        if revision is None:
+            try:
+                revision = await connection.hget(f"dbinfo:{index_name}", "revision") or "0"
+            except RedisError:
+                return None
+            self.revisions.set(index_name, revision, self.revision_ttl)
+        return revision
+
+    @staticmethod
+    def key(index_name: str, revision: str, params: dict) -> str:
+        """
+        Query is lower cased and whitespace collapsed, search is case insensitive
+        Order of search fields does not change results
+        """
+        normalized: dict = dict(params)
+        normalized["query"] = " ".join(str(params.get("query", "")).lower().split())
+        if normalized.get("fields"):
+            normalized["fields"] = sorted(normalized["fields"])
+        digest: str = hashlib.blake2b(
+            json.dumps(normalized, sort_keys=True).encode(), digest_size=12
+        ).hexdigest()
+        return f"{index_name}:{revision}:{digest}"
+
+    @staticmethod
+    def etag(key: str) -> str:
+        return '"{}"'.format(key.split(":", 1)[1].replace(":", "-"))
+
+    def headers(self, key: str) -> dict:
+        return {"ETag": self.etag(key), "Cache-Control": f"public, max-age={self.max_age}"}
+
+    @staticmethod
+    def not_modified(if_none_match: Optional[str], etag: str) -> bool:
+        if not if_none_match:
+            return False
+        tags: list = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+        return etag in tags or "*" in tags
+
+    async def get(self, key: str) -> Optional[str]:
+        body: Optional[str] = self.cache.get(key)
+        if body is None and self.use_redis:
+            try:
+                body = await connection.get(f"{self.redis_prefix}{key}")
+            except RedisError:
+                body = None
+            if body is not None:
+                self.cache.set(key, body)
+        return body
+
+    async def set(self, key: str, body: str) -> None:
+        self.cache.set(key, body)
+        if self.use_redis:
+            try:
+                await connection.set(f"{self.redis_prefix}{key}", body, ex=self.redis_ttl)
+            except RedisError:
+                pass
@@ -0,0 +1,114 @@
+import asyncio
+import os
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Hashable, Optional
+from redis.exceptions import RedisError
+from db.connection import connection
+from metrics import cache_counters
+
+# Deletes lock only if it is still held by the caller, it may have expired and been taken by another worker
+RELEASE_SCRIPT: str = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    """
+    Concurrent calls with the same key share one execution, so a burst of identical lookups costs one
+    The call runs in its own task, a caller that is cancelled does not cancel it for the others
+
+    With use_redis_lock, workers also take turns through a redis lock per key, for calls whose result
+    is published to redis. Followers poll for the published result while the lock is held,
+    and run the call themselves if it does not show up within wait seconds
+    """
+
+    lock_prefix: str = "singleflight:"
+
+    def __init__(
+        self,
+        name: str,
+        use_redis_lock: bool = os.getenv("SINGLEFLIGHT_REDIS_LOCK", "false").lower() == "true",
+        lock_ttl: float = float(os.getenv("SINGLEFLIGHT_LOCK_TTL", "10")),
+        wait: float = float(os.getenv("SINGLEFLIGHT_WAIT", "5")),
+        poll_interval: float = 0.02,
+    ) -> None:
+        self.name = name
+        self.use_redis_lock = use_redis_lock
+        self.lock_ttl = lock_ttl
+        self.wait = wait
+        self.poll_interval = poll_interval
+        self.flights: dict = {}
+        self.calls: int = 0
+        self.shared: int = 0
+        self.shared_counter, self.led_counter = cache_counters(f"{name}_singleflight")
+
+    async def do(
+        self,
+        key: Hashable,
+        fn: Callable[[], Awaitable],
+        published: Optional[Callable[[], Awaitable]] = None,
+    ) -> Any:
+        """
+        fn runs once for all concurrent callers of key, they all get its result or its exception
+        published reads the result fn stored in redis, None when it is not there, it enables the redis lock
+        """
+        task: Optional[asyncio.Task] = self.flights.get(key)
+        if task is None:
+            coroutine: Awaitable = self.locked(key, fn, published) if self.use_redis_lock and published else fn()
+            task = asyncio.create_task(coroutine)
+            self.flights[key] = task
+            task.add_done_callback(lambda t: self.done(key, t))
+            self.calls += 1
+            self.led_counter.inc()
+        else:
+            self.shared += 1
+            self.shared_counter.inc()
+        return await asyncio.shield(task)
+
+    def done(self, key: Hashable, task: asyncio.Task) -> None:
+        if self.flights.get(key) is task:
+            del self.flights[key]
+        # Marks exception as retrieved, when every caller has been cancelled nobody else reads it
+        if not task.cancelled():
+            task.exception()
+
+    async def locked(self, key: Hashable, fn: Callable[[], Awaitable], published: Callable[[], Awaitable]) -> Any:
+        lock_key: str = f"{self.lock_prefix}{self.name}:{key}"
+        token: str = uuid.uuid4().hex
+        try:
+            acquired: bool = await connection.set(lock_key, token, nx=True, px=int(self.lock_ttl * 1000))
+        except RedisError:
+            return await fn()
+
+        if acquired:
+            try:
+                return await fn()
+            finally:
+                try:
+                    await connection.eval(RELEASE_SCRIPT, 1, lock_key, token)
+                except RedisError:
+                    pass
+
+        deadline: float = time.monotonic() + self.wait
+        try:
+            while time.monotonic() < deadline:
+                await asyncio.sleep(self.poll_interval)
+                result = await published()
+                if result is not None:
+                    return result
+                if not await connection.exists(lock_key):
+                    # Released without publishing, e.g. the call failed, one more read before running it here
+                    result = await published()
+                    if result is not None:
+                        return result
+                    break
+        except RedisError:
+            pass
+        return await fn()
+
+    def info(self) -> dict:
+        return {"in_flight": len(self.flights), "calls": self.calls, "shared": self.shared}
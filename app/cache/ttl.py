@@ -0,0 +1,27 @@
+import time
+from typing import Any, Hashable
+from .lru import LRUCache
+
+
+class TTLCache(LRUCache):
+    """
+    LRUCache where every entry carries its own time to live in seconds
+    Expired entries are dropped on read and counted as misses
+    """
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self.data.get(key)
+        if entry is not None and entry[0] <= time.monotonic():
+            del self.data[key]
+            entry = None
+        if entry is None:
+            self.count(False)
+            return default
+        self.data.move_to_end(key)
+        self.count(True)
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: float = 60) -> None:
+        if ttl <= 0:
+            return
+        super().set(key, (time.monotonic() + ttl, value))
@@ -1,6 +1,14 @@
+import time
 import typer
 from commands.base import ping, async_helper
-from db.async_db import ManageCities, ManageCountries, ManageTimezones, build_db_info, WithinSetTime
+from db.async_db import (
+    ManageCities,
+    ManageCountries,
+    ManageTimezones,
+    WithinSetTime,
+    build_db_info,
+    populate_indexes,
+)
 
 typer_app = typer.Typer(help="Operations related to redis")
 
@@ -16,26 +24,51 @@ def get_db_info():
 
 
 @typer_app.command()
-def populate_db(force: bool = typer.Option(False, help="Force update all indexes")):
+def populate_db(
+    force: bool = typer.Option(False, help="Force update all indexes"),
+    full: bool = typer.Option(False, help="Reload every row instead of syncing only changes"),
+    concurrency: int = typer.Option(4, help="Pipelines written at the same time for each index"),
+):
     """
     Download and parse csv data and update redisearch indexes
     """
 
-    indexes = [ManageCountries, ManageTimezones, ManageCities]
+    managers = [ManageCountries(), ManageTimezones(), ManageCities()]
+    for manager in managers:
+        manager.concurrency = concurrency
+
     if force:
-        for index in indexes:
-            async_helper(index().reset_elapsed_time())
+        for manager in managers:
+            async_helper(manager.reset_elapsed_time())
 
     typer.echo(f"\nStarting db update. It takes a couple of minutes to download, parse, and update db")
-    try:
-        for index in indexes:
-            typer.echo(f"\nDownloading {index.index.name}.csv")
-            async_helper(index().download_file())
-            typer.echo(f"Updating {index.index.name} database")
-            async_helper(index().update_db())
-            r = async_helper(index().get_index_info())
-            typer.echo(f"Added {r} records to {index.index.name} index")
-    except WithinSetTime as e:
-            typer.echo(e.message)
+    start = time.perf_counter()
+    results = async_helper(populate_indexes(managers, full=full))
+    skipped = False
+
+    for manager, report in zip(managers, results):
+        typer.echo(f"\n{manager.index.name}")
+        if isinstance(report, WithinSetTime):
+            skipped = True
+            typer.echo("Skipped, set interval for database updates has not elapsed")
+            continue
+        if isinstance(report, Exception):
+            typer.echo(f"Failed - {report!r}")
+            continue
 
+        typer.echo(
+            f"Wrote {report['rows']} rows in {report['seconds']} seconds ({report['rows_per_second']} rows/sec)"
+        )
+        typer.echo(
+            f"Added {report['added']}, changed {report['changed']}, removed {report['removed']} rows"
+        )
+        typer.echo(
+            ", ".join(f"{stage} {seconds}s" for stage, seconds in report["timings"].items())
+        )
+        typer.echo(
+            f"{manager.index.name} index has {report['records']} records, serving generation {report['generation']}"
+        )
 
+    typer.echo(f"\nTotal time {time.perf_counter() - start:.2f} seconds")
+    if skipped:
+        typer.echo(WithinSetTime().message)
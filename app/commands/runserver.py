@@ -1,3 +1,4 @@
+import time
 import typer
 import uvicorn
 import os
@@ -41,5 +42,25 @@ def prod():
         "bind": f"{bind_ip}:{bind_port}",
         "workers": gunicorn_workers,
         "worker_class": "uvicorn.workers.UvicornWorker",
+        "preload_app": True,
     }
-    GunicornServer("main:fastapi_application", options).run()
+
+    # Workers write metrics to PROMETHEUS_MULTIPROC_DIR, samples of exited workers are kept in the sums
+    from metrics import mark_process_dead, reset_multiprocess_dir
+
+    reset_multiprocess_dir()
+    options["child_exit"] = lambda server, worker: mark_process_dead(worker.pid)
+
+    # App is imported and phone number metadata loaded once in master, workers share it copy-on-write
+    # Redis clients are created lazily, so no connection is opened before workers fork
+    start = time.perf_counter()
+    from main import fastapi_application
+    from routers.phonenumber import warm_up
+
+    imported = time.perf_counter() - start
+    report = warm_up()
+    typer.echo(
+        f"App imported in {imported:.3f}s, "
+        f"phone number metadata of {report['regions']} regions ({report['hot_regions']} hot) loaded in {report['seconds']}s"
+    )
+    GunicornServer(fastapi_application, options).run()
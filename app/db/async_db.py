@@ -1,6 +1,7 @@
-import csv, re, os, time, aiohttp, aiofiles, datetime, humanize
-from typing import Optional
+import asyncio, csv, hashlib, json, logging, math, re, os, time, aiohttp, aiofiles, datetime, humanize
+from typing import Iterator, Optional, Tuple
 from redis.asyncio.client import Redis
+from metrics import pipeline_flush
 from models import (
     Country,
     City,
@@ -32,19 +33,88 @@ class WithinSetTime(Exception):
         super().__init__(self.message)
 
 
+class InvalidSchema(Exception):
+    """
+    Exception raised when downloaded csv file does not have columns required by model
+    """
+
+    def __init__(self, file_name: str, missing: list):
+        self.message = f"""
+
+    {file_name} is missing required columns: {", ".join(missing)}
+    Upstream data format might have changed
+
+        """
+        super().__init__(self.message)
+
+
+def parse_priorities(value: str) -> dict:
+    """
+    "IN=5,US=3" -> {"IN": 5.0, "US": 3.0}, used to weight autocomplete suggestions by country
+    Malformed entries of SUGGEST_PRIORITY are skipped with a warning instead of failing at import
+    """
+    priorities: dict = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        code, _, weight = item.partition("=")
+        try:
+            priority: float = float(weight)
+        except ValueError:
+            priority = math.nan
+        if not code.strip() or not math.isfinite(priority) or priority <= 0:
+            logging.getLogger(__name__).warning(
+                f"Skipping SUGGEST_PRIORITY entry {item.strip()!r}, expected a country code and a positive weight"
+            )
+            continue
+        priorities[code.strip().upper()] = priority
+    return priorities
+
+
 class RedisDBBase:
-    pipeline: Redis = connection.pipeline()
     base_dir: str = "/src/downloads/"
     update_interval: int = 15 * 24 * 60 * 60  # 15 days in seconds
-    max_allowed_commands: int = 10000
-
-    async def update_db_info(self, pipe: Redis = None) -> Optional[Redis]:
+    max_allowed_commands: int = 10000  # commands per pipeline
+    concurrency: int = 4  # pipelines being executed at the same time
+    key_prefix: str = ""  # generation prefix, set by update_db
+    fingerprints_key: str = ""  # hash of row fingerprints, set by update_db
+    suggestions_key: str = ""  # autocomplete dictionary, set by update_db
+    suggestion_fields: tuple = ()  # fields needed by suggestion()
+    suggestion_priority: dict = parse_priorities(os.getenv("SUGGEST_PRIORITY", ""))
+    syncing: bool = False  # set by update_db when only differences are written
+    downloads: dict = {}  # url -> download task, shared by all managers
+    # Seconds a replaced generation is kept, so exports reading it through a cursor can finish
+    retire_after: int = int(os.getenv("GENERATION_RETIRE_SECONDS", "900"))
+
+    def __init__(self) -> None:
+        # Seconds spent per stage, "write" is summed over concurrent pipelines
+        self.timings: dict = {"download": 0.0, "parse": 0.0, "write": 0.0}
+
+    @property
+    def file_name(self) -> str:
+        return os.path.basename(self.url)
+
+    @property
+    def file_path(self) -> str:
+        return os.path.realpath(self.base_dir + self.file_name)
+
+    @property
+    def fields(self) -> list:
+        return list(self.model.__fields__)
+
+    async def update_db_info(self, pipe: Redis = None, changed: bool = True) -> Optional[Redis]:
+        """
+        Also bumps revision if data changed, which invalidates cached lookup responses of this index
+        """
         key: str = f"dbinfo:{self.index.name.lower()}"
         base_value: dict = {"last_updated": int(time.time())}
         if pipe:
-            return await pipe.hmset(key, mapping=base_value)
+            await pipe.hmset(key, mapping=base_value)
+            return await pipe.hincrby(key, "revision", 1) if changed else pipe
         else:
-            return await connection.hmset(key, mapping=base_value)
+            await connection.hmset(key, mapping=base_value)
+            if changed:
+                return await connection.hincrby(key, "revision", 1)
 
     async def set_time_has_lapsed(self) -> bool:
         timestamp: list = await connection.hmget(
@@ -69,52 +139,472 @@ class RedisDBBase:
         d = await connection.ft(self.index.name.lower()).info()
         return d.get("num_docs")
 
-    async def update_db(self) -> None:
-        can_be_updated: bool = all(
-            [
-                await self.index.index_exists(),
-                await self.set_time_has_lapsed(),
-            ]
+    def check_schema(self, header: list, required: Optional[list] = None) -> None:
+        """
+        Checks csv header once, instead of validating every row with pydantic model
+        By default, every field of index schema has to be present
+        """
+        if required is None:
+            required = self.index.get_field_names()
+        missing: list = [name for name in required if name not in header]
+        if missing:
+            raise InvalidSchema(self.file_name, missing)
+
+    def read_rows(self, csvfile) -> Iterator[Tuple[str, dict]]:
+        """
+        Yields redis key and hash mapping for every row in csv file
+        Model fields that are not present in csv file are stored as empty strings
+        Numeric fields without a number are left out, redis would not index such rows at all
+        Rows get a location when the index has a GEO field
+        """
+        rdr = csv.reader(csvfile)
+        header: list = next(rdr)
+        self.check_schema(header)
+
+        columns: list = [(f, header.index(f)) for f in self.fields if f in header]
+        missing: dict = {f: "" for f in self.fields if f not in header}
+        types: dict = self.index.field_types()
+        numeric: list = [f for f in self.fields if types.get(f) == "NUMERIC"]
+        geo: bool = types.get("location") == "GEO"
+
+        for values in rdr:
+            row: dict = {f: values[i] for f, i in columns}
+            if missing:
+                row.update(missing)
+            for field in numeric:
+                try:
+                    float(row[field])
+                except ValueError:
+                    del row[field]
+            if geo:
+                location: Optional[str] = self.location(row)
+                if location:
+                    row["location"] = location
+            yield self.redis_key(row), row
+
+    @staticmethod
+    def location(row: dict) -> Optional[str]:
+        """
+        Value of GEO field, "longitude,latitude"
+        Redis rejects the whole document when coordinates are out of its range,
+        so such rows are indexed without location
+        """
+        try:
+            latitude: float = float(row.get("latitude") or "nan")
+            longitude: float = float(row.get("longitude") or "nan")
+        except ValueError:
+            return None
+        if -180 <= longitude <= 180 and -85.05112878 <= latitude <= 85.05112878:
+            return f"{row['longitude']},{row['latitude']}"
+        return None
+
+    def read_chunks(self) -> Iterator[list]:
+        """
+        Streams csv file in chunks of max_allowed_commands rows
+        """
+        chunk: list = []
+        with open(self.file_path, mode="r", encoding="utf-8", newline="") as csvfile:
+            for item in self.read_rows(csvfile):
+                chunk.append(item)
+                if len(chunk) >= self.max_allowed_commands:
+                    yield chunk
+                    chunk = []
+        if chunk:
+            yield chunk
+
+    def fingerprint(self, mapping: dict) -> str:
+        """
+        Compact content hash of a row, used to find rows that changed upstream
+        """
+        content: str = "\x1f".join(str(mapping.get(f, "")) for f in self.fields)
+        return hashlib.blake2b(content.encode(), digest_size=8).hexdigest()
+
+    def suggestion(self, row: dict) -> Optional[Tuple[str, float]]:
+        """
+        Autocomplete string and weight for row, None when index has no suggestions
+        Fields used have to be listed in suggestion_fields
+        """
+        return None
+
+    async def flush(self, pipe: Redis) -> list:
+        """
+        Executes pipeline and records how long it took, per index
+        """
+        with pipeline_flush(self.index.name):
+            return await pipe.execute()
+
+    async def drop_suggestions(self, keys: list) -> None:
+        """
+        Reads rows that are about to be replaced or deleted, to remove their current suggestions
+        """
+        pipe: Redis = connection.pipeline(transaction=False)
+        for key in keys:
+            pipe.hmget(f"{self.key_prefix}{key}", *self.suggestion_fields)
+        rows: list = await self.flush(pipe)
+
+        pipe = connection.pipeline(transaction=False)
+        for values in rows:
+            if any(values):
+                suggestion = self.suggestion(dict(zip(self.suggestion_fields, values)))
+                if suggestion:
+                    pipe.execute_command("FT.SUGDEL", self.suggestions_key, suggestion[0])
+        await self.flush(pipe)
+
+    async def write_chunk(self, chunk: list) -> int:
+        if self.suggestions_key and self.syncing:
+            await self.drop_suggestions([key for key, _ in chunk])
+
+        pipe: Redis = connection.pipeline(transaction=False)
+        for key, mapping in chunk:
+            pipe.hset(f"{self.key_prefix}{key}", mapping=mapping)
+            suggestion = self.suggestion(mapping) if self.suggestions_key else None
+            if suggestion:
+                pipe.execute_command(
+                    "FT.SUGADD", self.suggestions_key, suggestion[0], suggestion[1], "PAYLOAD", key
+                )
+        if self.fingerprints_key:
+            pipe.hset(
+                self.fingerprints_key,
+                mapping={key: self.fingerprint(mapping) for key, mapping in chunk},
+            )
+        await self.flush(pipe)
+        return len(chunk)
+
+    async def write_chunks(self, chunks: Iterator[list]) -> int:
+        """
+        Producer parses csv chunks in a thread and puts them on a bounded queue
+        self.concurrency consumers write them with their own non transactional pipelines
+        So parsing overlaps with redis writes, while only a few chunks are held in memory
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency)
+        rows: int = 0
+
+        async def produce() -> None:
+            while True:
+                start: float = time.perf_counter()
+                chunk: Optional[list] = await asyncio.to_thread(next, chunks, None)
+                self.timings["parse"] += time.perf_counter() - start
+                if chunk is None:
+                    break
+                await queue.put(chunk)
+            for _ in range(self.concurrency):
+                await queue.put(None)
+
+        async def consume() -> None:
+            nonlocal rows
+            while (chunk := await queue.get()) is not None:
+                start: float = time.perf_counter()
+                rows += await self.write_chunk(chunk)
+                self.timings["write"] += time.perf_counter() - start
+
+        tasks: list = [asyncio.create_task(produce())] + [
+            asyncio.create_task(consume()) for _ in range(self.concurrency)
+        ]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        return rows
+
+    async def delete_keys(self, keys: list) -> int:
+        for i in range(0, len(keys), self.max_allowed_commands):
+            batch: list = keys[i : i + self.max_allowed_commands]
+            if self.suggestions_key:
+                await self.drop_suggestions(batch)
+            pipe: Redis = connection.pipeline(transaction=False)
+            pipe.unlink(*[f"{self.key_prefix}{key}" for key in batch])
+            if self.fingerprints_key:
+                pipe.hdel(self.fingerprints_key, *batch)
+            await self.flush(pipe)
+        return len(keys)
+
+    def build_report(self, start: float, added: int, changed: int = 0, removed: int = 0) -> dict:
+        seconds: float = time.perf_counter() - start
+        rows: int = added + changed
+        return {
+            "rows": rows,
+            "added": added,
+            "changed": changed,
+            "removed": removed,
+            "seconds": round(seconds, 2),
+            "rows_per_second": int(rows / seconds) if seconds else rows,
+            "timings": {stage: round(t, 2) for stage, t in self.timings.items()},
+        }
+
+    async def load_rows(self) -> dict:
+        """
+        Writes every row of csv file
+        Returns number of rows, total time and rows per second
+        """
+        start: float = time.perf_counter()
+        rows: int = await self.write_chunks(self.read_chunks())
+        await self.update_db_info()
+        return self.build_report(start, added=rows)
+
+    async def sync_rows(self) -> dict:
+        """
+        Compares every row with fingerprint stored by the previous load
+        Only added or changed rows are written and rows that disappeared upstream are deleted
+        """
+        start: float = time.perf_counter()
+        stored: dict = {}
+        async for key, value in connection.hscan_iter(
+            self.fingerprints_key, count=self.max_allowed_commands
+        ):
+            stored[key] = value
+
+        seen: set = set()
+        counts: dict = {"added": 0, "changed": 0}
+
+        def changed_chunks() -> Iterator[list]:
+            for chunk in self.read_chunks():
+                changed: list = []
+                for key, mapping in chunk:
+                    seen.add(key)
+                    previous: Optional[str] = stored.get(key)
+                    if previous is None:
+                        counts["added"] += 1
+                    elif previous != self.fingerprint(mapping):
+                        counts["changed"] += 1
+                    else:
+                        continue
+                    changed.append((key, mapping))
+                if changed:
+                    yield changed
+
+        await self.write_chunks(changed_chunks())
+        removed: int = await self.delete_keys([key for key in stored if key not in seen])
+        # Unchanged data keeps its revision, so cached responses, ETags and in process copies stay valid
+        await self.update_db_info(changed=bool(counts["added"] or counts["changed"] or removed))
+
+        return self.build_report(start, counts["added"], counts["changed"], removed)
+
+    async def get_generation(self) -> int:
+        """
+        Generation currently served by index alias, 0 if there is none yet
+        """
+        generation = await connection.hget(f"dbinfo:{self.index.name.lower()}", "generation")
+        return int(generation) if generation else 0
+
+    async def set_generation(self, generation: int) -> None:
+        """
+        Revision is bumped again, responses cached while the new generation was loading are of the old one
+        """
+        await connection.hset(
+            f"dbinfo:{self.index.name.lower()}",
+            mapping={"generation": generation, "schema": self.index.schema_digest()},
         )
+        await connection.hincrby(f"dbinfo:{self.index.name.lower()}", "revision", 1)
+
+    async def schema_changed(self) -> bool:
+        schema = await connection.hget(f"dbinfo:{self.index.name.lower()}", "schema")
+        return schema != self.index.schema_digest()
 
-        if can_be_updated:
-            await self.download_file()
-            commands: int = 0
+    async def next_generation(self) -> int:
+        """
+        Counter is never reused, so a load that was interrupted cannot clash with the next one
+        """
+        return await connection.hincrby(
+            f"dbinfo:{self.index.name.lower()}", "next_generation", 1
+        )
 
-            with open(self.file_path, mode="r", encoding="utf-8") as csvfile:
-                rdr = csv.DictReader(csvfile)
+    @property
+    def retired_key(self) -> str:
+        return f"dbinfo:{self.index.name.lower()}:retired"
 
-                for row in rdr:
-                    row = self.model(**row)
+    async def retire_generation(self, generation: int) -> None:
+        await connection.zadd(self.retired_key, {generation: time.time()})
 
-                    await self.pipeline.hmset(
-                        self.redis_key(row),
-                        mapping=row.dict(),
-                    )
-                    commands += 1
+    async def drop_retired(self) -> list:
+        """
+        Drops generations replaced more than retire_after seconds ago, returns their numbers
+        """
+        expired: list = await connection.zrangebyscore(self.retired_key, 0, time.time() - self.retire_after)
+        for generation in expired:
+            await self.index.drop_generation(int(generation))
+            await connection.zrem(self.retired_key, generation)
+        return [int(generation) for generation in expired]
 
-                    if commands >= self.max_allowed_commands:
-                        self.pipeline = await self.update_db_info(pipe=self.pipeline)
-                        await self.pipeline.execute()
-                        commands = 0
+    async def update_db(self, full: bool = False) -> dict:
+        """
+        Loads data into a new generation of index and keys, e.g. "cities_v42" with "cities:v42:city:..." keys
+        Alias self.index.name is then switched to it, so lookups never see half updated data
+        Previous generation is retired after the switch, exports may still be reading it through a cursor,
+        it is dropped by a later run once retire_after has passed
 
-            if len(self.pipeline) > 0:
-                self.pipeline = await self.update_db_info(pipe=self.pipeline)
-                await self.pipeline.execute()
-            return f"Database updated - {self.file_name}"
-        else:
+        If a generation with fingerprints and the same schema is already being served,
+        only the differences are synced into it, unless full is set
+        """
+        await self.drop_retired()
+        if not await self.set_time_has_lapsed():
             raise WithinSetTime
 
-    async def download_file(self) -> None:
-        self.file_name: str = os.path.basename(self.url)
-        self.file_path: str = os.path.realpath(self.base_dir + self.file_name)
-
-        async with aiohttp.ClientSession() as session:
-            async with aiofiles.open(self.file_path, mode="wb") as f:
-                async with session.get(self.url) as resp:
-                    async for chunk in resp.content.iter_chunked(1024 * 1024):
-                        await f.write(chunk)
-                return f"Downloaded - {self.file_name}"
+        await self.download_file()
+
+        fingerprints_key: str = f"dbinfo:{self.index.name.lower()}:fingerprints"
+        suggestions_key: str = self.index.suggestions_key if self.suggestion_fields else ""
+        previous: int = await self.get_generation()
+        # Delta sync needs fingerprints and suggestions of the served generation
+        required: list = [key for key in (fingerprints_key, suggestions_key) if key]
+        can_sync: bool = await connection.exists(*required) == len(required)
+
+        if previous and not full and can_sync and not await self.schema_changed():
+            self.key_prefix = self.index.generation_prefix(previous)
+            self.fingerprints_key = fingerprints_key
+            self.suggestions_key = suggestions_key
+            self.syncing = True
+            report: dict = await self.sync_rows()
+            report["generation"] = previous
+            return report
+
+        generation: int = await self.next_generation()
+        await self.index.create_generation(generation)
+        self.key_prefix = self.index.generation_prefix(generation)
+        self.fingerprints_key = f"{fingerprints_key}:v{generation}"
+        self.suggestions_key = f"{suggestions_key}:v{generation}" if suggestions_key else ""
+
+        try:
+            report: dict = await self.load_rows()
+        except BaseException:
+            await self.index.drop_generation(generation)
+            await connection.unlink(self.fingerprints_key)
+            if self.suggestions_key:
+                await connection.unlink(self.suggestions_key)
+            raise
+
+        legacy: bool = await self.index.is_legacy()
+        await self.index.swap_alias(generation, legacy)
+        await self.set_generation(generation)
+        if report["rows"]:
+            await connection.rename(self.fingerprints_key, fingerprints_key)
+            if self.suggestions_key:
+                await connection.rename(self.suggestions_key, suggestions_key)
+
+        if previous:
+            await self.retire_generation(previous)
+        if legacy:
+            await self.index.drop_keys(self.index.prefix)
+
+        report["generation"] = generation
+        return report
+
+    @property
+    def meta_path(self) -> str:
+        return f"{self.file_path}.meta.json"
+
+    def read_meta(self) -> dict:
+        try:
+            with open(self.meta_path, mode="r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def write_meta(self, meta: dict) -> None:
+        with open(self.meta_path, mode="w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+    @staticmethod
+    def checksum(path: str) -> Optional[str]:
+        digest = hashlib.sha256()
+        try:
+            with open(path, mode="rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(block)
+        except FileNotFoundError:
+            return None
+        return digest.hexdigest()
+
+    async def download_file(self, session: Optional[aiohttp.ClientSession] = None) -> str:
+        """
+        Concurrent downloads of the same url share one request, managers with the same url share the file
+        e.g. countries.csv is used by both ManageCountries and ManageTimezones
+        Finished downloads are forgotten, a later call checks the file again with a conditional request
+        """
+        task: Optional[asyncio.Future] = RedisDBBase.downloads.get(self.url)
+        if task is None:
+            task = asyncio.ensure_future(self.fetch_file(session))
+            RedisDBBase.downloads[self.url] = task
+            task.add_done_callback(lambda t: self.download_done(self.url, t))
+        return await asyncio.shield(task)
+
+    @staticmethod
+    def download_done(url: str, task: asyncio.Future) -> None:
+        if RedisDBBase.downloads.get(url) is task:
+            del RedisDBBase.downloads[url]
+        # Marks exception as retrieved, when every caller has been cancelled nobody else reads it
+        if not task.cancelled():
+            task.exception()
+
+    async def fetch_file(self, session: Optional[aiohttp.ClientSession] = None) -> str:
+        """
+        Skips download with a conditional request if local file is unchanged and matches stored checksum
+        Interrupted downloads are resumed with a range request
+        """
+        if session is None:
+            async with aiohttp.ClientSession() as session:
+                return await self.fetch_file(session)
+
+        meta: dict = self.read_meta()
+        part_path: str = f"{self.file_path}.part"
+        headers: dict = {}
+
+        if meta.get("sha256") and meta.get("sha256") == await asyncio.to_thread(
+            self.checksum, self.file_path
+        ):
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        offset: int = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if offset and meta.get("partial"):
+            # Offset is counted in decoded bytes, so ask for the identity encoding
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = meta["partial"]
+            headers["Accept-Encoding"] = "identity"
+
+        async with session.get(self.url, headers=headers) as resp:
+            if resp.status == 304:
+                return f"Not modified - {self.file_name}"
+            resp.raise_for_status()
+
+            validator: Optional[str] = resp.headers.get("ETag") or resp.headers.get("Last-Modified")
+            meta["partial"] = validator
+            self.write_meta(meta)
+
+            resumed: bool = resp.status == 206
+            async with aiofiles.open(part_path, mode="ab" if resumed else "wb") as f:
+                async for chunk in resp.content.iter_chunked(1024 * 1024):
+                    await f.write(chunk)
+
+            expected_size: Optional[str] = (
+                resp.headers.get("Content-Range", "").rpartition("/")[2]
+                if resumed
+                else resp.headers.get("Content-Length")
+            )
+            if (
+                not resp.headers.get("Content-Encoding")
+                and expected_size
+                and expected_size.isdigit()
+                and os.path.getsize(part_path) != int(expected_size)
+            ):
+                raise aiohttp.ClientPayloadError(f"Incomplete download - {self.file_name}")
+
+            os.replace(part_path, self.file_path)
+            self.write_meta(
+                {
+                    "url": self.url,
+                    "etag": resp.headers.get("ETag"),
+                    "last_modified": resp.headers.get("Last-Modified"),
+                    "sha256": await asyncio.to_thread(self.checksum, self.file_path),
+                }
+            )
+
+            return f"{'Resumed' if resumed else 'Downloaded'} - {self.file_name}"
 
 
 class ManageCountries(RedisDBBase):
@@ -127,9 +617,13 @@ class ManageCountries(RedisDBBase):
     url: str = "https://raw.githubusercontent.com/dr5hn/countries-states-cities-database/master/csv/countries.csv"
     index = CountryIndex()
     model = Country
+    suggestion_fields: tuple = ("name", "iso2")
 
     def redis_key(self, row):
-        return f"{self.index.prefix}{row.id}"
+        return f"{self.index.prefix}{row['id']}"
+
+    def suggestion(self, row: dict) -> Optional[Tuple[str, float]]:
+        return row["name"], self.suggestion_priority.get(row["iso2"], 1.0)
 
 
 class ManageStates(RedisDBBase):
@@ -143,17 +637,27 @@ class ManageStates(RedisDBBase):
     model = State
 
     def redis_key(self, row):
-        return f"{self.index.prefix}{row.id}:country:{row.country_id}"
+        return f"{self.index.prefix}{row['id']}:country:{row['country_id']}"
 
 
 class ManageCities(RedisDBBase):
     url: str = "https://raw.githubusercontent.com/dr5hn/countries-states-cities-database/master/csv/cities.csv"
     index = CityIndex()
     model = City
+    suggestion_fields: tuple = ("name", "state_name", "country_name", "country_code")
 
     def redis_key(self, row):
         return (
-            f"{self.index.prefix}{row.id}:state:{row.state_id}:country:{row.country_id}"
+            f"{self.index.prefix}{row['id']}:state:{row['state_id']}:country:{row['country_id']}"
+        )
+
+    def suggestion(self, row: dict) -> Optional[Tuple[str, float]]:
+        """
+        State and country are part of the string, so that cities with the same name get separate entries
+        """
+        return (
+            f"{row['name']}, {row['state_name']}, {row['country_name']}",
+            self.suggestion_priority.get(row["country_code"], 1.0),
         )
 
 
@@ -170,62 +674,36 @@ class ManageTimezones(RedisDBBase):
     model = TimeZone
 
     def redis_key(self, row):
-        return f"{self.index.prefix}{row.id}:country:{row.country_id}"
+        return f"{self.index.prefix}{row['id']}:country:{row['country_id']}"
 
-    async def update_db(self) -> None:
+    def read_rows(self, csvfile) -> Iterator[Tuple[str, dict]]:
         re_ptrn: re.Pattern = re.compile(
             r"zoneName:(?P<zone_name>[^(,)]+),gmtOffset:(?P<gmt_offset>[^(,)]+),gmtOffsetName:(?P<gmt_offset_name>[^(,)]+),abbreviation:(?P<abbreviation>[^(,)]+),tzName:(?P<tz_name>[^(})]+)"
         )
 
-        can_be_updated: bool = all(
-            [
-                await self.index.index_exists(),
-                await self.set_time_has_lapsed(),
-            ]
-        )
+        rdr: csv.DictReader = csv.DictReader(csvfile)
+        self.check_schema(rdr.fieldnames, ["id", "name", "timezones", "emoji"])
+        id_counter: int = 0
 
-        if can_be_updated:
-            await self.download_file()
-            commands: int = 0
-
-            with open(self.file_path, mode="r", encoding="utf-8") as csvfile:
-                rdr: csv.DictReader = csv.DictReader(csvfile)
-                id_counter: int = 0
-
-                for row in rdr:
-                    all_zones: list = re.findall(r"\{.+?\}", row.get("timezones"))
-
-                    for zone in all_zones:
-                        m = re_ptrn.search(zone)
-                        id_counter += 1
-                        tz = self.model()
-                        tz.id = id_counter
-                        tz.zone_name = (
-                            m.group("zone_name").replace("\\", "").replace("'", "")
-                        )
-                        tz.gmt_offset = m.group("gmt_offset").replace("'", "")
-                        tz.gmt_offset_name = m.group("gmt_offset_name").replace("'", "")
-                        tz.abbreviation = m.group("abbreviation").replace("'", "")
-                        tz.tz_name = m.group("tz_name").replace("'", "")
-                        tz.country_id = row.get("id")
-                        tz.country_name = row.get("name")
-                        tz.emoji = row.get("emoji")
-
-                        await self.pipeline.hmset(
-                            self.redis_key(tz),
-                            mapping=tz.dict(),
-                        )
-                        commands += 1
-
-                    self.pipeline = await self.update_db_info(pipe=self.pipeline)
-                    await self.pipeline.execute()
-                    commands = 0
-
-            if len(self.pipeline) > 0:
-                self.pipeline = await self.update_db_info(pipe=self.pipeline)
-                await self.pipeline.execute()
-        else:
-            raise WithinSetTime
+        for row in rdr:
+            all_zones: list = re.findall(r"\{.+?\}", row.get("timezones"))
+
+            for zone in all_zones:
+                m = re_ptrn.search(zone)
+                id_counter += 1
+                tz: dict = {
+                    "id": str(id_counter),
+                    "zone_name": m.group("zone_name").replace("\\", "").replace("'", ""),
+                    "gmt_offset": m.group("gmt_offset").replace("'", ""),
+                    "gmt_offset_name": m.group("gmt_offset_name").replace("'", ""),
+                    "abbreviation": m.group("abbreviation").replace("'", ""),
+                    "tz_name": m.group("tz_name").replace("'", ""),
+                    "country_id": row.get("id"),
+                    "country_name": row.get("name"),
+                    "emoji": row.get("emoji"),
+                }
+
+                yield self.redis_key(tz), tz
 
 
 def humanized_delta(timestamp: int) -> str:
@@ -244,14 +722,16 @@ async def build_db_info() -> dict:
     for index in indexes:
         i: dict = await connection.ft(index).info() if r else {}
 
+        # Generations are named like "cities_v42", db info is kept per alias
+        alias: str = re.sub(r"_v\d+$", "", index)
         last_db_update_epoch: list = (
-            await connection.hmget(f"dbinfo:{index}", "last_updated") if r else ["0"]
+            await connection.hmget(f"dbinfo:{alias}", "last_updated") if r else ["0"]
         )
         index_info.append(
             {
                 "index_name": index,
                 "number_of_records": i.get("num_docs", ""),
-                "last_updated": f"{humanized_delta(int(last_db_update_epoch[0]))}",
+                "last_updated": f"{humanized_delta(int(last_db_update_epoch[0] or 0))}",
             }
         )
 
@@ -265,3 +745,36 @@ async def build_db_info() -> dict:
     }
 
     return result
+
+
+async def populate_indexes(managers: list, full: bool = False) -> list:
+    """
+    Runs all managers on one event loop
+    Files are downloaded concurrently with a shared session, then indexes are loaded in parallel
+    Returns report or exception for every manager, in the same order
+    """
+    due: list = [await m.set_time_has_lapsed() for m in managers]
+
+    async def download(manager: RedisDBBase, session: aiohttp.ClientSession) -> None:
+        start: float = time.perf_counter()
+        await manager.download_file(session)
+        manager.timings["download"] += time.perf_counter() - start
+
+    async def load(manager: RedisDBBase) -> dict:
+        report: dict = await manager.update_db(full=full)
+        report["records"] = await manager.get_index_info()
+        return report
+
+    downloading: list = [m for m, is_due in zip(managers, due) if is_due]
+    async with aiohttp.ClientSession() as session:
+        downloaded: list = await asyncio.gather(
+            *[download(m, session) for m in downloading], return_exceptions=True
+        )
+    # A manager whose file could not be downloaded is not loaded, its report is the download error
+    failed: dict = {id(m): e for m, e in zip(downloading, downloaded) if isinstance(e, BaseException)}
+
+    loading: list = [m for m in managers if id(m) not in failed]
+    loaded: dict = dict(
+        zip(map(id, loading), await asyncio.gather(*[load(m) for m in loading], return_exceptions=True))
+    )
+    return [failed[id(m)] if id(m) in failed else loaded[id(m)] for m in managers]
@@ -0,0 +1,160 @@
+import os
+import time
+import redis.asyncio as redis
+from typing import Optional
+from redis.asyncio.connection import BlockingConnectionPool
+from redis.asyncio.retry import Retry
+from redis.backoff import ExponentialBackoff
+from redis.exceptions import ConnectionError
+from metrics import redis_command
+
+redis_host: str = os.getenv("REDIS_HOST", "localhost")
+redis_port: int = int(os.getenv("REDIS_PORT", "6379"))
+redis_max_connections: int = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+redis_pool_timeout: float = float(os.getenv("REDIS_POOL_TIMEOUT", "5"))
+redis_socket_timeout: float = float(os.getenv("REDIS_SOCKET_TIMEOUT", "5"))
+redis_connect_timeout: float = float(os.getenv("REDIS_CONNECT_TIMEOUT", "5"))
+redis_health_check_interval: int = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30"))
+redis_retries: int = int(os.getenv("REDIS_RETRIES", "3"))
+redis_retry_on_timeout: bool = os.getenv("REDIS_RETRY_ON_TIMEOUT", "true").lower() == "true"
+
+
+class MeteredConnectionPool(BlockingConnectionPool):
+    """
+    Blocking pool never opens more than max_connections, requests wait up to timeout for a free one
+    Counts how often and how long requests waited, to tell when the pool is too small
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.acquired: int = 0
+        self.timeouts: int = 0
+        self.waiting: int = 0
+        self.peak_in_use: int = 0
+        self.acquire_seconds: float = 0.0
+
+    def in_use(self) -> int:
+        return self.max_connections - self.pool.qsize()
+
+    async def get_connection(self, command_name, *keys, **options):
+        start: float = time.perf_counter()
+        self.waiting += 1
+        try:
+            connection = await super().get_connection(command_name, *keys, **options)
+        except ConnectionError as e:
+            if str(e) == "No connection available.":
+                self.timeouts += 1
+            raise
+        finally:
+            self.waiting -= 1
+            self.acquire_seconds += time.perf_counter() - start
+
+        self.acquired += 1
+        self.peak_in_use = max(self.peak_in_use, self.in_use())
+        return connection
+
+    def info(self) -> dict:
+        return {
+            "max_connections": self.max_connections,
+            "created": len(self._connections),
+            "in_use": self.in_use(),
+            "peak_in_use": self.peak_in_use,
+            "waiting": self.waiting,
+            "acquired": self.acquired,
+            "timeouts": self.timeouts,
+            "avg_acquire_ms": round(self.acquire_seconds / self.acquired * 1000, 3) if self.acquired else 0.0,
+        }
+
+
+class MeteredRedis(redis.Redis):
+    """
+    Times every command by name, e.g. FT.SEARCH or HGET
+    Pipelines are timed as a whole where they are executed
+    """
+
+    async def execute_command(self, *args, **options):
+        with redis_command(str(args[0]).upper()):
+            return await super().execute_command(*args, **options)
+
+
+class RedisManager:
+    """
+    Owns the redis client of a process
+    Client is created on first use or on app startup, and closed on app shutdown,
+    so that every gunicorn worker gets its own bounded pool on its own event loop
+    """
+
+    def __init__(self) -> None:
+        self._client: Optional[redis.Redis] = None
+        self._raw_client: Optional[redis.Redis] = None
+
+    def create_pool(self, decode_responses: bool = True) -> MeteredConnectionPool:
+        return MeteredConnectionPool(
+            host=redis_host,
+            port=redis_port,
+            decode_responses=decode_responses,
+            max_connections=redis_max_connections,
+            timeout=redis_pool_timeout,
+            socket_timeout=redis_socket_timeout,
+            socket_connect_timeout=redis_connect_timeout,
+            socket_keepalive=True,
+            health_check_interval=redis_health_check_interval,
+            retry_on_timeout=redis_retry_on_timeout,
+            retry=Retry(ExponentialBackoff(cap=1, base=0.05), redis_retries),
+        )
+
+    @property
+    def client(self) -> redis.Redis:
+        if self._client is None:
+            self._client = MeteredRedis(connection_pool=self.create_pool())
+        return self._client
+
+    @property
+    def raw_client(self) -> redis.Redis:
+        """
+        Client whose replies are bytes, for callers that decode only what they need
+        hiredis decodes whole replies when the pool decodes responses, so it needs its own pool
+        """
+        if self._raw_client is None:
+            self._raw_client = MeteredRedis(connection_pool=self.create_pool(decode_responses=False))
+        return self._raw_client
+
+    async def open(self) -> redis.Redis:
+        return self.client
+
+    async def close(self) -> None:
+        for client in (self._client, self._raw_client):
+            if client is not None:
+                await client.close()
+                await client.connection_pool.disconnect()
+        self._client = self._raw_client = None
+
+    def info(self) -> dict:
+        """
+        Usage of the main pool, with the pool of raw_client under "raw" once it has been created
+        """
+        if self._client is None:
+            info: dict = {"max_connections": redis_max_connections}
+        else:
+            info = self._client.connection_pool.info()
+        if self._raw_client is not None:
+            info["raw"] = self._raw_client.connection_pool.info()
+        return info
+
+
+class ConnectionProxy:
+    """
+    Stands in for the redis client, so modules can import connection before the client exists
+    """
+
+    def __init__(self, manager: RedisManager, client: str = "client") -> None:
+        self._manager = manager
+        self._client = client
+
+    def __getattr__(self, name: str):
+        return getattr(getattr(self._manager, self._client), name)
+
+
+redis_manager: RedisManager = RedisManager()
+connection: redis.Redis = ConnectionProxy(redis_manager)
+raw_connection: redis.Redis = ConnectionProxy(redis_manager, "raw_client")
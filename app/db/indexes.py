@@ -1,13 +1,61 @@
+import asyncio
+import hashlib
 import os
-import redis.asyncio as redis
-from redis.exceptions import ConnectionError, ResponseError
-from redis.commands.search.field import NumericField, TextField
+import re
+import time
+from redis.exceptions import RedisError, ResponseError
+from typing import AsyncIterator, Optional
+from redis.commands.search.aggregation import AggregateRequest, Asc
+from redis.commands.search.field import Field, GeoField, NumericField, TagField, TextField
 from redis.commands.search.indexDefinition import IndexDefinition, IndexType
 from redis.commands.search.query import Query
+from cache.singleflight import SingleFlight
+from metrics import stage
 
-redis_host: str = os.getenv("REDIS_HOST", "localhost")
-redis_port: int = int(os.getenv("REDIS_PORT", "6379"))
-connection: redis.Redis = redis.Redis(host=redis_host, port=redis_port, decode_responses=True)
+from .connection import connection, raw_connection
+
+# Cursors of exports that were aborted are deleted in background, references keep tasks alive until done
+cursor_cleanups: set = set()
+
+# Search replies are read as bytes and only returned fields are decoded, see parse_search_reply
+search_raw_replies: bool = os.getenv("SEARCH_RAW_REPLIES", "false").lower() == "true"
+# Identical searches running at the same time in a worker share one FT.SEARCH
+search_flights: SingleFlight = SingleFlight("search", use_redis_lock=False)
+
+
+def parse_search_reply(reply: list, fields: list, document_id) -> list:
+    """
+    Builds records straight from a FT.SEARCH reply: total, then key and [field, value, ...] of every document
+    Field names are compared as bytes and only fields listed are decoded, without redis-py Document objects
+    Records have the same keys as with decoded replies, in fields order with None for missing fields
+    Every distinct value is decoded once per reply, records share strings like country or state names
+    """
+    wanted: dict = {f.encode(): f for f in fields}
+    decoded: dict = {}
+    records: list = []
+    for i in range(1, len(reply) - 1, 2):
+        key = reply[i]
+        values = reply[i + 1] or ()
+        record: dict = dict.fromkeys(fields)
+        for j in range(0, len(values) - 1, 2):
+            name = values[j]
+            field = wanted.get(name if isinstance(name, bytes) else name.encode())
+            if field is not None:
+                value = values[j + 1]
+                text = decoded.get(value)
+                if text is None:
+                    text = decoded[value] = value.decode() if isinstance(value, bytes) else value
+                record[field] = text
+        record["id"] = document_id(key.decode() if isinstance(key, bytes) else key)
+        records.append(record)
+    return records
+
+
+def escape_tag(value: str) -> str:
+    """
+    Punctuation and spaces separate tags in queries, so they have to be escaped
+    """
+    return re.sub(r"([^\w])", r"\\\1", value)
 
 
 class RedisIndex:
@@ -15,6 +63,10 @@ class RedisIndex:
     Base class for managing indexes
     
     """
+
+    # Term frequencies are not used for ranking short names and codes, dropping them shrinks the index
+    index_options: dict = {"no_term_frequencies": True}
+
     def __init__(self) -> None:
         self.schema = self.schema
         self.name = self.name
@@ -28,43 +80,309 @@ class RedisIndex:
         """
         Does not return "as_name"
         At the moment, no field is implemented with as_name
+        GEO fields are built by loaders from latitude and longitude, so they are not part of records
         """
         fields = []
         for s in self.schema:
-            fields.append(s.name)
+            if s.args[0] != Field.GEO:
+                fields.append(s.name)
         return fields
 
-    async def index_exists(self) -> bool:
+    def field_types(self) -> dict:
+        """
+        Maps field names to TEXT, TAG, NUMERIC or GEO
+        """
+        return {s.name: s.args[0] for s in self.schema}
+
+    def schema_digest(self) -> str:
+        """
+        Changes whenever schema changes, so loaders know that a full reload is needed
+        """
+        fields: str = repr(
+            [[s.name, *s.args, *s.args_suffix] for s in self.schema] + sorted(self.index_options.items())
+        )
+        return hashlib.blake2b(fields.encode(), digest_size=8).hexdigest()
+
+    def get_sortable_fields(self) -> list:
+        return [s.name for s in self.schema if Field.SORTABLE in s.args_suffix]
+
+    def generation_name(self, generation: int) -> str:
+        return f"{self.name}_v{generation}"
+
+    def generation_prefix(self, generation: int) -> str:
+        """
+        Prepended to keys of a generation, e.g. "cities:v42:city:1:state:2:country:3"
+        """
+        return f"{self.name}:v{generation}:"
+
+    def document_id(self, key: str) -> str:
         """
-        Checks and creates redis index if not already present
+        Strips generation prefix, so that ids do not change between reloads
+        """
+        if key.startswith(f"{self.name}:v"):
+            return key.split(":", 2)[2]
+        return key
+
+    async def is_legacy(self) -> bool:
+        """
+        Indexes created before generations were introduced are named self.name instead of being aliased
         """
         try:
-            await connection.ft(index_name=self.name).info()
-            return True
+            info: dict = await connection.ft(index_name=self.name).info()
         except ResponseError:
-            await connection.ft(index_name=self.name).create_index(
-                self.schema,
-                definition=self.definition,
-            )
-            return True
-        except ConnectionError:
             return False
+        return info.get("index_name") == self.name
+
+    async def create_generation(self, generation: int) -> None:
+        await connection.ft(index_name=self.generation_name(generation)).create_index(
+            self.schema,
+            definition=IndexDefinition(
+                prefix=[f"{self.generation_prefix(generation)}{self.prefix}"],
+                index_type=IndexType.HASH,
+            ),
+            **self.index_options,
+        )
+
+    async def swap_alias(self, generation: int, legacy: bool = False) -> None:
+        """
+        Atomically points self.name at the given generation
+        A legacy index has to be dropped before an alias can take its name,
+        both run in one transaction so that self.name resolves at every point
+        """
+        if not legacy:
+            await connection.ft(index_name=self.generation_name(generation)).aliasupdate(self.name)
+            return
+        pipe = connection.pipeline(transaction=True)
+        pipe.execute_command("FT.DROPINDEX", self.name)
+        pipe.execute_command("FT.ALIASUPDATE", self.name, self.generation_name(generation))
+        await pipe.execute()
+
+    async def drop_generation(self, generation: int) -> None:
+        try:
+            await connection.ft(index_name=self.generation_name(generation)).dropindex(
+                delete_documents=False
+            )
+        except ResponseError:
+            pass
+        await self.drop_keys(self.generation_prefix(generation))
+
+    async def drop_keys(self, prefix: str, count: int = 1000) -> int:
+        """
+        Deletes keys in batches with UNLINK, so redis frees memory in background
+        """
+        deleted: int = 0
+        keys: list = []
+        async for key in connection.scan_iter(match=f"{prefix}*", count=count):
+            keys.append(key)
+            if len(keys) >= count:
+                deleted += await connection.unlink(*keys)
+                keys = []
+        if keys:
+            deleted += await connection.unlink(*keys)
+        return deleted
+
+    async def nearby(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_km: float,
+        limit: int = 10,
+        return_fields: Optional[list] = None,
+    ) -> dict:
+        """
+        Documents within radius_km of a point, nearest first, using GEO field "location"
+        Sorting with MAX keeps only the nearest limit documents instead of sorting all matches
+        """
+        fields: list = [f for f in (return_fields or self.get_field_names()) if f != "id"]
+        req: AggregateRequest = (
+            AggregateRequest(f"@location:[{longitude} {latitude} {radius_km} km]")
+            .load("@__key", "@location", *[f"@{f}" for f in fields])
+            .apply(distance=f"geodistance(@location, {longitude}, {latitude})")
+            .sort_by(Asc("@distance"), max=limit)
+            .limit(0, limit)
+        )
+
+        r = await connection.ft(self.name).aggregate(req)
+
+        records: list = []
+        for row in r.rows:
+            doc: dict = dict(zip(row[::2], row[1::2]))
+            records.append(
+                {field: doc.get(field) for field in fields}
+                | {
+                    "id": self.document_id(doc["__key"]),
+                    "distance_km": round(float(doc["distance"]) / 1000, 3),
+                }
+            )
+
+        return {"total": len(records), "records": records}
+
+    def filter_query(self, filters: dict) -> str:
+        """
+        Matches documents whose tag fields equal all given values, e.g. {"country_code": "IN"}, or all documents
+        """
+        clauses: list = [f"@{field}:{{{escape_tag(value)}}}" for field, value in filters.items() if value]
+        return " ".join(clauses) or "*"
+
+    async def export(
+        self,
+        filters: dict,
+        return_fields: Optional[list] = None,
+        batch_size: int = 1000,
+        max_idle: int = 300000,
+    ) -> AsyncIterator[list]:
+        """
+        Yields every matching document, batch_size records at a time, read through an aggregation cursor
+        Next batch is read only when the caller asks for it, so memory does not grow with the number of documents
+        Cursor expires in redis if the caller does not come back within max_idle milliseconds,
+        and it is deleted right away if the caller stops early
+        """
+        fields: list = [f for f in (return_fields or self.get_field_names()) if f != "id"]
+        req: AggregateRequest = AggregateRequest(self.filter_query(filters)).load(
+            "@__key", *[f"@{f}" for f in fields]
+        )
+        reply: list = await connection.execute_command(
+            "FT.AGGREGATE", self.name, *req.build_args(),
+            "WITHCURSOR", "COUNT", batch_size, "MAXIDLE", max_idle,
+        )
+        cursor: int = 0
+        try:
+            while True:
+                rows, cursor = reply
+                batch: list = []
+                for row in rows[1:]:
+                    doc: dict = dict(zip(row[::2], row[1::2]))
+                    batch.append({"id": self.document_id(doc["__key"])} | {f: doc.get(f) for f in fields})
+                if batch:
+                    yield batch
+                if not cursor:
+                    break
+                reply = await connection.execute_command(
+                    "FT.CURSOR", "READ", self.name, cursor, "COUNT", batch_size
+                )
+        finally:
+            if cursor:
+                task = asyncio.get_running_loop().create_task(self.delete_cursor(cursor))
+                cursor_cleanups.add(task)
+                task.add_done_callback(cursor_cleanups.discard)
 
-    async def search(self, qs: str, query_type: str) -> list:
+    async def delete_cursor(self, cursor: int) -> None:
+        try:
+            await connection.execute_command("FT.CURSOR", "DEL", self.name, cursor)
+        except RedisError:
+            pass
+
+    @property
+    def suggestions_key(self) -> str:
         """
+        Autocomplete dictionary, populated by index managers that define suggestion()
         """
+        return f"sug:{self.name}"
 
-        fields: list = self.get_field_names()
-        q: Query = Query(f"{qs}")
+    async def suggest(self, prefix: str, fuzzy: bool = False, limit: int = 10) -> dict:
+        suggestions: list = await connection.ft(self.name).sugget(
+            self.suggestions_key,
+            prefix,
+            fuzzy=fuzzy,
+            num=limit,
+            with_scores=True,
+            with_payloads=True,
+        )
+
+        return {
+            "total": len(suggestions),
+            "records": [
+                {"id": s.payload, "name": s.string, "score": s.score} for s in suggestions
+            ],
+        }
 
+    def query_string(self, qs: str, query_type: str, fields: Optional[list] = None) -> str:
+        """
+        Text fields are matched by terms, tag fields by exact or prefix match of the whole value
+        and numeric fields only when query is a number
+        Fuzzy matching is not supported by tags, so fuzzy queries only search text fields
+        """
+        term: str = qs
+        tag: str = escape_tag(qs)
         if query_type == "wildcard":
-            q = Query(f"{qs}*")
+            term = f"{qs}*"
+            tag = f"{tag}*"
         if query_type == "fuzzy":
-            q = Query(f"%{qs}%")
+            term = f"%{qs}%"
+            tag = ""
+
+        types: dict = self.field_types()
+        clauses: list = []
+        if fields:
+            text: list = [f for f in fields if types[f] == Field.TEXT]
+            if text:
+                clauses.append(f"@{'|'.join(text)}:({term})")
+        else:
+            clauses.append(f"({term})")
+            fields = [f for f, t in types.items() if t == Field.TAG]
 
-        r = await connection.ft(self.name).search(q)
+        for field in fields:
+            if types[field] == Field.TAG and tag:
+                clauses.append(f"@{field}:{{{tag}}}")
+            if types[field] == Field.NUMERIC and query_type == "exact":
+                try:
+                    clauses.append(f"@{field}:[{float(qs)} {float(qs)}]")
+                except ValueError:
+                    pass
 
-        d = [{field: getattr(doc, field) for field in fields} for doc in r.docs]
+        return "|".join(clauses)
+
+    async def search(
+        self,
+        qs: str,
+        query_type: str,
+        fields: Optional[list] = None,
+        offset: int = 0,
+        limit: int = 10,
+        sort_by: Optional[str] = None,
+        sort_asc: bool = True,
+        return_fields: Optional[list] = None,
+    ) -> list:
+        """
+        fields limits search to given fields, text and tag fields are searched by default
+        return_fields limits fields fetched from redis, "id" is always returned
+        sort_by has to be a sortable field, results are ordered by relevance by default
+        """
+
+        query_string: str = self.query_string(qs, query_type, fields)
+        if not query_string:
+            return {"total": 0, "duration": 0, "records": []}
+
+        q: Query = Query(query_string)
+
+        q.paging(offset, limit)
+        if sort_by:
+            q.sort_by(sort_by, asc=sort_asc)
+        if return_fields:
+            q.return_fields(*return_fields)
+
+        fields = [f for f in (return_fields or self.get_field_names()) if f != "id"]
+        # Result is shared by all callers of the same query, they must not modify it
+        return await search_flights.do((self.name, *q.get_args()), lambda: self.run_search(q, fields))
+
+    async def run_search(self, q: Query, fields: list) -> dict:
+        if search_raw_replies:
+            start: float = time.perf_counter()
+            with stage("search.redis"):
+                reply: list = await raw_connection.execute_command("FT.SEARCH", self.name, *q.get_args())
+            with stage("search.records"):
+                d = parse_search_reply(reply, fields, self.document_id)
+            return {"total": reply[0], "duration": (time.perf_counter() - start) * 1000, "records": d}
+
+        # search.redis is the FT.SEARCH round trip plus decoding of the reply into documents
+        with stage("search.redis"):
+            r = await connection.ft(self.name).search(q)
+
+        with stage("search.records"):
+            d = [
+                {field: getattr(doc, field, None) for field in fields} | {"id": self.document_id(doc.id)}
+                for doc in r.docs
+            ]
 
         result = {
             "total" : r.total,
@@ -78,24 +396,25 @@ class RedisIndex:
 class CountryIndex(RedisIndex):
 
     schema = (
-        TextField("id"),
-        TextField("name"),
-        TextField("iso3"),
-        TextField("iso2"),
-        TextField("phone_code"),
-        TextField("numeric_code"),
-        TextField("capital"),
-        TextField("currency"),
+        TagField("id"),
+        TextField("name", sortable=True, no_stem=True),
+        TagField("iso3"),
+        TagField("iso2"),
+        TagField("phone_code"),
+        TagField("numeric_code"),
+        TextField("capital", no_stem=True),
+        TagField("currency"),
         TextField("currency_name"),
-        TextField("currency_symbol"),
-        TextField("tld"),
-        TextField("native"),
-        TextField("region"),
-        TextField("subregion"),
-        TextField("emoji"),
-        TextField("emojiU"),
-        TextField("latitude"),
-        TextField("longitude"),
+        TagField("currency_symbol"),
+        TagField("tld"),
+        TextField("native", no_stem=True),
+        TextField("region", sortable=True, no_stem=True),
+        TextField("subregion", sortable=True, no_stem=True),
+        TagField("emoji"),
+        TagField("emojiU"),
+        NumericField("latitude"),
+        NumericField("longitude"),
+        GeoField("location"),
     )
 
     name = "countries"
@@ -105,15 +424,15 @@ class CountryIndex(RedisIndex):
 class TimeZoneIndex(RedisIndex):
 
     schema = (
-        TextField("id"),
-        TextField("zone_name"),
-        TextField("gmt_offset"),
-        TextField("gmt_offset_name"),
-        TextField("abbreviation"),
+        TagField("id"),
+        TextField("zone_name", sortable=True, no_stem=True),
+        NumericField("gmt_offset", sortable=True),
+        TagField("gmt_offset_name"),
+        TagField("abbreviation"),
         TextField("tz_name"),
-        TextField("country_id"),
-        TextField("country_name"),
-        TextField("emoji"),
+        TagField("country_id"),
+        TextField("country_name", sortable=True, no_stem=True),
+        TagField("emoji"),
     )
 
     name = "timezones"
@@ -123,15 +442,16 @@ class TimeZoneIndex(RedisIndex):
 class StateIndex(RedisIndex):
 
     schema = (
-        NumericField("id"),
-        TextField("name"),
-        TextField("country_id"),
-        TextField("country_code"),
-        TextField("country_name"),
-        TextField("state_code"),
-        TextField("type"),
-        TextField("latitude"),
-        TextField("longitude"),
+        TagField("id"),
+        TextField("name", no_stem=True),
+        TagField("country_id"),
+        TagField("country_code"),
+        TextField("country_name", no_stem=True),
+        TagField("state_code"),
+        TagField("type"),
+        NumericField("latitude"),
+        NumericField("longitude"),
+        GeoField("location"),
     )
 
     name = "states"
@@ -141,18 +461,18 @@ class StateIndex(RedisIndex):
 class CityIndex(RedisIndex):
 
     schema = (
-        NumericField("id"),
-        TextField("name"),
-        TextField("state_id"),
-        TextField("state_code"),
-        TextField("state_name"),
-        TextField("country_id"),
-        TextField("country_code"),
-        TextField("country_name"),
-        TextField("latitude"),
-        TextField("longitude"),
+        TagField("id"),
+        TextField("name", sortable=True, no_stem=True),
+        TagField("state_id"),
+        TagField("state_code"),
+        TextField("state_name", sortable=True, no_stem=True),
+        TagField("country_id"),
+        TagField("country_code"),
+        TextField("country_name", sortable=True, no_stem=True),
+        NumericField("latitude"),
+        NumericField("longitude"),
+        GeoField("location"),
     )
 
     name = "cities"
     prefix = "city:"
-
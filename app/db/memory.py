@@ -0,0 +1,236 @@
+import bisect
+import re
+import time
+from collections import namedtuple
+from typing import Iterable, Optional
+from redis.commands.search.field import Field
+from .indexes import RedisIndex
+
+# Default stopwords of redisearch, these terms are not indexed
+STOPWORDS: frozenset = frozenset(
+    "a is the an and are as at be but by for if in into it no not of on or such that their then there these they this to was will with".split()
+)
+
+# Characters redisearch separates terms on
+SEPARATORS: re.Pattern = re.compile(r"[\s,.<>{}\[\]\"':;!@#$%^&*()\-+=~/\\|?`]+")
+
+# Shortest prefix redisearch expands with wildcard queries
+MIN_PREFIX: int = 2
+
+
+def tokenize(value: str) -> list:
+    return [t for t in SEPARATORS.split(value.lower()) if t and t not in STOPWORDS]
+
+
+def deletions(term: str) -> set:
+    return {term} | {term[:i] + term[i + 1 :] for i in range(len(term))}
+
+
+def within_one_edit(a: str, b: str) -> bool:
+    """
+    Levenshtein distance of at most 1, as used by fuzzy queries of redisearch
+    """
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i: int = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        return a[i + 1 :] == b[i + 1 :]
+    return a[i:] == b[i + 1 :]
+
+
+class TermIndex:
+    """
+    Postings of terms, with a sorted vocabulary for prefix queries
+    and a deletion index for queries with one typo
+    """
+
+    def __init__(self) -> None:
+        self.postings: dict = {}
+        self.vocabulary: list = []
+        self.variants: dict = {}
+
+    def add(self, term: str, doc: int) -> None:
+        self.postings.setdefault(term, set()).add(doc)
+
+    def freeze(self) -> None:
+        self.postings = {term: frozenset(docs) for term, docs in self.postings.items()}
+        self.vocabulary = sorted(self.postings)
+        for term in self.vocabulary:
+            for variant in deletions(term):
+                self.variants.setdefault(variant, []).append(term)
+
+    def exact(self, term: str) -> frozenset:
+        return self.postings.get(term, frozenset())
+
+    def prefix(self, prefix: str) -> set:
+        docs: set = set()
+        if len(prefix) < MIN_PREFIX:
+            return docs
+        i: int = bisect.bisect_left(self.vocabulary, prefix)
+        while i < len(self.vocabulary) and self.vocabulary[i].startswith(prefix):
+            docs |= self.postings[self.vocabulary[i]]
+            i += 1
+        return docs
+
+    def fuzzy(self, term: str) -> set:
+        docs: set = set()
+        matched: set = set()
+        for variant in deletions(term):
+            for candidate in self.variants.get(variant, ()):
+                if candidate not in matched and within_one_edit(term, candidate):
+                    matched.add(candidate)
+                    docs |= self.postings[candidate]
+        return docs
+
+
+class MemoryIndex:
+    """
+    In process, read only copy of a small index, e.g. countries and timezones
+    Answers the same exact, wildcard and fuzzy queries as RedisIndex.search without a round trip to redis
+    Ranking is simpler than redisearch scoring, code matches come first, then text matches in load order
+    """
+
+    def __init__(self, index: RedisIndex) -> None:
+        self.index: RedisIndex = index
+        self.name: str = index.name
+        self.types: dict = index.field_types()
+        self.fields: list = index.get_field_names()
+        self.record = namedtuple(f"{type(index).__name__}Record", ["key", *self.fields])
+        self.records: list = []
+        self.terms: dict = {}
+        self.all_text: TermIndex = TermIndex()
+        self.numbers: dict = {}
+
+    def load(self, rows: Iterable) -> "MemoryIndex":
+        """
+        rows are (redis key, mapping) pairs, as read by index managers from csv files
+        """
+        for key, mapping in rows:
+            doc: int = len(self.records)
+            self.records.append(self.record(key, *[mapping.get(f) for f in self.fields]))
+
+            for field in self.fields:
+                value: Optional[str] = mapping.get(field)
+                if not value:
+                    continue
+                field_type: str = self.types[field]
+                if field_type == Field.TEXT:
+                    for term in tokenize(value):
+                        self.terms.setdefault(field, TermIndex()).add(term, doc)
+                        self.all_text.add(term, doc)
+                elif field_type == Field.TAG:
+                    self.terms.setdefault(field, TermIndex()).add(value.lower(), doc)
+                elif field_type == Field.NUMERIC:
+                    try:
+                        self.numbers.setdefault(field, {}).setdefault(float(value), set()).add(doc)
+                    except ValueError:
+                        pass
+
+        for terms in [*self.terms.values(), self.all_text]:
+            terms.freeze()
+        return self
+
+    def match_text(self, terms: list, qs: str, query_type: str) -> set:
+        """
+        Every term has to match, wildcard expands the last term only, like "new delhi*"
+        """
+        words: list = tokenize(qs)
+        if not words:
+            return set()
+
+        docs: Optional[set] = None
+        for i, word in enumerate(words):
+            matched: set = set()
+            for term_index in terms:
+                if query_type == "fuzzy":
+                    matched |= term_index.fuzzy(word)
+                elif query_type == "wildcard" and i == len(words) - 1:
+                    matched |= term_index.prefix(word)
+                else:
+                    matched |= term_index.exact(word)
+            docs = matched if docs is None else docs & matched
+            if not docs:
+                break
+        return docs or set()
+
+    def match_tag(self, field: str, qs: str, query_type: str) -> set:
+        terms: Optional[TermIndex] = self.terms.get(field)
+        if terms is None or query_type == "fuzzy":
+            return set()
+        if query_type == "wildcard":
+            return terms.prefix(qs.lower())
+        return set(terms.exact(qs.lower()))
+
+    def match_number(self, field: str, qs: str, query_type: str) -> set:
+        if query_type != "exact":
+            return set()
+        try:
+            return set(self.numbers.get(field, {}).get(float(qs), ()))
+        except ValueError:
+            return set()
+
+    def sort_key(self, field: str):
+        numeric: bool = self.types[field] == Field.NUMERIC
+
+        def key(doc: int) -> tuple:
+            value: Optional[str] = getattr(self.records[doc], field)
+            if not value:
+                return (1, 0)
+            if numeric:
+                return (0, float(value))
+            return (0, value.lower())
+
+        return key
+
+    async def search(
+        self,
+        qs: str,
+        query_type: str,
+        fields: Optional[list] = None,
+        offset: int = 0,
+        limit: int = 10,
+        sort_by: Optional[str] = None,
+        sort_asc: bool = True,
+        return_fields: Optional[list] = None,
+    ) -> dict:
+        """
+        Same arguments and result as RedisIndex.search
+        """
+        start: float = time.perf_counter()
+
+        scoped: list = fields or [f for f in self.fields if self.types[f] == Field.TAG]
+        tag_matches: set = set()
+        for field in scoped:
+            if self.types[field] == Field.TAG:
+                tag_matches |= self.match_tag(field, qs, query_type)
+            elif self.types[field] == Field.NUMERIC:
+                tag_matches |= self.match_number(field, qs, query_type)
+
+        if fields:
+            text: list = [self.terms[f] for f in fields if self.types[f] == Field.TEXT and f in self.terms]
+        else:
+            text = [self.all_text]
+        text_matches: set = self.match_text(text, qs, query_type) if text else set()
+
+        if sort_by:
+            docs: list = sorted(
+                sorted(tag_matches | text_matches), key=self.sort_key(sort_by), reverse=not sort_asc
+            )
+        else:
+            docs = sorted(tag_matches) + sorted(text_matches - tag_matches)
+
+        fields = [f for f in (return_fields or self.fields) if f != "id"]
+        records: list = [
+            {field: getattr(self.records[doc], field) for field in fields} | {"id": self.records[doc].key}
+            for doc in docs[offset : offset + limit]
+        ]
+
+        return {
+            "total": len(docs),
+            "duration": (time.perf_counter() - start) * 1000,
+            "records": records,
+        }
@@ -1,6 +1,8 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from routers import places, phonenumber, email, redis_db
+from db.connection import redis_manager
+from metrics import MetricsMiddleware, metrics_enabled
+from routers import places, countries, export, phonenumber, email, redis_db, metrics
 
 description = """
 
@@ -41,6 +43,10 @@ tags_metadata = [
         "name": "Redis DB",
         "description": "Operations related to Redis database.",
     },
+    {
+        "name": "Metrics",
+        "description": "Latency, cache and redis metrics for prometheus",
+    },
 ]
 
 fastapi_application = FastAPI(
@@ -74,8 +80,24 @@ fastapi_application.add_middleware(
     allow_headers=["*"],
 )
 
+if metrics_enabled:
+    fastapi_application.add_middleware(MetricsMiddleware)
+
 
 fastapi_application.include_router(places.router)
+fastapi_application.include_router(export.router)
+fastapi_application.include_router(countries.router)
 fastapi_application.include_router(phonenumber.router)
 fastapi_application.include_router(email.router)
 fastapi_application.include_router(redis_db.router)
+fastapi_application.include_router(metrics.router)
+
+
+@fastapi_application.on_event("startup")
+async def open_redis() -> None:
+    await redis_manager.open()
+
+
+@fastapi_application.on_event("shutdown")
+async def close_redis() -> None:
+    await redis_manager.close()
@@ -0,0 +1,12 @@
+from .instruments import (
+    Timer,
+    cache_counters,
+    mark_process_dead,
+    metrics_enabled,
+    pipeline_flush,
+    redis_command,
+    render,
+    reset_multiprocess_dir,
+    stage,
+)
+from .middleware import MetricsMiddleware
@@ -0,0 +1,159 @@
+import os
+import shutil
+import time
+from typing import Optional
+
+# prometheus_client is optional, nothing is recorded and /metrics is not served without it
+try:
+    import prometheus_client
+    from prometheus_client import CollectorRegistry, Counter, Histogram, multiprocess
+except ImportError:
+    prometheus_client = None
+
+metrics_enabled: bool = (
+    prometheus_client is not None and os.getenv("METRICS_ENABLED", "true").lower() == "true"
+)
+# Set by gunicorn setup, every worker writes its samples there and /metrics of any worker sums them
+multiprocess_dir: Optional[str] = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+# Metrics write to the directory as soon as they are created, e.g. by populate-db in a fresh container
+if metrics_enabled and multiprocess_dir:
+    os.makedirs(multiprocess_dir, exist_ok=True)
+
+# Seconds, from cache hits and redis round trips up to DNS timeouts
+LATENCY_BUCKETS: tuple = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 15,
+)
+
+
+class NoopMetric:
+    """
+    Stands in for metrics when they are disabled
+    """
+
+    def labels(self, *args, **kwargs) -> "NoopMetric":
+        return self
+
+    def observe(self, value: float) -> None:
+        pass
+
+    def inc(self, amount: float = 1) -> None:
+        pass
+
+
+if metrics_enabled:
+    request_seconds = Histogram(
+        "http_request_duration_seconds",
+        "Time to send the complete response, by route template",
+        ["method", "route", "status"],
+        buckets=LATENCY_BUCKETS,
+    )
+    stage_seconds = Histogram(
+        "stage_duration_seconds",
+        "Time spent in a stage of handling a request, e.g. search.redis, places.model or dns.resolve",
+        ["stage"],
+        buckets=LATENCY_BUCKETS,
+    )
+    redis_command_seconds = Histogram(
+        "redis_command_duration_seconds",
+        "Round trip of a single redis command, without decoding of search results",
+        ["command"],
+        buckets=LATENCY_BUCKETS,
+    )
+    pipeline_flush_seconds = Histogram(
+        "redis_pipeline_flush_seconds",
+        "Time to execute a pipeline while loading an index",
+        ["index"],
+        buckets=LATENCY_BUCKETS,
+    )
+    cache_lookups = Counter(
+        "cache_lookups_total",
+        "Lookups of in process caches, hit ratio is hit over all results",
+        ["cache", "result"],
+    )
+else:
+    request_seconds = stage_seconds = redis_command_seconds = NoopMetric()
+    pipeline_flush_seconds = cache_lookups = NoopMetric()
+
+
+class Timer:
+    """
+    Observes seconds spent in a with block on a metric, or its labelled child
+    A new Timer is needed per block, so concurrent requests do not share a start time
+    """
+
+    __slots__ = ("metric", "start")
+
+    def __init__(self, metric) -> None:
+        self.metric = metric
+
+    def __enter__(self) -> "Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.metric.observe(time.perf_counter() - self.start)
+
+
+# Labelled children are looked up once, labels() takes a lock on every call
+children: dict = {}
+
+
+def child(metric, *labels: str):
+    key: tuple = (id(metric), *labels)
+    found = children.get(key)
+    if found is None:
+        found = children[key] = metric.labels(*labels)
+    return found
+
+
+def stage(name: str) -> Timer:
+    return Timer(child(stage_seconds, name))
+
+
+def redis_command(command: str) -> Timer:
+    return Timer(child(redis_command_seconds, command))
+
+
+def pipeline_flush(index: str) -> Timer:
+    return Timer(child(pipeline_flush_seconds, index))
+
+
+def cache_counters(name: Optional[str]) -> tuple:
+    """
+    Hit and miss counters of a named cache, caches without a name are not exported
+    """
+    if name is None:
+        return NoopMetric(), NoopMetric()
+    return child(cache_lookups, name, "hit"), child(cache_lookups, name, "miss")
+
+
+def render() -> Optional[bytes]:
+    """
+    Metrics in prometheus text format, None when they are disabled
+    With multiprocess_dir, samples of all workers are read from there and summed
+    """
+    if not metrics_enabled:
+        return None
+    if multiprocess_dir:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return prometheus_client.generate_latest(registry)
+    return prometheus_client.generate_latest()
+
+
+def content_type() -> str:
+    return prometheus_client.CONTENT_TYPE_LATEST
+
+
+def reset_multiprocess_dir() -> None:
+    """
+    Samples of a previous run would be summed with new ones, so the directory is emptied before workers start
+    """
+    if metrics_enabled and multiprocess_dir:
+        shutil.rmtree(multiprocess_dir, ignore_errors=True)
+        os.makedirs(multiprocess_dir, exist_ok=True)
+
+
+def mark_process_dead(pid: int) -> None:
+    if metrics_enabled and multiprocess_dir:
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,35 @@
+import time
+from .instruments import child, request_seconds
+
+
+class MetricsMiddleware:
+    """
+    Records latency of every http request by method, route template and status
+    Route template, e.g. /countries/{iso2}, keeps the number of series bounded,
+    requests that match no route are recorded as "unmatched"
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status: list = [500]
+
+        async def send_status(message: dict) -> None:
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        start: float = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            # Router sets route on the same scope, after the app has been called
+            route = scope.get("route")
+            child(request_seconds, scope["method"], route.path if route else "unmatched", str(status[0])).observe(
+                time.perf_counter() - start
+            )
@@ -1,12 +1,29 @@
 from .models import (
+    CacheInfo,
     City,
     CitySearch,
+    Countries,
     Country,
     CountrySearch,
     Email,
+    EmailBatch,
+    EmailBatchResponse,
+    EmailBatchResult,
+    EmailDomainCheck,
+    NearbyCities,
+    NearbyCity,
     PhoneNumber,
+    PhoneNumberBatch,
+    PhoneNumberBatchResponse,
+    PhoneNumberBatchResult,
+    PhoneNumberEnriched,
+    PhoneNumberInput,
+    PlaceSuggestion,
+    PlaceSuggestions,
     RedisInfo,
+    RedisPoolInfo,
     State,
     TimeZone,
     TimeZoneSearch,
 )
+from .serializers import FastSerializer
@@ -4,10 +4,15 @@ from typing import List, Optional, Union
 
 
 class EmailDomainCheck(EmailStr):
+    """
+    Normalizes email and checks syntax only
+    Deliverability needs DNS lookups, which are done asynchronously by cache.domains.DomainResolver
+    """
+
     @classmethod
     def validate(cls, value: Union[str]) -> str:
         value = value.replace(" ", "").lower()
-        return validate_email(value)["email"]
+        return validate_email(value, check_deliverability=False)["email"]
 
 
 class Docs(BaseModel):
@@ -25,6 +30,21 @@ class RedisInfo(BaseModel):
     index_info: List[Docs]
 
 
+class RedisPoolUsage(BaseModel):
+    max_connections: int
+    created: Optional[int] = 0
+    in_use: Optional[int] = 0
+    peak_in_use: Optional[int] = 0
+    waiting: Optional[int] = 0
+    acquired: Optional[int] = 0
+    timeouts: Optional[int] = 0
+    avg_acquire_ms: Optional[float] = 0.0
+
+
+class RedisPoolInfo(RedisPoolUsage):
+    raw: Optional[RedisPoolUsage] = None
+
+
 class TimeZone(BaseModel):
     id: Optional[str]
     zone_name: Optional[str]
@@ -45,26 +65,31 @@ class TimeZoneSearch(BaseModel):
 
 class Country(BaseModel):
 
-    id: str
-    name: str
-    iso3: str
-    iso2: str
+    id: Optional[str]
+    name: Optional[str]
+    iso3: Optional[str]
+    iso2: Optional[str]
     numeric_code: Optional[str]
-    phone_code: str
-    capital: str
-    currency: str
-    currency_name: str
-    currency_symbol: str
-    tld: str
-    native: str
-    region: str
-    subregion: str
-    latitude: str
-    longitude: str
+    phone_code: Optional[str]
+    capital: Optional[str]
+    currency: Optional[str]
+    currency_name: Optional[str]
+    currency_symbol: Optional[str]
+    tld: Optional[str]
+    native: Optional[str]
+    region: Optional[str]
+    subregion: Optional[str]
+    latitude: Optional[str]
+    longitude: Optional[str]
     emoji: Optional[str]
     emojiU: Optional[str]
 
 
+class Countries(BaseModel):
+    total: int
+    records: List[Country]
+
+
 class CountrySearch(BaseModel):
     total: str
     duration: str
@@ -86,16 +111,16 @@ class State(BaseModel):
 
 class City(BaseModel):
 
-    id: str
-    name: str
-    state_id: str
-    state_code: str
-    state_name: str
-    country_id: str
-    country_code: str
-    country_name: str
-    latitude: str
-    longitude: str
+    id: Optional[str]
+    name: Optional[str]
+    state_id: Optional[str]
+    state_code: Optional[str]
+    state_name: Optional[str]
+    country_id: Optional[str]
+    country_code: Optional[str]
+    country_name: Optional[str]
+    latitude: Optional[str]
+    longitude: Optional[str]
 
 
 class CitySearch(BaseModel):
@@ -104,6 +129,26 @@ class CitySearch(BaseModel):
     records: List[City]
 
 
+class NearbyCity(City):
+    distance_km: float
+
+
+class NearbyCities(BaseModel):
+    total: int
+    records: List[NearbyCity]
+
+
+class PlaceSuggestion(BaseModel):
+    id: Optional[str]
+    name: str
+    score: float
+
+
+class PlaceSuggestions(BaseModel):
+    total: int
+    records: List[PlaceSuggestion]
+
+
 class PhoneNumber(BaseModel):
     is_valid_number: Optional[bool] = False
     national_format: Optional[str]
@@ -111,5 +156,56 @@ class PhoneNumber(BaseModel):
     e164_format: Optional[str]
 
 
+class PhoneNumberEnriched(PhoneNumber):
+    region_code: Optional[str]
+    country: Optional[Country]
+    timezones: List[TimeZone] = []
+
+
+class PhoneNumberInput(BaseModel):
+    phone_number: str
+    country_code: Optional[str]
+
+
+class PhoneNumberBatch(BaseModel):
+    numbers: List[PhoneNumberInput]
+
+
+class PhoneNumberBatchResult(PhoneNumber):
+    phone_number: str
+    country_code: Optional[str]
+    detail: Optional[str]
+
+
+class PhoneNumberBatchResponse(BaseModel):
+    total: int
+    records: List[PhoneNumberBatchResult]
+
+
+class CacheInfo(BaseModel):
+    size: int
+    maxsize: int
+    hits: int
+    misses: int
+    evictions: int
+    hit_ratio: float
+
+
 class Email(BaseModel):
     email: EmailDomainCheck
+
+
+class EmailBatch(BaseModel):
+    emails: List[str]
+
+
+class EmailBatchResult(BaseModel):
+    email: str
+    normalized: Optional[str]
+    is_valid: bool = False
+    detail: Optional[str]
+
+
+class EmailBatchResponse(BaseModel):
+    total: int
+    records: List[EmailBatchResult]
@@ -0,0 +1,85 @@
+from fastapi import APIRouter, HTTPException, Path
+from cache.countries import CountryDirectory, country_directory as directory
+from models import Countries, Country
+
+router = APIRouter()
+
+
+@router.on_event("startup")
+async def start_directory() -> None:
+    directory.start()
+
+
+@router.on_event("shutdown")
+async def stop_directory() -> None:
+    await directory.stop()
+
+
+def loaded_directory() -> CountryDirectory:
+    if not directory.loaded:
+        raise HTTPException(
+            status_code=503,
+            detail="Countries are not loaded yet. Check if Redis is running and countries index is populated",
+        )
+    return directory
+
+
+def countries_or_404(records: list, detail: str) -> Countries:
+    if not records:
+        raise HTTPException(status_code=404, detail=detail)
+    return Countries(total=len(records), records=records)
+
+
+@router.get(
+    "/countries/{iso2}",
+    response_model=Country,
+    responses={404: {"description": "No country with this code"}},
+    tags=["Places"],
+)
+async def country_by_iso2(
+    iso2: str = Path(..., regex="^[A-Za-z]{2}$", description="Two-letter iso2 code of country, e.g., 'IN' for India"),
+):
+    """
+    Get a country by its iso2 code. Served from memory, without a search query.
+    """
+
+    country = loaded_directory().get_iso2(iso2)
+    if country is None:
+        raise HTTPException(status_code=404, detail=f"No country with iso2 code {iso2}")
+    return Country(**country)
+
+
+@router.get(
+    "/countries/by-phone-code/{code}",
+    response_model=Countries,
+    responses={404: {"description": "No country with this dial code"}},
+    tags=["Places"],
+)
+async def countries_by_phone_code(
+    code: str = Path(..., regex=r"^\+?[\d\- ]{1,10}$", description="International dial code, e.g., '91' or '+1-268'"),
+):
+    """
+    Get countries that use an international dial code. Some codes are shared, e.g., '1' is used by the United States and Canada.
+    """
+
+    return countries_or_404(
+        loaded_directory().get_phone_code(code), f"No country with dial code {code}"
+    )
+
+
+@router.get(
+    "/countries/by-currency/{code}",
+    response_model=Countries,
+    responses={404: {"description": "No country with this currency"}},
+    tags=["Places"],
+)
+async def countries_by_currency(
+    code: str = Path(..., regex="^[A-Za-z]{3}$", description="Three-letter currency code, e.g., 'INR'"),
+):
+    """
+    Get countries that use a currency.
+    """
+
+    return countries_or_404(
+        loaded_directory().get_currency(code), f"No country with currency {code}"
+    )
@@ -1,10 +1,22 @@
-from fastapi import APIRouter
-from fastapi.responses import JSONResponse
+import asyncio
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+from email_validator import EmailNotValidError
+from fastapi import APIRouter, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import ValidationError
-from models import Email
+from cache.domains import DomainResolver
+from models import Email, EmailBatch, EmailBatchResponse, EmailDomainCheck
 
 router = APIRouter()
 
+domain_resolver = DomainResolver()
+
+batch_max_size: int = int(os.getenv("EMAIL_BATCH_MAX_SIZE", "100000"))
+batch_concurrency: int = int(os.getenv("EMAIL_BATCH_CONCURRENCY", "50"))
+
 validate_email_responses = {
     "200" : {
         "model": Email,
@@ -26,14 +38,137 @@ validate_email_responses = {
 }
 
 
+def undeliverable_errors(detail: str) -> list:
+    """
+    Same shape as pydantic errors raised by email_validator when deliverability check fails
+    """
+    return [{"loc": ["email"], "msg": detail, "type": "value_error.emailundeliverable"}]
+
+
 @router.get("/validate-email", responses=validate_email_responses, tags=["Validate Email"])
 async def validate_email(email: str):
     """
     Returns valid email using [python-email-validator](https://github.com/JoshData/python-email-validator). Only checks if email has correct syntax and MX record exists for domain.
     \n
-    Please note that checking DNS records might take a couple of seconds.
+    Please note that checking DNS records might take a couple of seconds. Results are cached for the TTL of DNS records.
     """
     try:
-        return Email(email=email)
+        result = Email(email=email)
     except ValidationError as e:
         return JSONResponse(status_code=422, content=e.errors())
+
+    check = await domain_resolver.check(result.email.rsplit("@", 1)[-1])
+    if not check["deliverable"]:
+        return JSONResponse(status_code=422, content=undeliverable_errors(check["detail"]))
+
+    return result
+
+
+def normalize_email(email: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Returns normalized email and error, only one of them is set
+    """
+    try:
+        return EmailDomainCheck.validate(email), None
+    except EmailNotValidError as e:
+        return None, str(e)
+
+
+def check_domains(domains: List[str]) -> Dict[str, asyncio.Task]:
+    """
+    Starts one lookup per unique domain, at most batch_concurrency of them run at the same time
+    """
+    semaphore = asyncio.Semaphore(batch_concurrency)
+
+    async def check(domain: str) -> dict:
+        async with semaphore:
+            return await domain_resolver.check(domain)
+
+    return {domain: asyncio.create_task(check(domain)) for domain in domains}
+
+
+async def email_batch_results(normalized: list, tasks: Dict[str, asyncio.Task]):
+    """
+    Yields results in input order, each one as soon as lookup for its domain is done
+    """
+    try:
+        for email, (value, error) in normalized:
+            result: dict = {"email": email, "normalized": value, "is_valid": False, "detail": error}
+            if value:
+                check = await tasks[value.rsplit("@", 1)[-1]]
+                result["is_valid"] = check["deliverable"]
+                result["detail"] = check["detail"]
+            yield result
+    finally:
+        for task in tasks.values():
+            task.cancel()
+
+
+validate_email_batch_responses = {
+    "200": {
+        "model": EmailBatchResponse,
+        "description": "Returns validation result for every email in the same order as input. With **stream=true**, results are returned as newline delimited JSON, one record per line.",
+        "content": {
+            "application/json": {
+                "example": {
+                    "total": 2,
+                    "records": [
+                        {
+                            "email": "Email@Example.com ",
+                            "normalized": "email@example.com",
+                            "is_valid": True,
+                            "detail": None,
+                        },
+                        {
+                            "email": "email@",
+                            "normalized": None,
+                            "is_valid": False,
+                            "detail": "There must be something after the @-sign.",
+                        },
+                    ],
+                }
+            },
+            "application/x-ndjson": {},
+        },
+    }
+}
+
+
+@router.post(
+    "/validate-email/batch",
+    responses=validate_email_batch_responses,
+    tags=["Validate Email"],
+)
+async def validate_email_batch(
+    batch: EmailBatch,
+    stream: bool = Query(False, description="Stream results as newline delimited JSON"),
+):
+    """
+    Validate many emails in one request.
+    \n
+    Emails are grouped by domain, so every unique domain is looked up only once.
+    """
+
+    if len(batch.emails) > batch_max_size:
+        return JSONResponse(
+            status_code=422,
+            content=jsonable_encoder(
+                {"detail": f"Batch cannot have more than {batch_max_size} emails"}
+            ),
+        )
+
+    normalized: list = [(email, normalize_email(email)) for email in batch.emails]
+    domains: list = list(
+        dict.fromkeys(value.rsplit("@", 1)[-1] for _, (value, _) in normalized if value)
+    )
+    tasks: dict = check_domains(domains)
+
+    if stream:
+        async def ndjson():
+            async for result in email_batch_results(normalized, tasks):
+                yield json.dumps(result) + "\n"
+
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+    records: list = [r async for r in email_batch_results(normalized, tasks)]
+    return EmailBatchResponse(total=len(records), records=records)
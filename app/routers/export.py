@@ -0,0 +1,209 @@
+import csv
+import io
+import json
+import os
+import zlib
+from enum import Enum
+from typing import AsyncIterator, List, Optional
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
+from redis.exceptions import ConnectionError
+from db.indexes import CityIndex
+
+# orjson and zstandard are optional, standard json and gzip are used without them
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+router = APIRouter()
+
+export_batch_size: int = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+# Milliseconds a slow client can take before its cursor expires in redis
+export_cursor_max_idle: int = int(os.getenv("EXPORT_CURSOR_MAX_IDLE", "300000"))
+export_max_concurrent: int = int(os.getenv("EXPORT_MAX_CONCURRENT", "4"))
+active_exports: int = 0
+
+ExportField = Enum("ExportField", {f: f for f in CityIndex().get_field_names()}, type=str)
+
+
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+media_types: dict = {
+    ExportFormat.ndjson: "application/x-ndjson",
+    ExportFormat.csv: "text/csv; charset=utf-8",
+}
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> str:
+    """
+    zstd if client accepts it and zstandard is installed, then gzip, otherwise uncompressed
+    """
+    accepted: set = set()
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(name.strip().lower())
+    if "zstd" in accepted and zstandard is not None:
+        return "zstd"
+    if "gzip" in accepted:
+        return "gzip"
+    return "identity"
+
+
+class StreamEncoder:
+    """
+    Compresses a stream chunk by chunk, every chunk is flushed so clients can decode rows as they arrive
+    """
+
+    def __init__(self, encoding: str) -> None:
+        self.encoding = encoding
+        if encoding == "gzip":
+            self.compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+            self.sync = zlib.Z_SYNC_FLUSH
+        elif encoding == "zstd":
+            self.compressor = zstandard.ZstdCompressor().compressobj()
+            self.sync = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+
+    def chunk(self, data: bytes) -> bytes:
+        if self.encoding == "identity":
+            return data
+        return self.compressor.compress(data) + self.compressor.flush(self.sync)
+
+    def end(self) -> bytes:
+        if self.encoding == "identity":
+            return b""
+        return self.compressor.flush()
+
+
+def ndjson_lines(batch: list) -> bytes:
+    if orjson is not None:
+        return b"".join(orjson.dumps(record) + b"\n" for record in batch)
+    return "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in batch).encode()
+
+
+def csv_rows(batch: list, fields: list, header: bool = False) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(fields)
+    writer.writerows([record.get(f) for f in fields] for record in batch)
+    return buffer.getvalue().encode()
+
+
+async def export_body(
+    first: list, batches: AsyncIterator[list], fields: list, export_format: ExportFormat, encoder: StreamEncoder
+) -> AsyncIterator[bytes]:
+    """
+    One chunk per batch, the next batch is read from redis only after the server has sent this one,
+    so a slow client slows the export down instead of buffering it in the worker
+    """
+    if export_format == ExportFormat.csv:
+        yield encoder.chunk(csv_rows(first, fields, header=True))
+    elif first:
+        yield encoder.chunk(ndjson_lines(first))
+    async for batch in batches:
+        if export_format == ExportFormat.csv:
+            yield encoder.chunk(csv_rows(batch, fields))
+        else:
+            yield encoder.chunk(ndjson_lines(batch))
+    yield encoder.end()
+
+
+class ExportResponse(StreamingResponse):
+    """
+    Releases the slot export_places took and closes the cursor however the response ends,
+    also when the client disconnects before the body is started
+    """
+
+    def __init__(self, content: AsyncIterator[bytes], batches: AsyncIterator[list], **kwargs) -> None:
+        super().__init__(content, **kwargs)
+        self.batches = batches
+
+    async def __call__(self, scope, receive, send) -> None:
+        global active_exports
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            active_exports -= 1
+            await self.body_iterator.aclose()
+            await self.batches.aclose()
+
+
+@router.get(
+    "/places/export",
+    tags=["Places"],
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "description": "Every matching city, one JSON object per line or CSV with a header row",
+            "content": {"application/x-ndjson": {}, "text/csv": {}},
+        },
+        429: {"description": "Too many exports are running in this worker, retry later"},
+        503: {"description": "Redis server might not be running"},
+    },
+)
+async def export_places(
+    country_code: Optional[str] = Query(None, min_length=2, max_length=2, description="e.g. IN"),
+    state_code: Optional[str] = Query(None, min_length=1, max_length=10, description="e.g. KA"),
+    export_format: ExportFormat = Query(ExportFormat.ndjson, alias="format"),
+    fields: List[ExportField] = Query(None, description="Export only these fields, id is always exported"),
+    accept_encoding: Optional[str] = Header(None),
+):
+    """
+    Export all cities, or cities of a country or state, without paging.
+    \n
+    Rows are streamed while they are read from redis. Responses are compressed with zstd or gzip when the client accepts it in **Accept-Encoding**.
+    """
+    global active_exports
+    if active_exports >= export_max_concurrent:
+        raise HTTPException(status_code=429, detail="Too many exports are running, retry later")
+    # Slot is taken before the first await, so concurrent requests cannot all pass the check
+    # ExportResponse releases it once the response ends
+    active_exports += 1
+
+    index: CityIndex = CityIndex()
+    return_fields: list = [f.value for f in fields or []]
+    columns: list = ["id"] + [f for f in (return_fields or index.get_field_names()) if f != "id"]
+    batches = index.export(
+        {"country_code": country_code, "state_code": state_code},
+        return_fields,
+        batch_size=export_batch_size,
+        max_idle=export_cursor_max_idle,
+    )
+    encoding: str = negotiate_encoding(accept_encoding)
+    encoder: StreamEncoder = StreamEncoder(encoding)
+    headers: dict = {
+        "Content-Disposition": f'attachment; filename="cities{"-" + country_code.upper() if country_code else ""}.{export_format.value}"',
+        "Vary": "Accept-Encoding",
+    }
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+
+    # First batch is read before the response starts, so errors still get a proper status code
+    try:
+        first: list = await batches.__anext__()
+    except BaseException as e:
+        active_exports -= 1
+        await batches.aclose()
+        if isinstance(e, ConnectionError):
+            raise HTTPException(status_code=503, detail="Places could not be exported. Check if Redis is running")
+        if not isinstance(e, StopAsyncIteration):
+            raise
+        # Nothing matched, only the csv header is sent
+        body: bytes = encoder.chunk(csv_rows([], columns, header=True)) if export_format == ExportFormat.csv else b""
+        return Response(body + encoder.end(), media_type=media_types[export_format], headers=headers)
+
+    return ExportResponse(
+        export_body(first, batches, columns, export_format, encoder),
+        batches,
+        media_type=media_types[export_format],
+        headers=headers,
+    )
@@ -0,0 +1,17 @@
+from fastapi import APIRouter, HTTPException, Response
+from metrics import instruments
+
+router = APIRouter()
+
+
+@router.get("/metrics", tags=["Metrics"], response_class=Response)
+async def metrics():
+    """
+    Request latency by route, time spent in redis commands, search stages, DNS and phone number parsing,
+    and in process cache hits and misses, in prometheus text format. With **PROMETHEUS_MULTIPROC_DIR** set,
+    samples of all gunicorn workers are summed
+    """
+    body = instruments.render()
+    if body is None:
+        raise HTTPException(status_code=404, detail="Metrics are disabled or prometheus_client is not installed")
+    return Response(content=body, media_type=instruments.content_type())
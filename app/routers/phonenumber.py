@@ -1,11 +1,178 @@
+import asyncio
+import logging
+import os
+import time
 import phonenumbers
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
 from fastapi.encoders import jsonable_encoder
 from fastapi import APIRouter, Query
-from models import PhoneNumber
+from cache import LRUCache
+from cache.countries import country_directory
+from metrics import stage
+from models import CacheInfo, PhoneNumber, PhoneNumberBatch, PhoneNumberBatchResponse, PhoneNumberEnriched
 from fastapi.responses import JSONResponse
 
 router = APIRouter()
 
+batch_max_size: int = int(os.getenv("PHONE_BATCH_MAX_SIZE", "5000"))
+batch_chunk_size: int = int(os.getenv("PHONE_BATCH_CHUNK_SIZE", "500"))
+batch_workers: int = int(os.getenv("PHONE_BATCH_WORKERS", str(os.cpu_count() or 1)))
+
+# Metadata of these regions is loaded at startup, "all", or iso2 codes, e.g. "US,IN,GB", empty to load on first use
+warmup_regions: str = os.getenv("PHONE_WARMUP_REGIONS", "all")
+# Numbers of these regions are also parsed and formatted at startup, so their patterns are compiled
+warmup_hot_regions: str = os.getenv("PHONE_WARMUP_HOT_REGIONS", "")
+warmed_regions: set = set()
+
+executor: Optional[ProcessPoolExecutor] = None
+phone_cache: LRUCache = LRUCache(int(os.getenv("PHONE_CACHE_SIZE", "10000")), name="phone_numbers")
+
+
+def format_phone_number(phone_number: str, country_code: Optional[str] = None) -> dict:
+    """
+    Parses phone number and returns it in all supported formats
+    Raises NumberParseException if input cannot be parsed
+    """
+    with stage("phone.parse"):
+        number = phonenumbers.parse(phone_number, country_code)
+    with stage("phone.format"):
+        return format_number(number)
+
+
+def format_number(number: phonenumbers.PhoneNumber) -> dict:
+    return {
+        "is_valid_number": phonenumbers.is_valid_number(number),
+        "national_format": phonenumbers.format_number(
+            number, phonenumbers.PhoneNumberFormat.NATIONAL
+        ),
+        "international_format": phonenumbers.format_number(
+            number, phonenumbers.PhoneNumberFormat.INTERNATIONAL
+        ),
+        "e164_format": phonenumbers.format_number(
+            number, phonenumbers.PhoneNumberFormat.E164
+        ),
+    }
+
+
+def enrich_phone_number(phone_number: str, country_code: Optional[str] = None) -> dict:
+    """
+    format_phone_number along with country and timezones of the region the number belongs to
+    Country and timezones are read from country_directory
+    """
+    number = phonenumbers.parse(phone_number, country_code)
+    region: Optional[str] = phonenumbers.region_code_for_number(number)
+
+    return {
+        **format_number(number),
+        "region_code": region,
+        "country": country_directory.get_iso2(region) if region else None,
+        "timezones": country_directory.get_timezones(region) if region else [],
+    }
+
+
+def format_phone_numbers(items: List[Tuple[str, Optional[str]]]) -> List[dict]:
+    """
+    Runs inside a worker process, so one bad number must not fail the whole chunk
+    Parse errors are returned inline as {"detail": message}
+    """
+    results: list = []
+    for phone_number, country_code in items:
+        try:
+            results.append(format_phone_number(phone_number, country_code))
+        except phonenumbers.phonenumberutil.NumberParseException as e:
+            results.append({"detail": e._msg})
+    return results
+
+
+def cache_key(phone_number: str, country_code: Optional[str]) -> tuple:
+    return (phone_number.strip(), (country_code or "").strip().upper() or None)
+
+
+def cached_format_phone_number(
+    phone_number: str, country_code: Optional[str], enrich: bool = False
+) -> dict:
+    """
+    Same as format_phone_number, but results are kept in phone_cache
+    Parse errors are cached too, so bad input is not parsed again
+    Enriched results are kept apart, per revision of country_directory, and not at all until it is loaded
+    """
+    key: tuple = cache_key(phone_number, country_code)
+    if enrich:
+        key = (*key, "enrich", country_directory.revision)
+    result = phone_cache.get(key)
+    if result is None:
+        try:
+            result = enrich_phone_number(*key[:2]) if enrich else format_phone_number(*key)
+        except phonenumbers.phonenumberutil.NumberParseException as e:
+            result = {"detail": e._msg}
+        if not enrich or country_directory.loaded:
+            phone_cache.set(key, result)
+    return result
+
+
+def region_codes(regions: str) -> set:
+    if regions.strip().lower() == "all":
+        return set(phonenumbers.SUPPORTED_REGIONS)
+    return {r.strip().upper() for r in regions.split(",") if r.strip()}
+
+
+def warm_up(regions: str = warmup_regions, hot_regions: str = warmup_hot_regions) -> dict:
+    """
+    Loads metadata of regions, so first requests do not pay for it
+    Regions warmed before, e.g. in gunicorn master, are skipped
+    Hot regions also get example numbers parsed and formatted
+    phonenumbers compiles patterns through the re module cache, which keeps only 512 patterns,
+    so only a short list of hot regions stays compiled
+    """
+    start: float = time.perf_counter()
+    wanted: set = region_codes(regions)
+    hot: set = region_codes(hot_regions) & phonenumbers.SUPPORTED_REGIONS
+
+    pending: set = (wanted & phonenumbers.SUPPORTED_REGIONS) - warmed_regions
+    for region in sorted(pending):
+        phonenumbers.PhoneMetadata.metadata_for_region(region)
+        warmed_regions.add(region)
+    if regions.strip().lower() == "all":
+        for code in phonenumbers.COUNTRY_CODES_FOR_NON_GEO_REGIONS:
+            phonenumbers.PhoneMetadata.metadata_for_nongeo_region(code)
+
+    for region in sorted(hot):
+        number = phonenumbers.example_number(region)
+        if number is None:
+            continue
+        formatted: dict = format_number(number)
+        format_phone_number(formatted["international_format"])
+        format_phone_number(formatted["national_format"], region)
+
+    return {
+        "regions": len(pending),
+        "hot_regions": len(hot),
+        "unknown": sorted((wanted | region_codes(hot_regions)) - phonenumbers.SUPPORTED_REGIONS),
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+@router.on_event("startup")
+def warm_up_on_startup() -> None:
+    report: dict = warm_up()
+    logging.getLogger("uvicorn.error").info(f"Phone number metadata warm up: {report}")
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global executor
+    if executor is None:
+        executor = ProcessPoolExecutor(max_workers=batch_workers)
+    return executor
+
+
+@router.on_event("shutdown")
+def shutdown_executor() -> None:
+    global executor
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+        executor = None
+
 
 validate_phone_responses = {
     "200": {
@@ -35,26 +202,115 @@ async def validate_phone_numbers(
     country_code: str = Query(
         None, description="Two-letter iso2 code of country, e.g., 'IN' for India"
     ),
+    enrich: bool = Query(
+        False, description="Also return country and timezones of the number"
+    ),
 ):
 
-    try:
-        number = phonenumbers.parse(phone_number, country_code)
-    except phonenumbers.phonenumberutil.NumberParseException as e:
+    result = cached_format_phone_number(phone_number, country_code, enrich)
+    if "detail" in result:
         return JSONResponse(
-            status_code=422, content=jsonable_encoder({"detail": e._msg})
+            status_code=422, content=jsonable_encoder({"detail": result["detail"]})
         )
 
-    result = {
-        "is_valid_number": phonenumbers.is_valid_number(number),
-        "national_format": phonenumbers.format_number(
-            number, phonenumbers.PhoneNumberFormat.NATIONAL
-        ),
-        "international_format": phonenumbers.format_number(
-            number, phonenumbers.PhoneNumberFormat.INTERNATIONAL
-        ),
-        "e164_format": phonenumbers.format_number(
-            number, phonenumbers.PhoneNumberFormat.E164
-        ),
+    if enrich:
+        return PhoneNumberEnriched(**result)
+    return PhoneNumber(**result)
+
+
+@router.get(
+    "/validate-phone-numbers/cache-info",
+    response_model=CacheInfo,
+    tags=["Validate Phone Numbers"],
+)
+async def phone_cache_info():
+    """
+    Hit, miss and eviction counters of the parsed phone numbers cache of this worker. Use it to size **PHONE_CACHE_SIZE**.
+    """
+    return CacheInfo(**phone_cache.info())
+
+
+validate_phone_batch_responses = {
+    "200": {
+        "model": PhoneNumberBatchResponse,
+        "description": "Returns validated phone numbers in the same order as input. Numbers that cannot be parsed are returned with **detail** instead of failing the whole batch.",
+        "content": {
+            "application/json": {
+                "example": {
+                    "total": 2,
+                    "records": [
+                        {
+                            "phone_number": "2345678999",
+                            "country_code": "US",
+                            "is_valid_number": True,
+                            "national_format": "(234) 567-8999",
+                            "international_format": "+1 234-567-8999",
+                            "e164_format": "+12345678999",
+                            "detail": None,
+                        },
+                        {
+                            "phone_number": "2345678999",
+                            "country_code": None,
+                            "is_valid_number": False,
+                            "national_format": None,
+                            "international_format": None,
+                            "e164_format": None,
+                            "detail": "Missing or invalid default region.",
+                        },
+                    ],
+                }
+            },
+        },
     }
+}
 
-    return PhoneNumber(**result)
+
+@router.post(
+    "/validate-phone-numbers/batch",
+    responses=validate_phone_batch_responses,
+    tags=["Validate Phone Numbers"],
+)
+async def validate_phone_numbers_batch(batch: PhoneNumberBatch):
+    """
+    Validate and format many phone numbers in one request.
+    \n
+    Numbers are parsed in chunks across a pool of worker processes, so large batches do not block other requests.
+    """
+
+    if len(batch.numbers) > batch_max_size:
+        return JSONResponse(
+            status_code=422,
+            content=jsonable_encoder(
+                {"detail": f"Batch cannot have more than {batch_max_size} numbers"}
+            ),
+        )
+
+    keys: list = [cache_key(n.phone_number, n.country_code) for n in batch.numbers]
+    results: dict = {}
+    for key in keys:
+        if key not in results:
+            results[key] = phone_cache.get(key)
+
+    misses: list = [key for key, result in results.items() if result is None]
+    chunks: list = [
+        misses[i : i + batch_chunk_size] for i in range(0, len(misses), batch_chunk_size)
+    ]
+
+    loop = asyncio.get_running_loop()
+    chunk_results = await asyncio.gather(
+        *[
+            loop.run_in_executor(get_executor(), format_phone_numbers, chunk)
+            for chunk in chunks
+        ]
+    )
+
+    for key, result in zip(misses, (r for chunk in chunk_results for r in chunk)):
+        results[key] = result
+        phone_cache.set(key, result)
+
+    records: list = [
+        {"phone_number": n.phone_number, "country_code": n.country_code, **results[key]}
+        for n, key in zip(batch.numbers, keys)
+    ]
+
+    return PhoneNumberBatchResponse(total=len(records), records=records)
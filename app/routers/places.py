@@ -1,15 +1,209 @@
-from fastapi import APIRouter
+import asyncio
+import os
+from fastapi import APIRouter, Depends, Header, Query
+from fastapi.responses import Response
+from pydantic import BaseModel
+from redis.exceptions import RedisError
 from enum import Enum
-from db.indexes import CountryIndex, TimeZoneIndex, CityIndex
-from models import CountrySearch, TimeZoneSearch, CitySearch
+from typing import List, Optional, Union
+from cache.responses import ResponseCache
+from cache.singleflight import SingleFlight
+from db.indexes import CountryIndex, TimeZoneIndex, CityIndex, RedisIndex, connection
+from db.memory import MemoryIndex
+from metrics import stage
+from models import CountrySearch, TimeZoneSearch, CitySearch, FastSerializer, NearbyCities, PlaceSuggestions
 
 router = APIRouter()
 
+max_search_limit: int = int(os.getenv("SEARCH_MAX_LIMIT", "100"))
+max_nearby_radius: float = float(os.getenv("NEARBY_MAX_RADIUS_KM", "500"))
+# Responses are written without validating every record through pydantic, see FastSerializer
+fast_serialization: bool = os.getenv("PLACES_FAST_SERIALIZATION", "false").lower() == "true"
+
+# Redis geo index cannot store points closer to the poles than this
+max_latitude: float = 85.05112878
+
 class QueryType(str, Enum):
     fuzzy = "fuzzy"
     wildcard = "wildcard"
     exact = "exact"
 
+class SuggestIndex(str, Enum):
+    cities = "cities"
+    countries = "countries"
+
+
+# Small indexes listed here, e.g. "countries,timezones", are searched in process instead of redis
+memory_indexes: list = [i.strip() for i in os.getenv("MEMORY_INDEXES", "").split(",") if i.strip()]
+memory_engines: dict = {}
+# Revision in dbinfo each in process index was built at, polled to pick up reloads of redis
+memory_revisions: dict = {}
+memory_refresh_interval: float = float(os.getenv("MEMORY_INDEXES_REFRESH", "30"))
+memory_refresh_task: Optional[asyncio.Task] = None
+response_cache: ResponseCache = ResponseCache()
+# Misses of the same response are built once, by one worker if responses are shared through redis
+lookup_flights: SingleFlight = SingleFlight("places_lookup")
+
+
+def search_engine(index: RedisIndex) -> Union[RedisIndex, MemoryIndex]:
+    return memory_engines.get(index.name, index)
+
+
+def serialize(model: BaseModel, r: dict, exclude_unset: bool = True) -> Union[str, bytes]:
+    with stage("places.model"):
+        if fast_serialization:
+            return FastSerializer.for_model(model, exclude_unset).dumps(r)
+        return model(**r).json(exclude_unset=exclude_unset, ensure_ascii=False)
+
+
+async def cached_lookup(
+    index: RedisIndex,
+    model: BaseModel,
+    query: str,
+    query_type: QueryType,
+    options: dict,
+    if_none_match: Optional[str],
+) -> Response:
+    """
+    Serves lookups from response_cache, keyed on index revision and normalized query
+    ETag and Cache-Control let clients and CDNs skip unchanged requests altogether
+    In process indexes are fast enough without it
+    """
+    engine = search_engine(index)
+    revision: Optional[str] = None
+    if engine is index:
+        revision = await response_cache.revision(index.name)
+
+    if revision is None:
+        r = await engine.search(query, query_type, **options)
+        return Response(content=serialize(model, r), media_type="application/json")
+
+    key: str = response_cache.key(
+        index.name, revision, {"query": query, "query_type": query_type.value, **options}
+    )
+    headers: dict = response_cache.headers(key)
+    if response_cache.not_modified(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    body: Optional[str] = await response_cache.get(key)
+    if body is None:
+
+        async def build() -> Union[str, bytes]:
+            r = await engine.search(query, query_type, **options)
+            body = serialize(model, r)
+            await response_cache.set(key, body)
+            return body
+
+        published = (lambda: response_cache.get(key)) if response_cache.use_redis else None
+        body = await lookup_flights.do(key, build, published)
+
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+async def index_revision(index: RedisIndex) -> str:
+    return await connection.hget(f"dbinfo:{index.name}", "revision") or "0"
+
+
+async def fetch_rows(index: RedisIndex) -> list:
+    """
+    Current documents of index as (key, mapping) pairs, keys without generation prefix like csv rows
+    """
+    reply: list = await connection.execute_command("FT.SEARCH", index.name, "*", "LIMIT", 0, 10000)
+    return [
+        (index.document_id(reply[i]), dict(zip(reply[i + 1][::2], reply[i + 1][1::2])))
+        for i in range(1, len(reply) - 1, 2)
+    ]
+
+
+async def refresh_memory_indexes() -> list:
+    """
+    Builds in process indexes from redis, and rebuilds them when their revision in dbinfo changed,
+    e.g. after populate-db. Engines are built aside and swapped in, returns names of built indexes
+    """
+    built: list = []
+    for index in (CountryIndex(), TimeZoneIndex()):
+        if index.name not in memory_indexes:
+            continue
+        revision: str = await index_revision(index)
+        if index.name not in memory_engines or memory_revisions.get(index.name) != revision:
+            memory_engines[index.name] = MemoryIndex(index).load(await fetch_rows(index))
+            built.append(index.name)
+        memory_revisions[index.name] = revision
+    return built
+
+
+async def refresh_memory_forever() -> None:
+    while True:
+        await asyncio.sleep(memory_refresh_interval)
+        try:
+            await refresh_memory_indexes()
+        except RedisError:
+            pass
+
+
+@router.on_event("startup")
+async def load_memory_indexes() -> None:
+    """
+    Builds in process indexes from redis, every worker reads the same loaded data
+    Indexes that could not be built yet are searched in redis until a refresh builds them
+    """
+    global memory_refresh_task
+    if not memory_indexes:
+        return
+    try:
+        await refresh_memory_indexes()
+    except RedisError:
+        pass
+    if memory_refresh_task is None:
+        memory_refresh_task = asyncio.create_task(refresh_memory_forever())
+
+
+@router.on_event("shutdown")
+async def stop_memory_refresh() -> None:
+    global memory_refresh_task
+    if memory_refresh_task is not None:
+        memory_refresh_task.cancel()
+        try:
+            await memory_refresh_task
+        except asyncio.CancelledError:
+            pass
+        memory_refresh_task = None
+
+
+def search_options(index: RedisIndex):
+    """
+    Builds query parameters for scoping, paging, sorting and projecting search on index
+    Field names are enums, so that docs list them and unknown fields return 422
+    """
+    name: str = index.__class__.__name__
+    fields = Enum(f"{name}Field", {f: f for f in index.get_field_names()}, type=str)
+    sortable = Enum(f"{name}SortField", {f: f for f in index.get_sortable_fields()}, type=str)
+
+    def options(
+        search_fields: List[fields] = Query(
+            None, description="Search only in these fields, text and code fields are searched by default. Codes and ids match whole values and numeric fields match exact numbers"
+        ),
+        offset: int = Query(0, ge=0),
+        limit: int = Query(10, ge=0, le=max_search_limit),
+        sort_by: Optional[sortable] = Query(
+            None, description="Results are sorted by relevance by default"
+        ),
+        sort_asc: bool = True,
+        return_fields: List[fields] = Query(
+            None, description="Return only these fields, id is always returned"
+        ),
+    ) -> dict:
+        return {
+            "fields": [f.value for f in search_fields or []],
+            "offset": offset,
+            "limit": limit,
+            "sort_by": sort_by.value if sort_by else None,
+            "sort_asc": sort_asc,
+            "return_fields": [f.value for f in return_fields or []],
+        }
+
+    return options
+
 country_lookup_responses = {
     200: {
         "model": CountrySearch,
@@ -48,10 +242,18 @@ country_lookup_responses = {
 }
 
 
-@router.get("/country-lookup", responses=country_lookup_responses, tags=["Places"])
+@router.get(
+    "/country-lookup",
+    responses=country_lookup_responses,
+    response_model=CountrySearch,
+    response_model_exclude_unset=True,
+    tags=["Places"],
+)
 async def country_lookup(
     query: str,
     query_type: QueryType,
+    options: dict = Depends(search_options(CountryIndex())),
+    if_none_match: Optional[str] = Header(None),
 ):
     """
     Lookup basic details about any country.
@@ -64,11 +266,10 @@ async def country_lookup(
     \n
     "fuzzy" = Will return documents that match for **"%input%"**
     \n
-    Search in any field.
+    Search in any field, or only in **search_fields**. Use **offset** and **limit** to page through results and **return_fields** to fetch only what is needed.
     """
 
-    r = await CountryIndex().search(query, query_type)
-    return CountrySearch(**r)
+    return await cached_lookup(CountryIndex(), CountrySearch, query, query_type, options, if_none_match)
 
 
 timezone_lookup_responses = {
@@ -98,10 +299,18 @@ timezone_lookup_responses = {
 }
 
 
-@router.get("/timezone-lookup", responses=timezone_lookup_responses, tags=["Places"])
+@router.get(
+    "/timezone-lookup",
+    responses=timezone_lookup_responses,
+    response_model=TimeZoneSearch,
+    response_model_exclude_unset=True,
+    tags=["Places"],
+)
 async def timezone_lookup(
     query: str,
     query_type: QueryType,
+    options: dict = Depends(search_options(TimeZoneIndex())),
+    if_none_match: Optional[str] = Header(None),
 ):
     """
     Lookup timezone by country or timezone name.
@@ -114,11 +323,10 @@ async def timezone_lookup(
     \n
     "fuzzy" = Will return documents that match for **"%input%"**
     \n
-    Search in any field.
+    Search in any field, or only in **search_fields**. Use **offset** and **limit** to page through results and **return_fields** to fetch only what is needed.
     """
 
-    r = await TimeZoneIndex().search(query, query_type)
-    return TimeZoneSearch(**r)
+    return await cached_lookup(TimeZoneIndex(), TimeZoneSearch, query, query_type, options, if_none_match)
 
 
 place_lookup_responses = {
@@ -151,10 +359,18 @@ place_lookup_responses = {
 }
 
 
-@router.get("/place-lookup", responses=place_lookup_responses, tags=["Places"])
+@router.get(
+    "/place-lookup",
+    responses=place_lookup_responses,
+    response_model=CitySearch,
+    response_model_exclude_unset=True,
+    tags=["Places"],
+)
 async def place_lookup(
     query: str,
     query_type: QueryType,
+    options: dict = Depends(search_options(CityIndex())),
+    if_none_match: Optional[str] = Header(None),
 ):
     """
     Lookup cities or states by country, state, or cities.
@@ -167,8 +383,109 @@ async def place_lookup(
     \n
     "fuzzy" = Will return documents that match for **"%input%"**
     \n
-    Search in any field.
+    Search in any field, or only in **search_fields**. Use **offset** and **limit** to page through results and **return_fields** to fetch only what is needed.
+    """
+
+    return await cached_lookup(CityIndex(), CitySearch, query, query_type, options, if_none_match)
+
+
+place_suggest_responses = {
+    200: {
+        "model": PlaceSuggestions,
+        "description": "Returns autocomplete suggestions for given prefix, best matches first",
+        "content": {
+            "application/json": {
+                "example": {
+                    "total": 2,
+                    "records": [
+                        {
+                            "id": "city:57933:state:4026:country:101",
+                            "name": "Bengaluru, Karnataka, India",
+                            "score": 0.4,
+                        },
+                        {
+                            "id": "city:57934:state:4026:country:101",
+                            "name": "Bengaluru Urban, Karnataka, India",
+                            "score": 0.3,
+                        },
+                    ],
+                }
+            }
+        },
+    }
+}
+
+
+@router.get("/place-suggest", responses=place_suggest_responses, tags=["Places"])
+async def place_suggest(
+    query: str = Query(..., min_length=1),
+    index: SuggestIndex = SuggestIndex.cities,
+    fuzzy: bool = False,
+    limit: int = Query(10, ge=1, le=50),
+):
+    """
+    Autocomplete cities or countries while user is typing.
+    \n
+    Matches beginning of "city, state, country" for cities and of country name for countries. Use **id** with other lookups.
+    \n
+    "fuzzy" = Also matches prefixes with one typo. It can be slow for prefixes shorter than 3 letters.
+    """
+
+    suggest_indexes = {
+        SuggestIndex.cities: CityIndex,
+        SuggestIndex.countries: CountryIndex,
+    }
+    r = await suggest_indexes[index]().suggest(query, fuzzy=fuzzy, limit=limit)
+    return Response(content=serialize(PlaceSuggestions, r, exclude_unset=False), media_type="application/json")
+
+
+place_nearby_responses = {
+    200: {
+        "model": NearbyCities,
+        "description": "Returns cities within radius of given point, nearest first",
+        "content": {
+            "application/json": {
+                "example": {
+                    "total": 1,
+                    "records": [
+                        {
+                            "id": "city:57933:state:4026:country:101",
+                            "name": "Bengaluru",
+                            "state_id": "4026",
+                            "state_code": "KA",
+                            "state_name": "Karnataka",
+                            "country_id": "101",
+                            "country_code": "IN",
+                            "country_name": "India",
+                            "latitude": "12.97194000",
+                            "longitude": "77.59369000",
+                            "distance_km": 0.412,
+                        }
+                    ],
+                }
+            }
+        },
+    }
+}
+
+
+@router.get(
+    "/place-nearby",
+    responses=place_nearby_responses,
+    response_model=NearbyCities,
+    tags=["Places"],
+)
+async def place_nearby(
+    latitude: float = Query(..., ge=-max_latitude, le=max_latitude),
+    longitude: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(50, gt=0, le=max_nearby_radius),
+    limit: int = Query(10, ge=1, le=max_search_limit),
+):
+    """
+    Reverse geocoding, find cities nearest to given latitude and longitude.
+    \n
+    Only cities within **radius_km** are returned, sorted by **distance_km**. Use **limit** of 1 to get the nearest city.
     """
 
-    r = await CityIndex().search(query, query_type)
-    return CitySearch(**r)
+    r = await CityIndex().nearby(latitude, longitude, radius_km, limit=limit)
+    return Response(content=serialize(NearbyCities, r, exclude_unset=False), media_type="application/json")
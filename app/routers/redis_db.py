@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException
 import models
 from db.async_db import build_db_info
+from db.connection import redis_manager
 from redis.exceptions import ConnectionError
 
 router = APIRouter()
@@ -25,3 +26,18 @@ async def redis_info():
             detail="Server info could not be retrieved. Check if Redis is running",
         )
 
+
+
+@router.get(
+    "/redis-pool-info",
+    tags=["Redis DB"],
+    response_model=models.RedisPoolInfo,
+)
+async def redis_pool_info():
+    """
+    Connection pool usage of this worker. **timeouts** and **waiting** above zero mean requests are queueing for connections, raise **REDIS_MAX_CONNECTIONS** or add workers.
+    \n
+    **raw** is the pool of raw replies used with **SEARCH_RAW_REPLIES**, present once it has been used.
+    """
+
+    return models.RedisPoolInfo(**redis_manager.info())
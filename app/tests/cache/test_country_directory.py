@@ -0,0 +1,44 @@
+import asyncio
+import csv
+import os
+from unittest.mock import AsyncMock, patch
+from cache.countries import CountryDirectory, phone_codes
+from db.indexes import connection
+
+countries_csv = os.path.join(os.path.dirname(__file__), "..", "..", "downloads", "countries.csv")
+
+with open(countries_csv, encoding="utf-8", newline="") as f:
+    records = list(csv.DictReader(f))
+
+
+def test_phone_codes():
+    assert phone_codes("91") == ["91"]
+    assert phone_codes("+1-787 and 1-939") == ["1787", "1939"]
+
+
+def test_lookups():
+    directory = CountryDirectory()
+    directory.load(records, "1")
+    assert directory.get_iso2("in")["name"] == "India"
+    assert {c["iso2"] for c in directory.get_phone_code("+1")} >= {"US", "CA"}
+    assert [c["iso2"] for c in directory.get_phone_code("1-268")] == ["AG"]
+    assert {c["iso2"] for c in directory.get_currency("eur")} >= {"DE", "FR"}
+    assert directory.get_currency("XYZ") == []
+
+
+def test_timezones_by_country():
+    directory = CountryDirectory()
+    india = next(r for r in records if r["iso2"] == "IN")
+    timezone = {"id": "1", "zone_name": "Asia/Kolkata", "country_id": india["id"]}
+    directory.load([india | {"id": f"country:{india['id']}"}], "1", [timezone])
+    assert directory.get_timezones("in") == [timezone]
+
+
+def test_refresh_on_revision_change():
+    directory = CountryDirectory()
+    with patch.object(connection, "hget", AsyncMock(return_value="4")), \
+            patch.object(CountryDirectory, "fetch", side_effect=[records, []]) as fetch:
+        assert asyncio.run(directory.refresh()), "Should load on first refresh"
+        assert not asyncio.run(directory.refresh()), "Should not reload same revision"
+    assert fetch.call_count == 2, "Should fetch countries and timezones once"
+    assert directory.revision == "4:4"
@@ -0,0 +1,34 @@
+import asyncio
+import dns.resolver
+from types import SimpleNamespace
+from unittest.mock import patch
+from cache.domains import DomainResolver
+
+
+class Answer(list):
+    def __init__(self, records, ttl=3600):
+        super().__init__(records)
+        self.rrset = SimpleNamespace(ttl=ttl)
+
+
+def test_domain_resolver_caches_mx_answer():
+    resolver = DomainResolver()
+    answer = Answer([SimpleNamespace(exchange="mx.example.com.")])
+
+    with patch.object(DomainResolver, "query", return_value=answer) as mocked:
+        first = asyncio.run(resolver.check("example.com"))
+        second = asyncio.run(resolver.check("EXAMPLE.com"))
+
+    assert first == second == {"deliverable": True, "detail": None}
+    assert mocked.call_count == 1, "Domain should be resolved only once per TTL"
+
+
+def test_domain_resolver_caches_nxdomain():
+    resolver = DomainResolver()
+
+    with patch.object(DomainResolver, "query", side_effect=dns.resolver.NXDOMAIN) as mocked:
+        first = asyncio.run(resolver.check("example.invalid"))
+        asyncio.run(resolver.check("example.invalid"))
+
+    assert not first["deliverable"], "Domain without any record should not be deliverable"
+    assert mocked.call_count == 3, "Negative answer should be cached after MX, A and AAAA lookups"
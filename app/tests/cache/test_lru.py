@@ -0,0 +1,19 @@
+from cache import LRUCache
+
+
+def test_lru_cache_evicts_least_recently_used():
+    c = LRUCache(maxsize=2)
+    c.set("a", 1)
+    c.set("b", 2)
+    assert c.get("a") == 1, "Should return cached value"
+    c.set("c", 3)
+    assert c.get("b") is None, "Least recently used key should be evicted"
+    assert c.info()["evictions"] == 1
+    assert c.info()["hits"] == 1
+    assert c.info()["misses"] == 1
+
+
+def test_lru_cache_disabled():
+    c = LRUCache(maxsize=0)
+    c.set("a", 1)
+    assert c.get("a") is None, "maxsize 0 should disable caching"
@@ -0,0 +1,18 @@
+from cache.responses import ResponseCache
+
+
+def test_key_normalization():
+    params = {"query": "New  Delhi", "query_type": "exact", "fields": ["name", "capital"], "offset": 0, "limit": 10}
+    key = ResponseCache.key("countries", "7", params)
+    assert key.startswith("countries:7:")
+    assert key == ResponseCache.key("countries", "7", params | {"query": " new delhi", "fields": ["capital", "name"]})
+    assert key != ResponseCache.key("countries", "8", params), "Should change with revision"
+    assert key != ResponseCache.key("countries", "7", params | {"offset": 10}), "Should change with paging"
+
+
+def test_not_modified():
+    etag = ResponseCache.etag("countries:7:abc")
+    assert etag == '"7-abc"'
+    assert ResponseCache.not_modified(f'"other", W/{etag}', etag)
+    assert not ResponseCache.not_modified(None, etag)
+    assert not ResponseCache.not_modified('"7-abd"', etag)
@@ -0,0 +1,91 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+from cache.domains import DomainResolver
+from cache.singleflight import SingleFlight
+from db.connection import connection
+
+
+def test_singleflight_shares_one_call():
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"total": 1}
+
+    async def run():
+        flights = SingleFlight("test", use_redis_lock=False)
+        results = await asyncio.gather(*[flights.do("india", fn) for _ in range(5)])
+        again = await flights.do("india", fn)
+        return flights, results, again
+
+    flights, results, again = asyncio.run(run())
+    assert len(calls) == 2, "Concurrent calls should share one execution, later calls run again"
+    assert all(r is results[0] for r in results)
+    assert flights.info() == {"in_flight": 0, "calls": 2, "shared": 4}
+
+
+def test_singleflight_errors_and_cancellation():
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("lookup failed")
+
+    async def slow():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def run():
+        flights = SingleFlight("test", use_redis_lock=False)
+        errors = await asyncio.gather(*[flights.do("a", fail) for _ in range(3)], return_exceptions=True)
+        first = asyncio.create_task(flights.do("b", slow))
+        second = asyncio.create_task(flights.do("b", slow))
+        await asyncio.sleep(0)
+        first.cancel()
+        return errors, await second
+
+    errors, result = asyncio.run(run())
+    assert all(isinstance(e, ValueError) for e in errors), "Every caller should get the exception"
+    assert result == "done", "Cancelled caller should not cancel the call for others"
+
+
+def test_singleflight_redis_lock_follower():
+    fn = AsyncMock(return_value="built here")
+    published = AsyncMock(side_effect=[None, "built by other worker"])
+
+    async def run():
+        flights = SingleFlight("test", use_redis_lock=True, poll_interval=0)
+        return await flights.do("key", fn, published)
+
+    with patch.object(connection, "set", AsyncMock(return_value=None)), patch.object(
+        connection, "exists", AsyncMock(return_value=1)
+    ):
+        assert asyncio.run(run()) == "built by other worker"
+    fn.assert_not_called()
+
+
+def test_singleflight_redis_lock_leader():
+    fn = AsyncMock(return_value="built here")
+    release = AsyncMock(return_value=1)
+
+    async def run():
+        flights = SingleFlight("test", use_redis_lock=True)
+        return await flights.do("key", fn, AsyncMock(return_value=None))
+
+    with patch.object(connection, "set", AsyncMock(return_value=True)), patch.object(connection, "eval", release):
+        assert asyncio.run(run()) == "built here"
+    assert release.call_args.args[2] == "singleflight:test:key", "Lock should be released by its holder"
+
+
+def test_domain_resolver_coalesces_lookups():
+    async def resolve(domain):
+        await asyncio.sleep(0.01)
+        return DomainResolver.deliverable(), 300
+
+    async def run(resolver):
+        return await asyncio.gather(*[resolver.check("Example.com") for _ in range(10)])
+
+    resolver = DomainResolver(use_redis=False)
+    with patch.object(DomainResolver, "resolve", side_effect=resolve) as mocked:
+        results = asyncio.run(run(resolver))
+    assert mocked.call_count == 1, "Burst of checks should resolve the domain once"
+    assert all(r["deliverable"] for r in results)
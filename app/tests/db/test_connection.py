@@ -0,0 +1,44 @@
+import asyncio
+import os
+import pytest
+from redis.exceptions import ConnectionError
+from db.connection import ConnectionProxy, MeteredConnectionPool, RedisManager
+
+
+class FakeConnection:
+    def __init__(self, **kwargs):
+        self.pid = os.getpid()
+
+    async def connect(self):
+        pass
+
+    async def can_read_destructive(self):
+        return False
+
+    async def disconnect(self):
+        pass
+
+
+def test_pool_metrics():
+    async def run():
+        pool = MeteredConnectionPool(max_connections=1, timeout=0.05, connection_class=FakeConnection)
+        conn = await pool.get_connection("GET")
+        with pytest.raises(ConnectionError):
+            await pool.get_connection("GET")
+        info = pool.info()
+        await pool.release(conn)
+        return info, pool.info()
+
+    busy, idle = asyncio.run(run())
+    assert busy["in_use"] == 1 and busy["created"] == 1
+    assert busy["timeouts"] == 1, "Should count requests that gave up waiting for a connection"
+    assert idle["in_use"] == 0 and idle["peak_in_use"] == 1 and idle["acquired"] == 1
+
+
+def test_manager_close():
+    manager = RedisManager()
+    proxy = ConnectionProxy(manager)
+    client = manager.client
+    assert proxy.connection_pool is client.connection_pool, "Proxy should use manager's client"
+    asyncio.run(manager.close())
+    assert manager.client is not client, "A new client should be created after close"
@@ -1,6 +1,23 @@
+import aiohttp
+import asyncio
+import os
+import pytest
+import time
 from redis.exceptions import ConnectionError
-from unittest.mock import patch
-from db.async_db import ManageCountries
+from unittest.mock import AsyncMock, MagicMock, patch
+from db import indexes
+from db.async_db import (
+    InvalidSchema,
+    ManageCities,
+    ManageCountries,
+    ManageTimezones,
+    WithinSetTime,
+    connection,
+    parse_priorities,
+    populate_indexes,
+)
+from db.indexes import parse_search_reply, raw_connection
+from models import Country
 
 @patch.object(ManageCountries, 'download_file', return_value = None)
 @patch.object(ManageCountries, 'update_db', return_value = None)
@@ -12,3 +29,305 @@ def test_redis_key(mocked):
 async def test_redis_key(mocked):
     d = await ManageCountries().download_file()
     assert not d
+
+
+downloads_dir = os.path.join(os.path.dirname(__file__), "..", "..", "downloads", "")
+
+
+class FakePipeline:
+    def __init__(self, written):
+        self.written = written
+
+    def hset(self, key, mapping):
+        self.written[key] = mapping
+
+    def unlink(self, *keys):
+        self.written.setdefault("unlinked", []).extend(keys)
+
+    def hdel(self, key, *fields):
+        pass
+
+    def execute_command(self, *args):
+        self.written.setdefault(args[0], []).append(args[1:])
+
+    async def execute(self):
+        return []
+
+
+@patch.object(ManageCountries, "base_dir", downloads_dir)
+def test_read_countries_csv():
+    chunks = list(ManageCountries().read_chunks())
+    rows = [row for chunk in chunks for row in chunk]
+    key, mapping = rows[100]
+    assert len(rows) == 250, "Should read every row of countries.csv"
+    assert key == f"country:{mapping['id']}"
+    assert set(mapping) == set(Country.__fields__) | {"location"}, "Should only write model fields and location"
+    assert mapping["location"] == f"{mapping['longitude']},{mapping['latitude']}"
+
+
+@patch.object(ManageTimezones, "base_dir", downloads_dir)
+def test_read_timezones_csv():
+    rows = [row for chunk in ManageTimezones().read_chunks() for row in chunk]
+    assert len(rows) > 250, "Countries can have more than one timezone"
+    assert rows[0][1]["zone_name"] == "Asia/Kabul"
+
+
+@patch.object(ManageCountries, "base_dir", downloads_dir)
+@patch.object(ManageCountries, "max_allowed_commands", 100)
+@patch.object(ManageCountries, "update_db_info")
+def test_load_rows(mocked):
+    written = {}
+    with patch.object(connection, "pipeline", side_effect=lambda **kw: FakePipeline(written)):
+        report = asyncio.run(ManageCountries().load_rows())
+    assert report["rows"] == len(written) == 250, "Should write every row once"
+    mocked.assert_called_once()
+
+
+def test_check_schema():
+    with pytest.raises(InvalidSchema):
+        ManageCountries().check_schema(["id", "name"])
+
+
+def test_document_id_strips_generation():
+    index = ManageCities.index
+    key = f"{index.generation_prefix(42)}city:1:state:2:country:3"
+    assert index.document_id(key) == "city:1:state:2:country:3"
+    assert index.document_id("city:1:state:2:country:3") == "city:1:state:2:country:3"
+
+
+def test_drop_retired():
+    manager = ManageCities()
+    zrangebyscore = AsyncMock(return_value=["3"])
+    with patch.object(connection, "zrangebyscore", zrangebyscore), \
+            patch.object(connection, "zrem", AsyncMock()) as zrem, \
+            patch.object(manager.index, "drop_generation", AsyncMock()) as drop:
+        assert asyncio.run(manager.drop_retired()) == [3]
+    assert zrangebyscore.call_args.args[0] == "dbinfo:cities:retired"
+    assert zrangebyscore.call_args.args[2] < time.time() - manager.retire_after + 1, "Should keep recently retired generations"
+    drop.assert_awaited_once_with(3)
+    zrem.assert_awaited_once_with("dbinfo:cities:retired", "3")
+
+
+def test_swap_alias_drops_legacy_in_transaction():
+    pipe = MagicMock()
+    pipe.execute = AsyncMock()
+    index = ManageCountries.index
+    with patch.object(connection, "pipeline", return_value=pipe) as pipeline:
+        asyncio.run(index.swap_alias(7, legacy=True))
+    assert pipeline.call_args.kwargs == {"transaction": True}, "Legacy index should be replaced atomically"
+    assert [c.args for c in pipe.execute_command.call_args_list] == [
+        ("FT.DROPINDEX", index.name),
+        ("FT.ALIASUPDATE", index.name, index.generation_name(7)),
+    ]
+    pipe.execute.assert_awaited_once()
+
+
+@patch.object(ManageCountries, "base_dir", downloads_dir)
+@patch.object(ManageCountries, "update_db_info")
+def test_load_rows_into_generation(mocked):
+    written = {}
+    manager = ManageCountries()
+    manager.key_prefix = manager.index.generation_prefix(7)
+    with patch.object(connection, "pipeline", side_effect=lambda **kw: FakePipeline(written)):
+        asyncio.run(manager.load_rows())
+    assert all(key.startswith("countries:v7:country:") for key in written), "Should write into generation keyspace"
+
+
+@patch.object(ManageCountries, "base_dir", downloads_dir)
+@patch.object(ManageCountries, "update_db_info")
+def test_sync_rows(mocked):
+    manager = ManageCountries()
+    manager.fingerprints_key = "dbinfo:countries:fingerprints"
+    rows = [row for chunk in manager.read_chunks() for row in chunk]
+    stored = {key: manager.fingerprint(mapping) for key, mapping in rows}
+    del stored[rows[0][0]]
+    stored[rows[1][0]] = "outdated"
+    stored["country:9999"] = manager.fingerprint({})
+
+    async def hscan_iter(key, count):
+        for item in stored.items():
+            yield item
+
+    written = {}
+    with patch.object(connection, "pipeline", side_effect=lambda **kw: FakePipeline(written)), \
+            patch.object(connection, "hscan_iter", side_effect=hscan_iter):
+        report = asyncio.run(manager.sync_rows())
+
+    assert (report["added"], report["changed"], report["removed"]) == (1, 1, 1)
+    assert set(written["dbinfo:countries:fingerprints"]) == {rows[0][0], rows[1][0]}, "Should only write changed rows"
+    assert written["unlinked"] == ["country:9999"]
+
+
+@patch.object(ManageCountries, "base_dir", downloads_dir)
+@patch.object(ManageCountries, "update_db_info")
+def test_sync_rows_unchanged_keeps_revision(mocked):
+    manager = ManageCountries()
+    manager.fingerprints_key = "dbinfo:countries:fingerprints"
+    stored = {key: manager.fingerprint(mapping) for chunk in manager.read_chunks() for key, mapping in chunk}
+
+    async def hscan_iter(key, count):
+        for item in stored.items():
+            yield item
+
+    written = {}
+    with patch.object(connection, "pipeline", side_effect=lambda **kw: FakePipeline(written)), \
+            patch.object(connection, "hscan_iter", side_effect=hscan_iter):
+        report = asyncio.run(manager.sync_rows())
+
+    assert (report["added"], report["changed"], report["removed"]) == (0, 0, 0)
+    mocked.assert_called_once_with(changed=False)
+
+
+@patch.object(ManageCountries, "set_time_has_lapsed", return_value=True)
+@patch.object(ManageCountries, "download_file")
+@patch.object(ManageCountries, "update_db", return_value={"rows": 250})
+@patch.object(ManageCountries, "get_index_info", return_value=250)
+@patch.object(ManageCities, "set_time_has_lapsed", return_value=False)
+@patch.object(ManageCities, "download_file")
+@patch.object(ManageCities, "update_db", side_effect=WithinSetTime)
+def test_populate_indexes(cities_update, cities_download, cities_due, records, update, download, due):
+    results = asyncio.run(populate_indexes([ManageCountries(), ManageCities()]))
+    assert results[0] == {"rows": 250, "records": 250}
+    assert isinstance(results[1], WithinSetTime), "One index being skipped should not stop others"
+    download.assert_called_once()
+    cities_download.assert_not_called()
+
+
+@patch.object(ManageCountries, "set_time_has_lapsed", return_value=True)
+@patch.object(ManageCountries, "download_file", side_effect=aiohttp.ClientError("404"))
+@patch.object(ManageCountries, "update_db")
+@patch.object(ManageCities, "set_time_has_lapsed", return_value=True)
+@patch.object(ManageCities, "download_file")
+@patch.object(ManageCities, "update_db", return_value={"rows": 10})
+@patch.object(ManageCities, "get_index_info", return_value=10)
+def test_populate_indexes_failed_download(records, cities_update, cities_download, cities_due, update, download, due):
+    results = asyncio.run(populate_indexes([ManageCountries(), ManageCities()]))
+    assert isinstance(results[0], aiohttp.ClientError)
+    assert results[1] == {"rows": 10, "records": 10}, "One failed download should not stop others"
+    update.assert_not_called()
+
+
+def test_parse_priorities(caplog):
+    assert parse_priorities("in=5, US=2.5,") == {"IN": 5.0, "US": 2.5}
+    assert parse_priorities("IN=high,=3,US,DE=-1,FR=2") == {"FR": 2.0}, "Malformed entries should be skipped"
+    assert "'IN=high'" in caplog.text
+
+
+@patch.object(ManageCities, "suggestion_priority", {"IN": 5.0})
+def test_write_chunk_suggestions():
+    written = {}
+    manager = ManageCities()
+    manager.suggestions_key = "sug:cities:v3"
+    row = {"id": "1", "name": "Bengaluru", "state_id": "2", "state_name": "Karnataka", "country_id": "101", "country_name": "India", "country_code": "IN"}
+    with patch.object(connection, "pipeline", side_effect=lambda **kw: FakePipeline(written)):
+        asyncio.run(manager.write_chunk([(manager.redis_key(row), row)]))
+    assert written["FT.SUGADD"] == [
+        ("sug:cities:v3", "Bengaluru, Karnataka, India", 5.0, "PAYLOAD", "city:1:state:2:country:101")
+    ]
+
+
+def test_search_query_options():
+    queries = []
+
+    class FakeSearch:
+        async def search(self, q):
+            queries.append(q)
+            doc = type("Document", (), {"id": "cities:v3:city:1:state:2:country:3", "name": "Bengaluru"})
+            return type("Result", (), {"total": 1, "duration": 0.5, "docs": [doc]})
+
+    with patch.object(connection, "ft", return_value=FakeSearch()):
+        r = asyncio.run(
+            ManageCities.index.search(
+                "beng", "wildcard", fields=["name"], offset=10, limit=5, sort_by="name", return_fields=["name"]
+            )
+        )
+
+    args = queries[0].get_args()
+    assert args[0] == "@name:(beng*)"
+    assert ["LIMIT", 10, 5] == args[args.index("LIMIT"):args.index("LIMIT") + 3]
+    assert "SORTBY" in args and "RETURN" in args
+    assert r["records"] == [{"name": "Bengaluru", "id": "city:1:state:2:country:3"}]
+
+
+def test_parse_search_reply():
+    reply = [
+        2,
+        b"cities:v3:city:1:state:2:country:3",
+        [b"name", "Bengaluru".encode(), b"location", b"77.59,12.97", b"state_name", "Karnātaka".encode()],
+        b"cities:v3:city:4:state:2:country:3",
+        [b"name", b"Mysuru"],
+        b"cities:v3:city:5:state:2:country:3",
+        [b"name", b"Mangaluru", b"state_name", "Karnātaka".encode()],
+    ]
+    records = parse_search_reply(reply, ["name", "state_name"], ManageCities.index.document_id)
+    assert records == [
+        {"name": "Bengaluru", "state_name": "Karnātaka", "id": "city:1:state:2:country:3"},
+        {"name": "Mysuru", "state_name": None, "id": "city:4:state:2:country:3"},
+        {"name": "Mangaluru", "state_name": "Karnātaka", "id": "city:5:state:2:country:3"},
+    ], "Should decode only listed fields and fill missing ones with None"
+    assert records[0]["state_name"] is records[2]["state_name"], "Repeated values should be decoded once"
+
+
+def test_search_raw_replies():
+    reply = [1, b"cities:v3:city:1:state:2:country:3", [b"name", b"Bengaluru"]]
+    command = AsyncMock(return_value=reply)
+    with patch.object(indexes, "search_raw_replies", True), patch.object(raw_connection, "execute_command", command):
+        r = asyncio.run(ManageCities.index.search("beng", "wildcard", fields=["name"], return_fields=["name"]))
+    assert command.call_args.args[:3] == ("FT.SEARCH", ManageCities.index.name, "@name:(beng*)")
+    assert r["total"] == 1
+    assert r["records"] == [{"name": "Bengaluru", "id": "city:1:state:2:country:3"}]
+
+
+def test_search_coalesces_identical_queries():
+    class FakeSearch:
+        calls = 0
+
+        async def search(self, q):
+            FakeSearch.calls += 1
+            await asyncio.sleep(0.01)
+            return type("Result", (), {"total": 0, "duration": 0.5, "docs": []})
+
+    async def run():
+        return await asyncio.gather(
+            *[ManageCities.index.search("india", "exact") for _ in range(5)],
+            ManageCities.index.search("india", "exact", limit=5),
+        )
+
+    with patch.object(connection, "ft", return_value=FakeSearch()):
+        asyncio.run(run())
+    assert FakeSearch.calls == 2, "Identical concurrent searches should share one FT.SEARCH"
+
+
+def test_query_string_field_types():
+    index = ManageCities.index
+    assert index.query_string("IN", "exact", ["country_code"]) == "@country_code:{IN}"
+    assert index.query_string("new delhi", "wildcard", ["name", "state_name"]) == "@name|state_name:(new delhi*)"
+    assert index.query_string("12.5", "exact", ["latitude"]) == "@latitude:[12.5 12.5]"
+    assert index.query_string("beng", "exact", ["latitude"]) == "", "Numeric fields only match numbers"
+    assert index.query_string("beng", "fuzzy", ["state_code"]) == "", "Tags cannot be matched fuzzily"
+    assert index.query_string("+358-18", "exact").startswith("(+358-18)|@id:{\\+358\\-18}")
+    assert "location" not in index.get_field_names()
+
+
+def test_location():
+    assert ManageCities.location({"latitude": "12.97", "longitude": "77.59"}) == "77.59,12.97"
+    assert ManageCities.location({"latitude": "", "longitude": "77.59"}) is None
+    assert ManageCities.location({"latitude": "-89.5", "longitude": "0"}) is None, "Out of redis geo range"
+
+
+def test_nearby_aggregate():
+    requests = []
+
+    class FakeSearch:
+        async def aggregate(self, req):
+            requests.append(req)
+            row = ["__key", "cities:v3:city:1:state:2:country:3", "location", "77.59,12.97", "name", "Bengaluru", "distance", "412.3"]
+            return type("AggregateResult", (), {"rows": [row]})
+
+    with patch.object(connection, "ft", return_value=FakeSearch()):
+        r = asyncio.run(ManageCities.index.nearby(12.97, 77.59, 10, limit=1, return_fields=["name"]))
+
+    args = requests[0].build_args()
+    assert args[0] == "@location:[77.59 12.97 10 km]"
+    assert ["SORTBY", "2", "@distance", "ASC", "MAX", "1"] == args[args.index("SORTBY"):args.index("SORTBY") + 6]
+    assert r == {"total": 1, "records": [{"name": "Bengaluru", "id": "city:1:state:2:country:3", "distance_km": 0.412}]}
@@ -0,0 +1,98 @@
+import asyncio
+import os
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from unittest.mock import patch
+from db.async_db import ManageCountries, ManageTimezones, RedisDBBase
+
+content = b"id,name\n" + b"".join(f"{i},country {i}\n".encode() for i in range(5000))
+
+
+async def serve(tmp_path, scenario):
+    """
+    Serves content from a local file, aiohttp handles ETag, If-None-Match and Range
+    """
+    source = tmp_path / "source.csv"
+    source.write_bytes(content)
+    statuses = []
+
+    async def record_status(request, response):
+        statuses.append(response.status)
+
+    async def handler(request):
+        return web.FileResponse(source)
+
+    app = web.Application()
+    app.on_response_prepare.append(record_status)
+    app.router.add_get("/countries.csv", handler)
+
+    async with TestServer(app) as server:
+        url = str(server.make_url("/countries.csv"))
+        with patch.object(RedisDBBase, "base_dir", f"{tmp_path}/"), \
+                patch.object(RedisDBBase, "downloads", {}), \
+                patch.object(ManageCountries, "url", url), \
+                patch.object(ManageTimezones, "url", url):
+            await scenario()
+
+    return statuses
+
+
+def test_download_is_shared_and_conditional(tmp_path):
+    async def scenario():
+        await asyncio.gather(ManageCountries().download_file(), ManageTimezones().download_file())
+        assert (tmp_path / "countries.csv").read_bytes() == content
+
+        r = await ManageCountries().download_file()
+        assert r.startswith("Not modified"), "Unchanged file should not be downloaded again"
+
+    statuses = asyncio.run(serve(tmp_path, scenario))
+    assert statuses == [200, 304], "Countries csv should be fetched once for both managers"
+
+
+def test_download_checksum_mismatch(tmp_path):
+    async def scenario():
+        await ManageCountries().download_file()
+        (tmp_path / "countries.csv").write_bytes(b"corrupted")
+
+        await ManageCountries().download_file()
+        assert (tmp_path / "countries.csv").read_bytes() == content
+
+    statuses = asyncio.run(serve(tmp_path, scenario))
+    assert statuses == [200, 200], "Corrupted local file should be downloaded again"
+
+
+def test_download_resume(tmp_path):
+    async def scenario():
+        manager = ManageCountries()
+        await manager.download_file()
+        meta = manager.read_meta()
+
+        # Simulate an interrupted download of the same file
+        os.remove(manager.file_path)
+        with open(f"{manager.file_path}.part", "wb") as f:
+            f.write(content[:1000])
+        manager.write_meta({"partial": meta["etag"]})
+
+        r = await ManageCountries().download_file()
+        assert r.startswith("Resumed")
+        assert (tmp_path / "countries.csv").read_bytes() == content
+
+    statuses = asyncio.run(serve(tmp_path, scenario))
+    assert statuses == [200, 206], "Interrupted download should be resumed with a range request"
+
+
+def test_download_is_forgotten_when_done(tmp_path):
+    async def scenario():
+        await ManageCountries().download_file()
+        assert RedisDBBase.downloads == {}, "Finished download should not stay shared"
+        with patch.object(ManageCountries, "fetch_file", side_effect=OSError("disk full")):
+            try:
+                await ManageCountries().download_file()
+            except OSError:
+                pass
+        assert RedisDBBase.downloads == {}, "Failed download should not stay shared"
+        r = await ManageCountries().download_file()
+        assert r.startswith("Not modified")
+
+    statuses = asyncio.run(serve(tmp_path, scenario))
+    assert statuses == [200, 304]
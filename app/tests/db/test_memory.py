@@ -0,0 +1,47 @@
+import asyncio
+import os
+from unittest.mock import patch
+from db.async_db import ManageCountries, ManageTimezones
+from db.memory import MemoryIndex, within_one_edit
+
+downloads_dir = os.path.join(os.path.dirname(__file__), "..", "..", "downloads", "")
+
+
+def load(manager):
+    with patch.object(type(manager), "base_dir", downloads_dir):
+        rows = [row for chunk in manager.read_chunks() for row in chunk]
+    return MemoryIndex(manager.index).load(rows)
+
+
+countries = load(ManageCountries())
+timezones = load(ManageTimezones())
+
+
+def search(index, *args, **kwargs):
+    return asyncio.run(index.search(*args, **kwargs))
+
+
+def test_exact_code_and_text():
+    r = search(countries, "IN", "exact")
+    assert r["records"][0]["name"] == "India", "Codes should match whole tag values"
+    r = search(countries, "india", "exact", fields=["name"])
+    assert [c["id"] for c in r["records"]] == ["country:101"]
+    r = search(countries, "new delhi", "exact", fields=["capital"], return_fields=["name"])
+    assert r["records"] == [{"name": "India", "id": "country:101"}]
+
+
+def test_wildcard_and_fuzzy():
+    r = search(countries, "germ", "wildcard", fields=["name"])
+    assert [c["name"] for c in r["records"]] == ["Germany"]
+    assert search(countries, "g", "wildcard", fields=["name"])["total"] == 0, "Prefix needs at least 2 letters"
+    r = search(countries, "germeny", "fuzzy", fields=["name"])
+    assert [c["name"] for c in r["records"]] == ["Germany"]
+    assert within_one_edit("india", "indie") and not within_one_edit("india", "inida")
+
+
+def test_numeric_sort_and_paging():
+    r = search(timezones, "19800", "exact", fields=["gmt_offset"])
+    assert {z["zone_name"] for z in r["records"]} >= {"Asia/Kolkata"}
+    r = search(timezones, "america", "wildcard", fields=["zone_name"], sort_by="zone_name", offset=1, limit=2)
+    assert r["total"] > 3
+    assert [z["zone_name"] for z in r["records"]] == sorted(z["zone_name"] for z in r["records"])
@@ -0,0 +1,42 @@
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+from routers.countries import directory
+from main import fastapi_application
+
+client = TestClient(fastapi_application)
+
+india = {"id": "country:101", "name": "India", "iso2": "IN", "phone_code": "91", "currency": "INR"}
+
+
+def loaded():
+    return patch.multiple(
+        directory,
+        revision="1",
+        by_iso2={"IN": india},
+        by_phone_code={"91": [india]},
+        by_currency={"INR": [india]},
+    )
+
+
+def test_get_country_by_iso2():
+    with loaded():
+        response = client.get("/countries/in")
+    assert response.status_code == 200, "Should return a valid response code, 200"
+    assert response.json()["name"] == "India"
+
+
+def test_get_countries_by_phone_code_and_currency():
+    with loaded():
+        by_phone = client.get("/countries/by-phone-code/+91")
+        by_currency = client.get("/countries/by-currency/inr")
+        missing = client.get("/countries/by-currency/xyz")
+    assert by_phone.json()["records"][0]["iso2"] == "IN"
+    assert by_currency.json()["total"] == 1
+    assert missing.status_code == 404, "Should return 404 for unknown currency"
+
+
+def test_get_country_not_loaded():
+    with patch.object(directory, "revision", None):
+        response = client.get("/countries/IN")
+    assert response.status_code == 503, "Should return 503 until countries are loaded"
+    assert client.get("/countries/IND").status_code == 422, "Should return 422 for invalid iso2"
@@ -1,5 +1,7 @@
 from fastapi.testclient import TestClient
+from unittest.mock import patch
 from main import fastapi_application
+from routers.email import domain_resolver
 
 client = TestClient(fastapi_application)
 
@@ -15,3 +17,39 @@ def test_get_validate_phone_number_422():
     response = client.get("/validate-email", params={"email": ""})
     assert response.status_code == 422, "Should return 422 for missing email input"
 
+
+
+@patch.object(domain_resolver, "check", return_value={"deliverable": True, "detail": None})
+def test_get_validate_email_normalized(mocked):
+    response = client.get("/validate-email", params={"email": " Anjum@Sahl.Solutions"})
+    assert response.status_code == 200, "Should return a valid response code, 200"
+    assert response.json() == valid_email_result, "Should return normalized email"
+    mocked.assert_called_once_with("sahl.solutions")
+
+
+@patch.object(domain_resolver, "check", return_value={"deliverable": False, "detail": "The domain name example.invalid does not exist."})
+def test_get_validate_email_undeliverable(mocked):
+    response = client.get("/validate-email", params={"email": "anjum@example.invalid"})
+    assert response.status_code == 422, "Should return 422 for domain without MX record"
+
+
+@patch.object(domain_resolver, "check", return_value={"deliverable": True, "detail": None})
+def test_post_validate_email_batch(mocked):
+    emails = ["Anjum@Sahl.Solutions ", "test@sahl.solutions", "not-an-email"]
+    response = client.post("/validate-email/batch", json={"emails": emails})
+    assert response.status_code == 200, "Should return a valid response code, 200"
+
+    records = response.json()["records"]
+    assert [r["email"] for r in records] == emails, "Should keep input order"
+    assert records[0]["normalized"] == "anjum@sahl.solutions"
+    assert not records[2]["is_valid"], "Should return syntax error inline"
+    mocked.assert_called_once_with("sahl.solutions")
+
+
+@patch.object(domain_resolver, "check", return_value={"deliverable": True, "detail": None})
+def test_post_validate_email_batch_stream(mocked):
+    emails = ["anjum@sahl.solutions", "not-an-email"]
+    response = client.post("/validate-email/batch", params={"stream": True}, json={"emails": emails})
+    assert response.status_code == 200, "Should return a valid response code, 200"
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert len(response.text.splitlines()) == 2, "Should return one line per email"
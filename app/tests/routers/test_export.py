@@ -0,0 +1,139 @@
+import asyncio
+import json
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, patch
+from db.indexes import CityIndex, connection
+from main import fastapi_application
+from routers import export
+
+client = TestClient(fastapi_application)
+
+
+def row(i):
+    return ["__key", f"cities:v3:city:{i}:state:4026:country:101", "name", f"City {i}", "country_code", "IN"]
+
+
+# Two cursor reads, FT.AGGREGATE returns [[total, rows...], cursor id], cursor id 0 when done
+replies = [[[3, row(1), row(2)], 42], [[3, row(3)], 0]]
+
+
+def test_export_ndjson():
+    command = AsyncMock(side_effect=replies)
+    with patch.object(connection, "execute_command", command):
+        response = client.get("/places/export", params={"country_code": "IN", "fields": ["name", "country_code"]})
+    assert response.status_code == 200, "Should return a valid response code, 200"
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[2] == {"id": "city:3:state:4026:country:101", "name": "City 3", "country_code": "IN"}
+    aggregate = command.call_args_list[0].args
+    assert aggregate[:3] == ("FT.AGGREGATE", "cities", "@country_code:{IN}")
+    assert "WITHCURSOR" in aggregate
+    assert command.call_args_list[1].args[:4] == ("FT.CURSOR", "READ", "cities", 42)
+
+
+def test_export_csv_gzip():
+    with patch.object(connection, "execute_command", AsyncMock(side_effect=replies)):
+        response = client.get(
+            "/places/export",
+            params={"format": "csv", "fields": ["name"]},
+            headers={"Accept-Encoding": "gzip"},
+        )
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.text.splitlines() == [
+        "id,name",
+        "city:1:state:4026:country:101,City 1",
+        "city:2:state:4026:country:101,City 2",
+        "city:3:state:4026:country:101,City 3",
+    ]
+
+
+def test_export_422():
+    response = client.get("/places/export", params={"country_code": "IND"})
+    assert response.status_code == 422, "Should return 422 for invalid country code"
+
+
+def test_export_deletes_cursor_when_stopped_early():
+    command = AsyncMock(side_effect=replies[:1] + [1])
+
+    async def run():
+        batches = CityIndex().export({"country_code": "IN"}, ["name"])
+        first = await batches.__anext__()
+        await batches.aclose()
+        await asyncio.sleep(0)
+        return first
+
+    with patch.object(connection, "execute_command", command):
+        first = asyncio.run(run())
+    assert len(first) == 2
+    assert command.call_args.args == ("FT.CURSOR", "DEL", "cities", 42), "Cursor should be deleted in redis"
+
+
+async def send_response(response, disconnect=False):
+    """
+    Runs response as the server would, disconnect makes the client leave before the body is sent
+    """
+    sent = []
+
+    async def receive():
+        if not disconnect:
+            await asyncio.Event().wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if disconnect:
+            await asyncio.Event().wait()
+        sent.append(message)
+
+    await response({"type": "http"}, receive, send)
+    return sent
+
+
+def test_export_429():
+    async def run():
+        gate = asyncio.Event()
+
+        async def execute_command(*args):
+            await gate.wait()
+            return replies[1]
+
+        with patch.object(connection, "execute_command", side_effect=execute_command):
+            requests = [
+                export.export_places(None, None, export.ExportFormat.ndjson, None, None)
+                for _ in range(export.export_max_concurrent + 1)
+            ]
+            pending = asyncio.gather(*requests, return_exceptions=True)
+            await asyncio.sleep(0)
+            gate.set()
+            results = await pending
+            for response in results[:-1]:
+                await send_response(response)
+        return results
+
+    results = asyncio.run(run())
+    assert isinstance(results[-1], HTTPException) and results[-1].status_code == 429, "Should reject exports over the cap"
+    assert all(r.status_code == 200 for r in results[:-1])
+    assert export.active_exports == 0, "Finished exports should release their slots"
+
+
+def test_export_empty_csv():
+    with patch.object(connection, "execute_command", AsyncMock(return_value=[[0], 0])):
+        response = client.get("/places/export", params={"format": "csv", "fields": ["name"]})
+    assert response.status_code == 200, "Should return a valid response code, 200"
+    assert response.text.splitlines() == ["id,name"]
+    assert export.active_exports == 0
+
+
+def test_export_releases_slot_on_early_disconnect():
+    command = AsyncMock(side_effect=replies[:1] + [1])
+
+    async def run():
+        response = await export.export_places(None, None, export.ExportFormat.ndjson, None, None)
+        assert export.active_exports == 1
+        await send_response(response, disconnect=True)
+        await asyncio.sleep(0)
+
+    with patch.object(connection, "execute_command", command):
+        asyncio.run(run())
+    assert export.active_exports == 0, "Client leaving before the body starts should release the slot"
+    assert command.call_args.args == ("FT.CURSOR", "DEL", "cities", 42), "Cursor should be deleted in redis"
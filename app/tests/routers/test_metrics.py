@@ -0,0 +1,36 @@
+import pytest
+from fastapi.testclient import TestClient
+from cache import TTLCache
+from metrics import stage
+from main import fastapi_application
+
+pytest.importorskip("prometheus_client")
+
+client = TestClient(fastapi_application)
+
+
+def test_get_metrics():
+    client.get("/validate-phone-numbers", params={"phone_number": "+91 98765 43210"})
+    client.get("/no-such-route")
+    response = client.get("/metrics")
+    assert response.status_code == 200, "Should return a valid response code, 200"
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'route="/validate-phone-numbers",status="200"' in body, "Should record route template and status"
+    assert 'route="unmatched",status="404"' in body, "Unknown paths should not create a series each"
+    assert 'stage_duration_seconds_count{stage="phone.parse"}' in body
+
+
+def test_metrics_stage_and_cache_counters():
+    with stage("test.stage"):
+        pass
+    c = TTLCache(maxsize=2, name="test_cache")
+    c.set("a", 1, ttl=60)
+    c.get("a")
+    c.get("b")
+    c.set("c", 1, ttl=-1)
+    body = client.get("/metrics").text
+    assert 'stage_duration_seconds_count{stage="test.stage"} 1.0' in body
+    assert 'cache_lookups_total{cache="test_cache",result="hit"} 1.0' in body
+    assert 'cache_lookups_total{cache="test_cache",result="miss"} 1.0' in body
+    assert c.info()["hits"] == 1 and c.info()["misses"] == 1
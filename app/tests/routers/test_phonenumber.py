@@ -6,7 +6,9 @@ valid_number_result = {
 }
 
 from fastapi.testclient import TestClient
+from unittest.mock import patch
 from main import fastapi_application
+from routers.phonenumber import country_directory, warm_up, warmed_regions
 
 client = TestClient(fastapi_application)
 
@@ -22,3 +24,58 @@ def test_get_validate_phone_number_422():
     response = client.get("/validate-phone-numbers", params={"phone_number": "1234567899"})
     assert response.status_code == 422, "Should return 422 for missing email input"
 
+
+
+def test_post_validate_phone_numbers_batch():
+    numbers = [
+        {"phone_number": "2345678999", "country_code": "US"},
+        {"phone_number": "1234567899"},
+        {"phone_number": "+12345678999"},
+    ]
+    response = client.post("/validate-phone-numbers/batch", json={"numbers": numbers})
+    assert response.status_code == 200, "Should return a valid response code, 200"
+
+    records = response.json()["records"]
+    assert [r["phone_number"] for r in records] == [n["phone_number"] for n in numbers], "Should keep input order"
+    assert records[0]["e164_format"] == "+12345678999"
+    assert records[1]["detail"], "Should return parse error inline"
+    assert records[2]["e164_format"] == "+12345678999"
+
+
+def test_post_validate_phone_numbers_batch_422():
+    response = client.post("/validate-phone-numbers/batch", json={})
+    assert response.status_code == 422, "Should return 422 for missing numbers"
+
+
+def test_get_phone_cache_info():
+    client.get("/validate-phone-numbers", params={"phone_number": "9876543210", "country_code":"IN"})
+    before = client.get("/validate-phone-numbers/cache-info").json()
+    client.get("/validate-phone-numbers", params={"phone_number": "9876543210", "country_code":"in"})
+    after = client.get("/validate-phone-numbers/cache-info").json()
+    assert after["hits"] == before["hits"] + 1, "Repeated number should be served from cache"
+
+
+def test_get_validate_phone_number_enriched():
+    india = {"id": "country:101", "name": "India", "iso2": "IN"}
+    timezone = {"id": "1", "zone_name": "Asia/Kolkata", "country_id": "101"}
+    with patch.multiple(country_directory, revision="1:1", by_iso2={"IN": india}, timezones={"IN": [timezone]}):
+        response = client.get(
+            "/validate-phone-numbers", params={"phone_number": "+91 98765 43210", "enrich": True}
+        )
+        plain = client.get("/validate-phone-numbers", params={"phone_number": "+91 98765 43210"})
+
+    assert response.status_code == 200, "Should return a valid response code, 200"
+    result = response.json()
+    assert result["region_code"] == "IN"
+    assert result["country"]["name"] == "India"
+    assert [z["zone_name"] for z in result["timezones"]] == ["Asia/Kolkata"]
+    assert "carrier" not in result and "location" not in result, "phonenumberslite has no carrier or geocoder data"
+    assert "country" not in plain.json(), "Should keep plain and enriched results apart in cache"
+
+
+def test_warm_up():
+    report = warm_up("IN,XX", "IN")
+    assert "IN" in warmed_regions
+    assert report["hot_regions"] == 1
+    assert report["unknown"] == ["XX"], "Should report regions phonenumbers does not know"
+    assert warm_up("IN", "")["regions"] == 0, "Should skip regions warmed before"
@@ -1,6 +1,11 @@
+import asyncio
 from fastapi.testclient import TestClient
-from unittest.mock import patch
+from cache import LRUCache
+from unittest.mock import AsyncMock, patch
+from db.indexes import connection
+from db.memory import MemoryIndex
 from models.models import Country
+from routers import places
 from routers.places import CountryIndex, TimeZoneIndex, CityIndex
 from main import fastapi_application
 
@@ -192,3 +197,145 @@ def test_get_places(mocked):
 def test_get_places_422():
     response = client.get("/place-lookup", params={"query": "bengaluru"})
     assert response.status_code == 422, "Should return 422 for missing query parameters"
+
+
+get_suggest_result = {
+    "total": 1,
+    "records": [
+        {
+            "id": "city:57933:state:4026:country:101",
+            "name": "Bengaluru, Karnataka, India",
+            "score": 0.4,
+        }
+    ],
+}
+
+
+@patch.object(CityIndex, "suggest", return_value=get_suggest_result, spec=True)
+def test_get_place_suggest(mocked):
+    response = client.get("/place-suggest", params={"query": "beng", "limit": 5})
+    assert response.status_code == 200, "Should return a valid response code, 200"
+    assert response.json() == get_suggest_result
+    assert mocked.call_args.kwargs == {"fuzzy": False, "limit": 5}
+
+
+def test_get_place_suggest_422():
+    response = client.get("/place-suggest", params={"query": "beng", "limit": 500})
+    assert response.status_code == 422, "Should return 422 for limit out of range"
+
+
+@patch.object(CityIndex, "search", spec=True)
+def test_get_places_projection(mocked):
+    mocked.return_value = {
+        "total": "1",
+        "duration": "1.2",
+        "records": [{"id": "city:57933:state:4026:country:101", "name": "Bengaluru"}],
+    }
+    response = client.get(
+        "/place-lookup",
+        params={
+            "query": "bengaluru",
+            "query_type": "exact",
+            "search_fields": "name",
+            "offset": 20,
+            "limit": 5,
+            "sort_by": "name",
+            "return_fields": ["name"],
+        },
+    )
+    assert response.status_code == 200, "Should return a valid response code, 200"
+    assert response.json()["records"] == mocked.return_value["records"], "Should only return projected fields"
+    assert mocked.call_args.kwargs == {
+        "fields": ["name"],
+        "offset": 20,
+        "limit": 5,
+        "sort_by": "name",
+        "sort_asc": True,
+        "return_fields": ["name"],
+    }
+
+
+def test_get_places_unknown_field_422():
+    response = client.get(
+        "/place-lookup",
+        params={"query": "bengaluru", "query_type": "exact", "sort_by": "latitude"},
+    )
+    assert response.status_code == 422, "Should return 422 for field that is not sortable"
+
+
+get_nearby_result = {
+    "total": 1,
+    "records": [
+        {
+            "id": "city:57933:state:4026:country:101",
+            "name": "Bengaluru",
+            "latitude": "12.97194000",
+            "longitude": "77.59369000",
+            "distance_km": 0.412,
+        }
+    ],
+}
+
+
+@patch.object(CityIndex, "nearby", return_value=get_nearby_result, spec=True)
+def test_get_place_nearby(mocked):
+    response = client.get(
+        "/place-nearby", params={"latitude": 12.97, "longitude": 77.59, "radius_km": 10, "limit": 1}
+    )
+    assert response.status_code == 200, "Should return a valid response code, 200"
+    assert response.json()["records"][0]["distance_km"] == 0.412
+    assert mocked.call_args.args == (12.97, 77.59, 10)
+    assert mocked.call_args.kwargs == {"limit": 1}
+
+
+def test_get_place_nearby_422():
+    response = client.get(
+        "/place-nearby", params={"latitude": 12.97, "longitude": 77.59, "radius_km": 100000}
+    )
+    assert response.status_code == 422, "Should return 422 for radius above the cap"
+    response = client.get("/place-nearby", params={"latitude": 89.9, "longitude": 77.59})
+    assert response.status_code == 422, "Should return 422 for latitude out of geo index range"
+
+
+def test_get_country_lookup_memory_engine():
+    engine = MemoryIndex(CountryIndex()).load([("country:101", {"id": "101", "name": "India", "iso2": "IN"})])
+    with patch.dict(places.memory_engines, {"countries": engine}):
+        response = client.get("/country-lookup", params={"query": "in", "query_type": "exact"})
+    assert response.status_code == 200, "Should return a valid response code, 200"
+    record = response.json()["records"][0]
+    assert (record["id"], record["name"], record["iso2"]) == ("country:101", "India", "IN")
+
+
+def test_refresh_memory_indexes():
+    india = [1, "countries:v1:country:101", ["id", "101", "name", "India", "iso2", "IN"]]
+    germany = [1, "countries:v2:country:82", ["id", "82", "name", "Germany", "iso2", "DE"]]
+    command = AsyncMock(side_effect=[india, germany])
+    with patch.object(places, "memory_indexes", ["countries"]), \
+            patch.dict(places.memory_engines, clear=True), \
+            patch.dict(places.memory_revisions, clear=True), \
+            patch.object(connection, "hget", AsyncMock(return_value="1")), \
+            patch.object(connection, "execute_command", command):
+        assert asyncio.run(places.refresh_memory_indexes()) == ["countries"], "Should build missing engines from redis"
+        assert asyncio.run(places.refresh_memory_indexes()) == [], "Should not rebuild at the same revision"
+        with patch.object(connection, "hget", AsyncMock(return_value="2")):
+            assert asyncio.run(places.refresh_memory_indexes()) == ["countries"]
+        r = asyncio.run(places.memory_engines["countries"].search("de", "exact"))
+        assert places.memory_revisions["countries"] == "2"
+    assert [record["id"] for record in r["records"]] == ["country:82"], "Should be rebuilt from redis"
+
+
+@patch.object(CityIndex, "search", return_value=get_place_result, spec=True)
+def test_get_places_response_cache(mocked):
+    params = {"query": "Bengaluru", "query_type": "exact"}
+    with patch.object(places.response_cache, "revision", return_value="3"), \
+            patch.object(places.response_cache, "cache", LRUCache(10)):
+        first = client.get("/place-lookup", params=params)
+        second = client.get("/place-lookup", params=params | {"query": "bengaluru "})
+        etag = first.headers["etag"]
+        not_modified = client.get("/place-lookup", params=params, headers={"If-None-Match": etag})
+
+    assert first.status_code == second.status_code == 200
+    assert first.json() == second.json(), "Normalized query should be served from cache"
+    assert mocked.call_count == 1, "Should search only once"
+    assert "max-age" in first.headers["cache-control"]
+    assert not_modified.status_code == 304, "Should return 304 when ETag matches"
@@ -0,0 +1,62 @@
+import json
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+from models import CitySearch, CountrySearch, FastSerializer, NearbyCities, PlaceSuggestions, TimeZoneSearch
+from routers import places
+from routers.places import CityIndex, serialize
+from main import fastapi_application
+
+client = TestClient(fastapi_application)
+
+city = {
+    "id": "city:57933:state:4026:country:101",
+    "name": "Bengaluru",
+    "state_id": "4026",
+    "state_code": "KA",
+    "state_name": "Karnataka",
+    "country_id": "101",
+    "country_code": "IN",
+    "country_name": "India",
+    "latitude": "12.97194000",
+    "longitude": "77.59369000",
+}
+
+# Samples as returned by indexes: numbers as strings, missing and None fields, fields of other models
+samples = [
+    (CitySearch, {"total": 2, "duration": 1.25, "records": [city, {"id": "city:1", "name": None, "extra": "x"}]}),
+    (CountrySearch, {"total": 1, "duration": 0.5, "records": [{"id": "country:101", "name": "भारत", "emoji": "🇮🇳"}]}),
+    (TimeZoneSearch, {"total": "1", "duration": "2", "records": [{"zone_name": "Asia/Kolkata", "country_id": "101"}]}),
+    (NearbyCities, {"total": 1, "records": [city | {"distance_km": "0.412"}]}),
+    (PlaceSuggestions, {"total": 1, "records": [{"id": None, "name": "Bengaluru, Karnataka, India", "score": 1}]}),
+]
+
+
+@pytest.mark.parametrize("model, data", samples)
+@pytest.mark.parametrize("exclude_unset", [True, False])
+def test_fast_serializer_matches_model(model, data, exclude_unset):
+    expected = json.loads(model(**data).json(exclude_unset=exclude_unset))
+    assert json.loads(FastSerializer(model, exclude_unset).dumps(data)) == expected
+
+
+@pytest.mark.parametrize("model, data", samples)
+def test_fast_serializer_keeps_field_order(model, data):
+    expected = list(json.loads(model(**data).json(exclude_unset=True))["records"][0])
+    assert list(json.loads(FastSerializer(model).dumps(data))["records"][0]) == expected
+
+
+def test_serialize_fast_path():
+    with patch.object(places, "fast_serialization", True):
+        assert json.loads(serialize(CitySearch, samples[0][1])) == json.loads(
+            CitySearch(**samples[0][1]).json(exclude_unset=True)
+        )
+
+
+@patch.object(CityIndex, "nearby", return_value=samples[3][1], spec=True)
+def test_get_place_nearby_fast_serialization(mocked):
+    response = client.get("/place-nearby", params={"latitude": 12.97, "longitude": 77.59})
+    with patch.object(places, "fast_serialization", True):
+        fast = client.get("/place-nearby", params={"latitude": 12.97, "longitude": 77.59})
+    assert fast.status_code == 200, "Should return a valid response code, 200"
+    assert fast.json() == response.json(), "Fast path should return the same response"
+    assert fast.json()["records"][0]["distance_km"] == 0.412
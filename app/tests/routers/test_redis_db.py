@@ -1,6 +1,7 @@
 from fastapi.testclient import TestClient
 from redis.exceptions import ConnectionError
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
+from db.connection import redis_manager
 from routers.redis_db import build_db_info
 from main import fastapi_application
 
@@ -43,3 +44,18 @@ def test_get_redis_db_connection_error(mocked):
     mocked.side_effect = ConnectionError
     response = client.get("/redis-db-info")
     assert response.status_code == 500, "Should return 500 for redis connection error"
+
+
+def test_get_redis_pool_info():
+    response = client.get("/redis-pool-info")
+    assert response.status_code == 200, "Should return a valid response code, 200"
+    assert response.json()["max_connections"] > 0
+
+
+def test_get_redis_pool_info_raw():
+    raw_client = MagicMock()
+    raw_client.connection_pool.info.return_value = {"max_connections": 50, "created": 2, "in_use": 1}
+    with patch.object(redis_manager, "_raw_client", raw_client):
+        response = client.get("/redis-pool-info")
+    assert response.status_code == 200, "Should return a valid response code, 200"
+    assert response.json()["raw"]["created"] == 2, "Should report the pool of raw replies"